@@ -0,0 +1,258 @@
+# /src/backend/api/handlers.py
+# Chứa các hàm xử lý request cho API JSON (/api/v1/...), dùng cho máy quét mã vạch,
+# đồng bộ ERP, ... thay vì phải đọc trang HTML hoặc gửi form từng SKU một.
+# Các hàm này dùng lại lớp database/logic của từng chức năng và trả về JSON.
+
+import datetime
+import json
+import os
+from urllib.parse import urlencode
+from ..product import database as db_product
+from ..transaction import database as db_transaction
+from ..transaction import logic as logic_transaction
+from ..report import database as db_report
+from ..report import logic as logic_report
+from ..common import multipart
+from ..common.pagination import PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX, decode_cursor
+from ..common.chart_service import chart_service
+from ..product.cache import product_cache
+
+API_PREFIX = '/api/v1'
+# Kích thước trang mặc định / tối đa cho các danh sách.
+API_DEFAULT_LIMIT = PAGE_SIZE_DEFAULT
+API_MAX_LIMIT = PAGE_SIZE_MAX
+# Khoảng thời gian mặc định (ngày) của dữ liệu báo cáo khi không truyền start_date/end_date.
+API_DEFAULT_REPORT_DAYS = 30
+# Các cột công khai của sản phẩm trong phản hồi JSON.
+PRODUCT_FIELDS = ('id', 'sku', 'name', 'description', 'unit_of_measure', 'current_stock', 'price', 'updated_at')
+
+class ApiError(Exception):
+    """Lỗi của request API, được trả về client dạng {"error": ...} với mã HTTP tương ứng."""
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+def _json_default(value):
+    """Chuyển các kiểu dữ liệu không có sẵn trong JSON (datetime, date) thành chuỗi ISO 8601."""
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"Không thể chuyển kiểu {type(value).__name__} sang JSON.")
+
+def send_json(handler, data, status_code=200):
+    """Gửi phản hồi JSON (UTF-8) về client."""
+    body = json.dumps(data, ensure_ascii=False, default=_json_default).encode('utf-8')
+    handler._send_response_bytes(body, 'application/json; charset=utf-8', status_code,
+                                 headers={'Cache-Control': 'no-store'})
+
+def api_endpoint(func):
+    """Decorator: bắt `ApiError` trong hàm xử lý và trả về lỗi dạng JSON."""
+    def wrapper(handler, data, **params):
+        try:
+            return func(handler, data, **params)
+        except ApiError as e:
+            send_json(handler, {'error': e.message}, e.status_code)
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+# --- Đọc và xác thực tham số ---
+
+def _query_value(query_params, key, default=''):
+    return query_params.get(key, [default])[0]
+
+def _int_param(query_params, key, default, minimum=0, maximum=None):
+    raw_value = _query_value(query_params, key, '')
+    if raw_value == '':
+        return default
+    try:
+        value = int(raw_value)
+    except ValueError:
+        raise ApiError(400, f"Tham số '{key}' phải là số nguyên.")
+    if value < minimum or (maximum is not None and value > maximum):
+        limit_text = f"từ {minimum} đến {maximum}" if maximum is not None else f">= {minimum}"
+        raise ApiError(400, f"Tham số '{key}' phải {limit_text}.")
+    return value
+
+def _pagination(query_params):
+    """
+    Đọc limit và con trỏ after/before từ query string.
+    Khác với trang HTML (con trỏ hỏng thì quay về trang đầu), API báo lỗi 400 để client biết con trỏ sai.
+    """
+    limit = _int_param(query_params, 'limit', API_DEFAULT_LIMIT, minimum=1, maximum=API_MAX_LIMIT)
+    cursors = []
+    for key in ('after', 'before'):
+        token = _query_value(query_params, key)
+        if token and decode_cursor(token) is None:
+            raise ApiError(400, f"Tham số '{key}' không phải là con trỏ hợp lệ.")
+        cursors.append(token)
+    return limit, cursors[0], cursors[1]
+
+def _page_response(path, query_params, page, limit):
+    """Tạo phản hồi cho một trang dữ liệu, kèm đường dẫn tới trang sau / trang trước (nếu có)."""
+    params = {key: values[0] for key, values in query_params.items() if key not in ('after', 'before')}
+    params['limit'] = limit
+
+    def page_url(cursor_param, cursor):
+        return f"{path}?{urlencode(dict(params, **{cursor_param: cursor}))}" if cursor else None
+
+    return {'items': page['items'], 'limit': limit,
+            'next': page_url('after', page['next']), 'prev': page_url('before', page['prev'])}
+
+def _date_range(query_params):
+    """Đọc start_date/end_date ('YYYY-MM-DD'); mặc định là API_DEFAULT_REPORT_DAYS ngày gần nhất."""
+    today = datetime.date.today()
+    dates = []
+    for key, default in (('start_date', today - datetime.timedelta(days=API_DEFAULT_REPORT_DAYS)), ('end_date', today)):
+        raw_value = _query_value(query_params, key)
+        if not raw_value:
+            dates.append(default)
+            continue
+        try:
+            dates.append(datetime.date.fromisoformat(raw_value))
+        except ValueError:
+            raise ApiError(400, f"Tham số '{key}' phải có dạng YYYY-MM-DD.")
+    if dates[0] > dates[1]:
+        raise ApiError(400, "start_date phải nhỏ hơn hoặc bằng end_date.")
+    return dates[0].isoformat(), dates[1].isoformat()
+
+def _group_by(query_params):
+    group_by = _query_value(query_params, 'group_by', 'day')
+    if group_by not in ('day', 'month'):
+        raise ApiError(400, "Tham số 'group_by' phải là 'day' hoặc 'month'.")
+    return group_by
+
+def _product_json(product):
+    return {field: product.get(field) for field in PRODUCT_FIELDS}
+
+# --- Sản phẩm ---
+
+@api_endpoint
+def handle_list_products(handler, query_params):
+    """
+    GET /api/v1/products?limit=&after=&before=&sort=&order=&q= : danh sách sản phẩm theo trang (con trỏ).
+    Có q thì mặc định xếp theo mức độ phù hợp (sort=relevance).
+    """
+    limit, after, before = _pagination(query_params)
+    search_term = _query_value(query_params, 'q').strip()
+    sort_by = _query_value(query_params, 'sort', db_product.SORT_BY_RELEVANCE if search_term else 'name')
+    if sort_by not in db_product.PRODUCT_PAGE_SORT_COLUMNS and not (search_term and sort_by == db_product.SORT_BY_RELEVANCE):
+        raise ApiError(400, f"Không thể sắp xếp theo '{sort_by}'.")
+    order = _query_value(query_params, 'order', 'asc')
+    page = db_product.db_get_products_keyset(sort_by, order, search_term or None, limit, after, before)
+    page['items'] = [_product_json(p) for p in page['items']]
+    send_json(handler, _page_response(f"{API_PREFIX}/products", query_params, page, limit))
+
+@api_endpoint
+def handle_get_product(handler, query_params, product_id):
+    """GET /api/v1/products/<id> : thông tin một sản phẩm."""
+    product = db_product.db_get_product_by_id(product_id)
+    if not product:
+        raise ApiError(404, f"Không tìm thấy sản phẩm ID {product_id}.")
+    send_json(handler, _product_json(product))
+
+@api_endpoint
+def handle_get_product_by_sku(handler, query_params, sku):
+    """GET /api/v1/products/sku/<sku> : tra cứu sản phẩm theo SKU (dùng cho máy quét mã vạch)."""
+    product = db_product.db_get_product_by_sku(sku)
+    if not product:
+        raise ApiError(404, f"Không tìm thấy sản phẩm với SKU '{sku}'.")
+    send_json(handler, _product_json(product))
+
+# --- Giao dịch ---
+
+@api_endpoint
+def handle_list_transactions(handler, query_params):
+    """GET /api/v1/transactions?start_date=&end_date=&sku=&limit=&after=&before= : lịch sử giao dịch theo trang (con trỏ)."""
+    limit, after, before = _pagination(query_params)
+    # Không truyền ngày nghĩa là không giới hạn thời gian (khác với dữ liệu báo cáo).
+    start_date = _query_value(query_params, 'start_date')
+    end_date = _query_value(query_params, 'end_date')
+    if start_date or end_date:
+        start_date, end_date = _date_range(query_params)
+    sku = _query_value(query_params, 'sku').strip() or None
+    page = db_transaction.db_get_transactions_keyset(start_date, end_date, limit, after, before, sku)
+    send_json(handler, _page_response(f"{API_PREFIX}/transactions", query_params, page, limit))
+
+@api_endpoint
+def handle_post_stock_movements(handler, fields):
+    """
+    POST /api/v1/stock/movements : nhập/xuất kho hàng loạt trong MỘT transaction.
+    Body JSON: {"movements": [{"sku": ..., "qty": ..., "type": "IN"|"OUT", "note": ..., "unit_price": ...}], "user": ...}
+    (hoặc trực tiếp một mảng các dòng). Một dòng lỗi thì không dòng nào được ghi (mã 422).
+    """
+    raw_body = fields.get(multipart.RAW_BODY_FIELD, [b''])[0]
+    if not raw_body:
+        raise ApiError(400, "Request phải có body JSON (Content-Type: application/json).")
+    try:
+        payload = json.loads(raw_body.decode('utf-8'))
+    except (UnicodeDecodeError, ValueError) as e:
+        raise ApiError(400, f"Body JSON không hợp lệ: {e}")
+
+    user = "api"
+    if isinstance(payload, dict):
+        user = str(payload.get('user') or user)[:50]
+        payload = payload.get('movements')
+    success, results = logic_transaction.xu_ly_bien_dong_kho_hang_loat(payload, user=user)
+    applied = len(results) if success else 0
+    send_json(handler, {'ok': success, 'applied': applied, 'results': results}, 200 if success else 422)
+
+# --- Báo cáo ---
+
+@api_endpoint
+def handle_report_dashboard(handler, query_params):
+    """GET /api/v1/reports/dashboard : các chỉ số tổng quan của trang chủ."""
+    send_json(handler, db_report.db_get_dashboard_stats())
+
+@api_endpoint
+def handle_report_low_stock(handler, query_params):
+    """GET /api/v1/reports/low_stock?threshold= : sản phẩm có tồn kho <= ngưỡng."""
+    threshold = _int_param(query_params, 'threshold', 10)
+    products, _ = logic_report.liet_ke_san_pham_sap_het_hang(str(threshold))
+    send_json(handler, {'threshold': threshold, 'items': [_product_json(p) for p in products]})
+
+@api_endpoint
+def handle_report_revenue(handler, query_params):
+    """GET /api/v1/reports/revenue?start_date=&end_date=&group_by=day|month : doanh thu theo thời gian."""
+    start_date, end_date = _date_range(query_params)
+    group_by = _group_by(query_params)
+    series = db_report.db_get_revenue_data(start_date, end_date, group_by)
+    send_json(handler, {'start_date': start_date, 'end_date': end_date, 'group_by': group_by, 'series': series})
+
+@api_endpoint
+def handle_report_product_flow(handler, query_params):
+    """GET /api/v1/reports/product_flow?sku=&start_date=&end_date=&group_by= : nhập/xuất của một sản phẩm."""
+    sku = _query_value(query_params, 'sku').strip()
+    if not sku:
+        raise ApiError(400, "Thiếu tham số 'sku'.")
+    product = db_product.db_get_product_by_sku(sku)
+    if not product:
+        raise ApiError(404, f"Không tìm thấy sản phẩm với SKU '{sku}'.")
+    start_date, end_date = _date_range(query_params)
+    group_by = _group_by(query_params)
+
+    # Gộp các dòng (kỳ, loại, số lượng) thành một điểm dữ liệu cho mỗi kỳ.
+    series = {}
+    for row in db_report.db_get_product_flow_data(product['id'], start_date, end_date, group_by):
+        point = series.setdefault(row['period'], {'period': row['period'], 'in_qty': 0, 'out_qty': 0})
+        point['in_qty' if row['transaction_type'] == 'IN' else 'out_qty'] += row['total_quantity']
+    send_json(handler, {'sku': sku, 'start_date': start_date, 'end_date': end_date, 'group_by': group_by,
+                        'series': list(series.values())})
+
+@api_endpoint
+def handle_report_revenue_by_product(handler, query_params):
+    """GET /api/v1/reports/revenue_by_product?start_date=&end_date=&limit= : doanh thu theo sản phẩm."""
+    start_date, end_date = _date_range(query_params)
+    limit = _int_param(query_params, 'limit', API_DEFAULT_LIMIT, minimum=1, maximum=API_MAX_LIMIT)
+    items = db_report.db_get_revenue_by_product(start_date, end_date)
+    send_json(handler, {'start_date': start_date, 'end_date': end_date, 'total': len(items), 'items': items[:limit]})
+
+# --- Hệ thống ---
+
+@api_endpoint
+def handle_cache_stats(handler, query_params):
+    """
+    GET /api/v1/stats/cache : thống kê các cache trong bộ nhớ của tiến trình đang xử lý request
+    (ở chế độ prefork, mỗi worker có cache và số liệu riêng; xem 'pid').
+    """
+    send_json(handler, {'pid': os.getpid(), 'product_cache': product_cache.stats(), 'chart_cache': chart_service.stats()})
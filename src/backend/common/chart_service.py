@@ -0,0 +1,214 @@
+# /src/backend/common/chart_service.py
+# File này chứa dịch vụ vẽ biểu đồ chạy NGOÀI luồng xử lý request:
+#   - Việc vẽ bằng matplotlib (nặng CPU và giữ GIL) được gửi sang một pool tiến trình,
+#     nên nhiều biểu đồ có thể được vẽ song song trên nhiều lõi CPU và luồng web
+#     không bị chặn bởi GIL. Bộ vẽ SVG thuần Python chỉ mất vài ms nên được gọi trực tiếp.
+#   - Mỗi lần vẽ có giới hạn thời gian; tiến trình bị treo sẽ bị dừng và pool được tạo lại.
+#   - Kết quả (ảnh PNG/SVG) được lưu trong cache LRU có giới hạn, với khóa gồm loại biểu đồ,
+#     tham số lọc và phiên bản dữ liệu. Khi dữ liệu thay đổi, phiên bản tăng nên cache cũ
+#     tự động không còn được dùng.
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from . import chart_utils
+# `multiprocessing` và `concurrent.futures` chỉ được import khi thực sự cần pool tiến trình
+# (bộ vẽ matplotlib), để không làm chậm lúc khởi động server.
+
+# --- Cấu hình dịch vụ biểu đồ ---
+# Số tiến trình vẽ biểu đồ (0 = vẽ trực tiếp trong tiến trình web, không dùng pool).
+CHART_POOL_WORKERS = min(4, os.cpu_count() or 1)
+CHART_RENDER_TIMEOUT = 20.0  # Số giây tối đa cho một lần vẽ.
+CHART_CACHE_SIZE = 64        # Số ảnh biểu đồ tối đa giữ trong cache.
+
+def _render_in_worker(render_kwargs):
+    """Hàm chạy trong tiến trình con của pool: vẽ biểu đồ và trả về (bytes_ảnh, lỗi)."""
+    return chart_utils.render_chart_image(**render_kwargs)
+
+def _preload_in_worker(backend):
+    """Hàm chạy trong tiến trình con của pool: nạp trước bộ vẽ (warm-up)."""
+    return chart_utils.preload_chart_backend(backend)
+
+def make_etag(chart_kind, params, data_version, image_format='png'):
+    """
+    Tạo ETag cho một ảnh biểu đồ từ loại biểu đồ, tham số, phiên bản dữ liệu, định dạng
+    và bộ vẽ. Không cần vẽ (hay truy vấn dữ liệu) để biết ảnh của client còn mới hay không.
+    """
+    key = (chart_kind, params, data_version, image_format, chart_utils.CHART_BACKEND)
+    digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+    return f'"{digest[:24]}"'
+
+class ChartService:
+    """
+    Dịch vụ vẽ biểu đồ dùng pool tiến trình và cache LRU.
+
+    Ví dụ:
+        png, err = chart_service.render_image('revenue_by_time', ('day', '2025-01-01', '2025-01-31'),
+                                            data_version, {'dates': ..., 'values': ..., ...})
+    """
+
+    def __init__(self, workers=CHART_POOL_WORKERS, timeout=CHART_RENDER_TIMEOUT, cache_size=CHART_CACHE_SIZE):
+        self.workers = workers
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self._reset_state()
+
+    def _reset_state(self):
+        """Khởi tạo (lại) trạng thái cho tiến trình hiện tại (pool tiến trình không dùng chung qua fork)."""
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._cache = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def _ensure_process(self):
+        if self._pid != os.getpid():
+            self._reset_state()
+
+    def _get_executor(self):
+        """Tạo pool tiến trình khi cần. Dùng 'spawn' để tiến trình con không thừa kế luồng/khóa của server."""
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _discard_executor(self, executor):
+        """Bỏ một pool bị hỏng hoặc có tiến trình bị treo (dừng hẳn các tiến trình con)."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        # ProcessPoolExecutor không có API dừng một tiến trình đang chạy, nên dừng tất cả.
+        for process in list(getattr(executor, '_processes', {}).values()):
+            try:
+                process.terminate()
+            except Exception:
+                pass
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _cache_get(self, key):
+        with self._lock:
+            image_bytes = self._cache.get(key)
+            if image_bytes is None:
+                self._misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self._hits += 1
+            return image_bytes
+
+    def _cache_put(self, key, image_bytes):
+        with self._lock:
+            self._cache[key] = image_bytes
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def render_image(self, chart_kind, params, data_version, render_kwargs, image_format=None):
+        """
+        Lấy ảnh của một biểu đồ: trả ngay từ cache nếu có, nếu không thì vẽ trong pool.
+
+        Args:
+            chart_kind (str): Loại biểu đồ (vd: 'revenue_by_time').
+            params (tuple): Các tham số lọc xác định biểu đồ (phải hashable).
+            data_version (int): Phiên bản dữ liệu hiện tại (xem `get_cache_version`).
+            render_kwargs (dict): Tham số truyền cho `chart_utils.render_chart_image`.
+            image_format (str, optional): 'png' hoặc 'svg' (mặc định theo bộ vẽ đang dùng).
+
+        Returns:
+            tuple: (bytes_ảnh, thông_báo_lỗi) - thông_báo_lỗi là None nếu thành công.
+        """
+        self._ensure_process()
+        backend = chart_utils.CHART_BACKEND
+        image_format = image_format or chart_utils.default_image_format(backend)
+        key = (chart_kind, params, data_version, image_format, backend)
+        image_bytes = self._cache_get(key)
+        if image_bytes is not None:
+            return image_bytes, None
+
+        # Truyền rõ bộ vẽ cho tiến trình con (tiến trình 'spawn' không thừa kế cấu hình đã đổi lúc chạy).
+        render_kwargs = dict(render_kwargs, image_format=image_format, backend=backend)
+        if self.workers <= 0 or backend == 'svg':
+            image_bytes, err = chart_utils.render_chart_image(**render_kwargs)
+        else:
+            image_bytes, err = self._render_in_pool(render_kwargs)
+        if image_bytes is not None:
+            self._cache_put(key, image_bytes)
+        return image_bytes, err
+
+    def render_data_uri(self, chart_kind, params, data_version, render_kwargs):
+        """Giống `render_image` nhưng trả về chuỗi data URI base64 để nhúng vào thẻ <img>."""
+        image_format = chart_utils.default_image_format()
+        image_bytes, err = self.render_image(chart_kind, params, data_version, render_kwargs, image_format)
+        if image_bytes is None:
+            return None, err
+        return chart_utils.image_to_data_uri(image_bytes, image_format), None
+
+    def _render_in_pool(self, render_kwargs):
+        """Gửi yêu cầu vẽ sang pool tiến trình và chờ kết quả có giới hạn thời gian."""
+        from concurrent.futures import TimeoutError as FutureTimeoutError
+        from concurrent.futures.process import BrokenProcessPool
+        executor = self._get_executor()
+        try:
+            future = executor.submit(_render_in_worker, render_kwargs)
+        except (BrokenProcessPool, RuntimeError):
+            self._discard_executor(executor)
+            executor = self._get_executor()
+            future = executor.submit(_render_in_worker, render_kwargs)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self._discard_executor(executor)
+            return None, f"Vẽ biểu đồ quá thời gian cho phép ({self.timeout:g} giây)."
+        except BrokenProcessPool:
+            self._discard_executor(executor)
+            return None, "Tiến trình vẽ biểu đồ bị dừng bất thường."
+        except Exception as e:
+            return None, f"Lỗi khi vẽ biểu đồ: {e}"
+
+    def warm_up(self):
+        """
+        Nạp trước bộ vẽ biểu đồ. Với matplotlib, các tiến trình của pool được tạo sẵn và
+        import thư viện ngay (mất vài giây) thay vì để request biểu đồ đầu tiên phải chờ.
+
+        Returns:
+            bool: True nếu bộ vẽ sẵn sàng.
+        """
+        self._ensure_process()
+        backend = chart_utils.CHART_BACKEND
+        if self.workers <= 0 or backend == 'svg':
+            return chart_utils.preload_chart_backend(backend)
+        if not chart_utils.chart_backend_available(backend)[0]:
+            return False
+        executor = self._get_executor()
+        futures = [executor.submit(_preload_in_worker, backend) for _ in range(self.workers)]
+        try:
+            return all(future.result(timeout=self.timeout) for future in futures)
+        except Exception:
+            return False
+
+    def clear_cache(self):
+        """Xóa toàn bộ cache biểu đồ."""
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self):
+        """Trả về thông tin thống kê đơn giản về cache và pool."""
+        with self._lock:
+            return {'cached': len(self._cache), 'cache_size': self.cache_size,
+                    'hits': self._hits, 'misses': self._misses, 'workers': self.workers}
+
+    def shutdown(self):
+        """Dừng pool tiến trình (gọi khi tắt server)."""
+        self._ensure_process()
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+# Dịch vụ dùng chung cho toàn bộ tiến trình.
+chart_service = ChartService()
@@ -1,23 +1,84 @@
 # /src/backend/common/chart_utils.py
-# File này chứa các hàm tiện ích để tạo biểu đồ bằng thư viện Matplotlib.
-# Các hàm này sẽ tạo ra hình ảnh biểu đồ và chuyển đổi nó thành chuỗi base64
-# để có thể nhúng trực tiếp vào file HTML.
+# File này chứa các hàm tiện ích để tạo biểu đồ. Có hai bộ vẽ (backend):
+#   - 'svg'       : bộ vẽ SVG viết bằng Python thuần (common/svg_charts.py), nhanh và không
+#                   cần thư viện ngoài. Mặc định.
+#   - 'matplotlib': vẽ ảnh PNG/SVG bằng thư viện Matplotlib (chỉ import khi thực sự dùng).
+# Các hàm này sẽ tạo ra hình ảnh biểu đồ và có thể chuyển đổi nó thành chuỗi base64
+# để nhúng trực tiếp vào file HTML.
 
 import datetime
+import importlib.util
 import io
 import base64
 import locale
+import os
 
-# Cố gắng import matplotlib. Nếu không thành công, đặt cờ MATPLOTLIB_AVAILABLE = False.
-# Cấu hình 'Agg' được sử dụng để matplotlib có thể chạy trên server mà không cần GUI.
-try:
-    import matplotlib
-    matplotlib.use('Agg') 
-    import matplotlib.pyplot as plt
-    import matplotlib.dates as mdates
-    MATPLOTLIB_AVAILABLE = True
-except ImportError:
-    MATPLOTLIB_AVAILABLE = False
+CHART_BACKENDS = ('svg', 'matplotlib')
+# Bộ vẽ biểu đồ; có thể ghi đè bằng biến môi trường MINIVENTORY_CHART_BACKEND hoặc tham số --chart-backend.
+CHART_BACKEND = os.environ.get('MINIVENTORY_CHART_BACKEND', 'svg')
+
+# Chỉ kiểm tra matplotlib có được cài đặt hay không, KHÔNG import (import mất vài giây và
+# hàng chục MB bộ nhớ). Thư viện được import ở lần vẽ đầu tiên bằng bộ vẽ 'matplotlib'.
+MATPLOTLIB_AVAILABLE = importlib.util.find_spec('matplotlib') is not None
+plt = None
+mdates = None
+
+# Các định dạng ảnh hỗ trợ và Content-Type tương ứng.
+IMAGE_CONTENT_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+def _load_matplotlib():
+    """Import matplotlib ở lần dùng đầu tiên. Cấu hình 'Agg' để chạy trên server không có GUI."""
+    global plt, mdates
+    if plt is None:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as pyplot
+        import matplotlib.dates as matplotlib_dates
+        plt, mdates = pyplot, matplotlib_dates
+
+def preload_chart_backend(backend=None):
+    """Nạp trước module của bộ vẽ biểu đồ (dùng cho bước warm-up), để request đầu tiên không phải chờ import."""
+    backend = backend or CHART_BACKEND
+    if not chart_backend_available(backend)[0]:
+        return False
+    if backend == 'svg':
+        from . import svg_charts # noqa: F401
+    else:
+        _load_matplotlib()
+    return True
+
+def set_chart_backend(backend):
+    """Chọn bộ vẽ biểu đồ cho tiến trình hiện tại."""
+    global CHART_BACKEND
+    if backend not in CHART_BACKENDS:
+        raise ValueError(f"Bộ vẽ biểu đồ không hợp lệ: '{backend}'. Chọn một trong {', '.join(CHART_BACKENDS)}.")
+    CHART_BACKEND = backend
+
+def chart_backend_available(backend=None):
+    """
+    Kiểm tra bộ vẽ biểu đồ có dùng được không.
+
+    Returns:
+        tuple: (bool_khả_dụng, thông_báo_lỗi)
+    """
+    backend = backend or CHART_BACKEND
+    if backend == 'svg':
+        return True, None
+    if backend == 'matplotlib' and MATPLOTLIB_AVAILABLE:
+        return True, None
+    if backend == 'matplotlib':
+        return False, "Thư viện 'matplotlib' chưa được cài đặt, chức năng biểu đồ không khả dụng."
+    return False, f"Bộ vẽ biểu đồ không hợp lệ: '{backend}'."
+
+def supports_image_format(image_format, backend=None):
+    """Bộ vẽ SVG chỉ xuất được SVG; matplotlib xuất được mọi định dạng trong IMAGE_CONTENT_TYPES."""
+    if (backend or CHART_BACKEND) == 'svg':
+        return image_format == 'svg'
+    return image_format in IMAGE_CONTENT_TYPES
+
+def default_image_format(backend=None):
+    """Định dạng ảnh mặc định của bộ vẽ: 'svg' cho bộ vẽ SVG, 'png' cho matplotlib."""
+    return 'svg' if (backend or CHART_BACKEND) == 'svg' else 'png'
 
 def format_currency_for_chart(value):
     """Định dạng một giá trị số thành chuỗi tiền tệ ngắn gọn cho các trục của biểu đồ."""
@@ -44,8 +105,33 @@ def generate_chart_image_base64(dates, values, title, ylabel,
                                  color='skyblue', chart_type='bar',
                                  y_values2=None, label2=None, color2='red'):
     """
-    Tạo một biểu đồ (dạng thanh hoặc đường), lưu nó dưới dạng hình ảnh PNG,
-    và trả về dưới dạng chuỗi base64 để nhúng vào HTML.
+    Tạo một biểu đồ (dạng thanh hoặc đường) và trả về dưới dạng chuỗi base64
+    (data URI) để nhúng vào HTML, bằng bộ vẽ đang được cấu hình (CHART_BACKEND).
+    Các tham số giống `render_chart_image`.
+
+    Returns:
+        tuple: (chuỗi_base64_hình_ảnh, thông_báo_lỗi)
+               Nếu thành công, thông_báo_lỗi là None.
+    """
+    image_format = default_image_format()
+    image_bytes, err = render_chart_image(dates, values, title, ylabel, x_labels_override=x_labels_override,
+                                          color=color, chart_type=chart_type,
+                                          y_values2=y_values2, label2=label2, color2=color2,
+                                          image_format=image_format)
+    if image_bytes is None:
+        return None, err
+    return image_to_data_uri(image_bytes, image_format), None
+
+def image_to_data_uri(image_bytes, image_format='png'):
+    """Mã hóa nội dung ảnh thành chuỗi data URI base64 để dùng trong thẻ <img>."""
+    return f"data:{IMAGE_CONTENT_TYPES[image_format]};base64,{base64.b64encode(image_bytes).decode('utf-8')}"
+
+def render_chart_image(dates, values, title, ylabel, 
+                       x_labels_override=None,
+                       color='skyblue', chart_type='bar',
+                       y_values2=None, label2=None, color2='red', image_format=None, backend=None):
+    """
+    Tạo một biểu đồ (dạng thanh hoặc đường) và trả về nội dung ảnh (PNG hoặc SVG).
     Hàm này rất linh hoạt, hỗ trợ nhiều loại dữ liệu và tùy chỉnh.
 
     Args:
@@ -59,14 +145,28 @@ def generate_chart_image_base64(dates, values, title, ylabel,
         y_values2 (list, optional): Dữ liệu cho chuỗi thứ hai (dùng cho biểu đồ đường kép).
         label2 (str, optional): Nhãn cho chuỗi dữ liệu thứ hai.
         color2 (str, optional): Màu cho chuỗi dữ liệu thứ hai.
+        image_format (str, optional): 'png' hoặc 'svg' (mặc định theo bộ vẽ, xem `default_image_format`).
+        backend (str, optional): 'svg' hoặc 'matplotlib' (mặc định CHART_BACKEND).
 
     Returns:
-        tuple: (chuỗi_base64_hình_ảnh, thông_báo_lỗi)
+        tuple: (bytes_ảnh, thông_báo_lỗi)
                Nếu thành công, thông_báo_lỗi là None.
     """
-    if not MATPLOTLIB_AVAILABLE:
-        return None, "Thư viện 'matplotlib' chưa được cài đặt, chức năng biểu đồ không khả dụng."
-    
+    backend = backend or CHART_BACKEND
+    image_format = image_format or default_image_format(backend)
+    available, err = chart_backend_available(backend)
+    if not available:
+        return None, err
+    if not supports_image_format(image_format, backend):
+        return None, f"Bộ vẽ '{backend}' không hỗ trợ định dạng ảnh '{image_format}'."
+
+    if backend == 'svg':
+        from . import svg_charts # Import khi cần để tránh vòng lặp import với svg_charts.
+        return svg_charts.render_chart_svg(dates, values, title, ylabel, x_labels_override=x_labels_override,
+                                           color=color, chart_type=chart_type,
+                                           y_values2=y_values2, label2=label2, color2=color2), None
+
+    _load_matplotlib()
     # Khởi tạo một figure và axes để vẽ
     fig, ax = plt.subplots(figsize=(10, 6))
     
@@ -130,13 +230,9 @@ def generate_chart_image_base64(dates, values, title, ylabel,
     ax.grid(True, linestyle='--', alpha=0.6) # Thêm lưới mờ để dễ theo dõi
     fig.tight_layout() # Tự động căn chỉnh các thành phần cho vừa vặn
     
-    # --- Chuyển đổi hình ảnh thành chuỗi Base64 ---
+    # --- Xuất hình ảnh ra PNG/SVG ---
     # Lưu hình ảnh vào một buffer trong bộ nhớ thay vì lưu ra file vật lý
     img_stream = io.BytesIO()
-    fig.savefig(img_stream, format='png', dpi=90)
+    fig.savefig(img_stream, format=image_format, dpi=90)
     plt.close(fig) # Đóng figure để giải phóng bộ nhớ
-    img_stream.seek(0)
-    
-    # Mã hóa buffer hình ảnh thành chuỗi base64
-    img_base64 = base64.b64encode(img_stream.read()).decode('utf-8')
-    return f"data:image/png;base64,{img_base64}", None
+    return img_stream.getvalue(), None
@@ -1,9 +1,57 @@
 # /src/backend/common/database_base.py
 import sqlite3
 import datetime
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
 
 DB_NAME = 'miniventory_sqlite.db'
 
+# --- Cấu hình pool kết nối ---
+POOL_MAX_SIZE = 16             # Số kết nối tối đa được mở đồng thời trong một tiến trình.
+POOL_CHECKOUT_TIMEOUT = 10.0   # Số giây tối đa chờ một kết nối rảnh trước khi báo lỗi.
+POOL_HEALTH_CHECK_IDLE = 30.0  # Kết nối rảnh lâu hơn số giây này sẽ được kiểm tra lại trước khi dùng.
+
+# --- Thử lại khi mở transaction ghi ---
+# Mỗi lần thử, SQLite tự chờ tối đa busy_timeout (xem PRAGMA_PROFILES) để lấy khóa ghi; nếu vẫn
+# bận ("database is locked"), chờ thêm một khoảng tăng dần (có ngẫu nhiên) rồi thử lại.
+WRITE_RETRY_ATTEMPTS = 3       # Số lần thử BEGIN IMMEDIATE tối đa.
+WRITE_RETRY_BACKOFF = 0.05     # Số giây chờ sau lần thất bại đầu tiên (nhân đôi sau mỗi lần).
+WRITE_RETRY_BACKOFF_MAX = 1.0  # Số giây chờ tối đa giữa hai lần thử.
+
+# Số tham số '?' tối đa dùng trong một câu lệnh (giới hạn an toàn cho mọi phiên bản SQLite).
+SQLITE_MAX_PARAMS = 900
+# Giá trị lớn nhất của cột INTEGER trong SQLite (số nguyên 64 bit có dấu).
+SQLITE_MAX_INTEGER = 2 ** 63 - 1
+
+# --- Cấu hình PRAGMA của SQLite theo "profile" ---
+# Tất cả profile đều dùng WAL: người đọc (báo cáo) không bị chặn bởi người ghi (nhập/xuất kho)
+# và mỗi commit chỉ ghi nối tiếp vào file -wal thay vì ghi lại trang + journal.
+#   - durable  : fsync ở mỗi commit (synchronous=FULL), an toàn tuyệt đối khi mất điện.
+#   - balanced : synchronous=NORMAL - trong chế độ WAL vẫn không bao giờ hỏng DB, chỉ có thể
+#                mất vài commit cuối cùng nếu mất điện. Mặc định của ứng dụng.
+#   - bulk_load: dùng tạm thời khi nhập file CSV lớn: cache lớn hơn và hoãn checkpoint WAL
+#                để các lô ghi liên tiếp không bị chen ngang bởi việc chép WAL vào DB.
+# cache_size âm nghĩa là đơn vị KiB (ví dụ -16000 ~ 16 MB).
+PRAGMA_PROFILES = {
+    'durable': {
+        'journal_mode': 'WAL', 'synchronous': 'FULL', 'cache_size': -8000,
+        'mmap_size': 0, 'temp_store': 'DEFAULT', 'busy_timeout': 5000, 'wal_autocheckpoint': 1000,
+    },
+    'balanced': {
+        'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -16000,
+        'mmap_size': 64 * 1024 * 1024, 'temp_store': 'MEMORY', 'busy_timeout': 5000, 'wal_autocheckpoint': 1000,
+    },
+    'bulk_load': {
+        'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -64000,
+        'mmap_size': 256 * 1024 * 1024, 'temp_store': 'MEMORY', 'busy_timeout': 10000, 'wal_autocheckpoint': 10000,
+    },
+}
+# Profile mặc định; có thể ghi đè bằng biến môi trường MINIVENTORY_DB_PROFILE hoặc tham số --db-profile.
+PRAGMA_PROFILE = os.environ.get('MINIVENTORY_DB_PROFILE', 'balanced')
+
 def adapt_datetime_iso(val):
     """Chuyển đổi đối tượng datetime của Python thành chuỗi ISO 8601 để lưu trữ."""
     return val.isoformat()
@@ -16,20 +64,270 @@ def convert_datetime_iso(val):
         # Hỗ trợ định dạng cũ hơn nếu cần
         return datetime.datetime.strptime(val.decode(), '%Y-%m-%d %H:%M:%S.%f')
 
+# Đăng ký các hàm chuyển đổi một lần duy nhất khi module được import,
+# để SQLite hiểu kiểu dữ liệu datetime của Python.
+sqlite3.register_adapter(datetime.datetime, adapt_datetime_iso)
+sqlite3.register_converter("timestamp", convert_datetime_iso)
+
+def build_timestamp_range(column, start_date_str, end_date_str):
+    """
+    Tạo điều kiện lọc theo khoảng ngày dưới dạng khoảng nửa mở [từ_ngày, đến_ngày + 1)
+    trực tiếp trên cột thời gian (không bọc cột trong hàm như strftime), để SQLite
+    có thể dùng index trên cột đó thay vì quét toàn bộ bảng.
+    Giá trị thời gian được lưu dạng ISO 8601 nên so sánh chuỗi cho kết quả đúng thứ tự.
+
+    Args:
+        column (str): Tên cột thời gian (ví dụ: 'st.timestamp').
+        start_date_str (str): Ngày bắt đầu 'YYYY-MM-DD' (bao gồm), có thể rỗng.
+        end_date_str (str): Ngày kết thúc 'YYYY-MM-DD' (bao gồm), có thể rỗng.
+
+    Returns:
+        tuple: (list_điều_kiện_sql, list_tham_số)
+    """
+    conditions, params = [], []
+    start_date = _parse_date(start_date_str)
+    end_date = _parse_date(end_date_str)
+    if start_date:
+        conditions.append(f"{column} >= ?")
+        params.append(start_date.isoformat())
+    if end_date:
+        conditions.append(f"{column} < ?")
+        params.append((end_date + datetime.timedelta(days=1)).isoformat())
+    return conditions, params
+
+def _parse_date(date_str):
+    """Chuyển chuỗi 'YYYY-MM-DD' thành date; trả về None nếu rỗng hoặc không hợp lệ."""
+    if not date_str:
+        return None
+    try:
+        return datetime.date.fromisoformat(date_str.strip()[:10])
+    except ValueError:
+        return None
+
+def apply_pragma_profile(conn, profile_name):
+    """
+    Áp dụng các PRAGMA của một profile lên kết nối. Phải gọi khi kết nối KHÔNG nằm
+    trong transaction (SQLite không cho đổi journal_mode/synchronous giữa transaction).
+
+    Raises:
+        ValueError: Nếu tên profile không tồn tại.
+    """
+    if profile_name not in PRAGMA_PROFILES:
+        raise ValueError(f"Profile PRAGMA không hợp lệ: '{profile_name}'. Chọn một trong {', '.join(PRAGMA_PROFILES)}.")
+    for pragma, value in PRAGMA_PROFILES[profile_name].items():
+        # Tên và giá trị đều lấy từ PRAGMA_PROFILES (không phải dữ liệu người dùng).
+        conn.execute(f"PRAGMA {pragma} = {value}").fetchall()
+
+@contextmanager
+def use_pragma_profile(conn, profile_name):
+    """
+    Tạm thời chuyển kết nối sang một profile khác (ví dụ 'bulk_load' khi nhập CSV),
+    sau đó khôi phục profile đang cấu hình cho pool khi ra khỏi khối `with`.
+    """
+    apply_pragma_profile(conn, profile_name)
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        apply_pragma_profile(conn, connection_pool.pragma_profile)
+
 def get_db_connection(db_name=DB_NAME):
     """
-    Tạo và trả về một đối tượng kết nối tới cơ sở dữ liệu SQLite.
-    Hàm này tự động đăng ký các bộ chuyển đổi kiểu dữ liệu datetime và
-    thiết lập row_factory để có thể truy cập các cột bằng tên.
-    """
-    # Đăng ký các hàm chuyển đổi để SQLite hiểu kiểu dữ liệu datetime của Python
-    sqlite3.register_adapter(datetime.datetime, adapt_datetime_iso)
-    sqlite3.register_converter("timestamp", convert_datetime_iso)
-    
-    # Tạo kết nối
-    conn = sqlite3.connect(db_name, detect_types=sqlite3.PARSE_DECLTYPES)
-    
+    Tạo và trả về một đối tượng kết nối MỚI tới cơ sở dữ liệu SQLite.
+    Kết nối được thiết lập row_factory để có thể truy cập các cột bằng tên.
+    Chỉ nên dùng cho các tác vụ đặc biệt (khởi tạo DB, script); các truy vấn
+    thông thường nên mượn kết nối từ pool qua `borrow_db_connection()`.
+    """
+    # check_same_thread=False vì kết nối trong pool có thể được trả về và
+    # mượn lại bởi một luồng worker khác (mỗi thời điểm chỉ một luồng dùng).
+    conn = sqlite3.connect(db_name, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+
     # Thiết lập row_factory để kết quả trả về có thể được truy cập như dictionary
     conn.row_factory = sqlite3.Row
-    
+
     return conn
+
+class ConnectionPool:
+    """
+    Pool kết nối SQLite theo cơ chế mượn/trả (checkout/checkin).
+    - Tái sử dụng kết nối đã mở thay vì `sqlite3.connect` cho mỗi truy vấn.
+    - Giới hạn tổng số kết nối mở đồng thời bằng `max_size`.
+    - Kiểm tra sức khỏe kết nối đã rảnh lâu trước khi cho mượn lại.
+    - Tự động bỏ toàn bộ kết nối cũ khi phát hiện đang chạy trong tiến trình con
+      vừa được fork, để mỗi worker có tài nguyên SQLite riêng.
+    """
+
+    def __init__(self, db_name=DB_NAME, max_size=POOL_MAX_SIZE, checkout_timeout=POOL_CHECKOUT_TIMEOUT,
+                 health_check_idle=POOL_HEALTH_CHECK_IDLE, pragma_profile=PRAGMA_PROFILE):
+        self.db_name = db_name
+        self.pragma_profile = pragma_profile
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.health_check_idle = health_check_idle
+        self._reset_state()
+
+    def _reset_state(self):
+        """Khởi tạo (lại) trạng thái nội bộ cho tiến trình hiện tại."""
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._idle = [] # Danh sách (kết nối, thời điểm trả về), dùng theo kiểu LIFO.
+        self._open_count = 0
+
+    def _ensure_process(self):
+        """Nếu tiến trình đã bị fork, bỏ các kết nối thừa kế từ tiến trình cha."""
+        if self._pid != os.getpid():
+            # Không đóng các kết nối của tiến trình cha: chỉ bỏ tham chiếu tới chúng.
+            self._reset_state()
+
+    def _is_healthy(self, conn):
+        """Kiểm tra nhanh một kết nối còn dùng được hay không."""
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def checkout(self):
+        """
+        Mượn một kết nối từ pool. Chờ tối đa `checkout_timeout` giây nếu pool đã
+        đạt kích thước tối đa và không còn kết nối rảnh.
+
+        Raises:
+            sqlite3.OperationalError: Nếu hết thời gian chờ mà không có kết nối nào.
+        """
+        self._ensure_process()
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise sqlite3.OperationalError(
+                f"Hết thời gian chờ kết nối từ pool (tối đa {self.max_size} kết nối).")
+        try:
+            while True:
+                with self._lock:
+                    if not self._idle:
+                        break
+                    conn, returned_at = self._idle.pop()
+                if time.monotonic() - returned_at < self.health_check_idle or self._is_healthy(conn):
+                    return conn
+                self._discard(conn)
+            conn = get_db_connection(self.db_name)
+            try:
+                apply_pragma_profile(conn, self.pragma_profile)
+            except Exception:
+                conn.close()
+                raise
+            with self._lock:
+                self._open_count += 1
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def checkin(self, conn):
+        """Trả kết nối về pool. Transaction còn dang dở (nếu có) sẽ bị hoàn tác."""
+        if self._pid != os.getpid():
+            return # Kết nối thuộc về pool của tiến trình khác.
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            self._slots.release()
+            return
+        with self._lock:
+            self._idle.append((conn, time.monotonic()))
+        self._slots.release()
+
+    def _discard(self, conn):
+        """Đóng hẳn một kết nối hỏng và giảm bộ đếm."""
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._open_count -= 1
+
+    def close_all(self):
+        """Đóng tất cả các kết nối đang rảnh trong pool."""
+        self._ensure_process()
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._open_count -= len(idle)
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def stats(self):
+        """Trả về thông tin thống kê đơn giản về pool."""
+        with self._lock:
+            return {'open': self._open_count, 'idle': len(self._idle), 'max_size': self.max_size}
+
+# Pool dùng chung cho toàn bộ tiến trình.
+connection_pool = ConnectionPool()
+
+@contextmanager
+def borrow_db_connection():
+    """
+    Context manager mượn một kết nối từ pool và tự động trả lại khi kết thúc khối `with`.
+    Nếu khối lệnh để lại một transaction chưa commit, transaction đó sẽ bị rollback.
+
+    Ví dụ:
+        with borrow_db_connection() as conn:
+            rows = conn.execute("SELECT ...").fetchall()
+    """
+    conn = connection_pool.checkout()
+    try:
+        yield conn
+    finally:
+        connection_pool.checkin(conn)
+
+def is_busy_error(error):
+    """Kiểm tra lỗi SQLite có phải do DB đang bị khóa bởi kết nối/tiến trình khác hay không."""
+    return isinstance(error, sqlite3.OperationalError) and 'locked' in str(error)
+
+def begin_immediate(conn, attempts=WRITE_RETRY_ATTEMPTS):
+    """
+    Mở transaction ghi bằng BEGIN IMMEDIATE: lấy khóa ghi ngay từ đầu, nên các câu lệnh sau đó
+    trong transaction không thể gặp SQLITE_BUSY giữa chừng. Nếu không lấy được khóa (DB bận quá
+    busy_timeout), thử lại tối đa `attempts` lần với thời gian chờ tăng dần.
+
+    Raises:
+        sqlite3.OperationalError: Nếu vẫn không lấy được khóa ghi sau lần thử cuối cùng.
+    """
+    for attempt in range(attempts):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            return
+        except sqlite3.OperationalError as e:
+            if not is_busy_error(e) or attempt == attempts - 1:
+                raise
+            delay = min(WRITE_RETRY_BACKOFF * (2 ** attempt), WRITE_RETRY_BACKOFF_MAX)
+            time.sleep(delay * random.uniform(0.5, 1.0))
+
+def get_cache_version(name):
+    """
+    Đọc bộ đếm phiên bản dữ liệu `name` trong bảng 'cache_versions' (do trigger tăng
+    mỗi khi dữ liệu liên quan thay đổi). Trả về 0 nếu bảng/bộ đếm chưa tồn tại.
+    """
+    with borrow_db_connection() as conn:
+        try:
+            row = conn.execute("SELECT version FROM cache_versions WHERE name = ?", (name,)).fetchone()
+        except sqlite3.OperationalError:
+            return 0
+    return row[0] if row else 0
+
+def set_pragma_profile(profile_name):
+    """
+    Đổi profile PRAGMA của pool. Các kết nối đang rảnh bị đóng để lần mượn sau
+    tạo kết nối mới với profile mới.
+    """
+    if profile_name not in PRAGMA_PROFILES:
+        raise ValueError(f"Profile PRAGMA không hợp lệ: '{profile_name}'. Chọn một trong {', '.join(PRAGMA_PROFILES)}.")
+    connection_pool.pragma_profile = profile_name
+    connection_pool.close_all()
+
+def reset_connection_pool():
+    """Bỏ toàn bộ kết nối của pool (dùng khi khởi động một tiến trình worker mới)."""
+    connection_pool._reset_state()
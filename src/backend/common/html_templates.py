@@ -4,20 +4,32 @@
 # (trong các file handlers) trở nên gọn gàng và dễ đọc hơn.
 
 import datetime
-from urllib.parse import quote_plus 
+from urllib.parse import quote_plus, urlencode
+import html
 import locale
 
 STYLE_CSS_PATH = 'frontend/static/style.css'
 
-# Cố gắng thiết lập locale cho tiếng Việt để định dạng số và tiền tệ.
-# Nếu không thành công, sẽ fallback về locale mặc định của hệ thống.
-try:
-    locale.setlocale(locale.LC_ALL, 'vi_VN.UTF-8')
-except locale.Error:
+_locale_ready = False
+
+def setup_locale():
+    """
+    Cố gắng thiết lập locale cho tiếng Việt để định dạng số và tiền tệ.
+    Nếu không thành công, sẽ fallback về locale mặc định của hệ thống.
+    Chỉ chạy một lần: được gọi khi khởi động server (trước khi có luồng worker,
+    vì `setlocale` thay đổi trạng thái của cả tiến trình), hoặc ở lần định dạng đầu tiên.
+    """
+    global _locale_ready
+    if _locale_ready:
+        return
     try:
-        locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')
+        locale.setlocale(locale.LC_ALL, 'vi_VN.UTF-8')
     except locale.Error:
-        pass # Bỏ qua nếu không thể thiết lập locale
+        try:
+            locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')
+        except locale.Error:
+            pass # Bỏ qua nếu không thể thiết lập locale
+    _locale_ready = True
 
 def format_currency(value):
     """
@@ -31,6 +43,7 @@ def format_currency(value):
         str: Chuỗi đã được định dạng (ví dụ: "1 234 500 VNĐ").
     """
     if value is None: return "0 VNĐ"
+    setup_locale()
     try:
         num_int = int(value)
         # Sử dụng locale để định dạng nếu là tiếng Việt
@@ -50,6 +63,86 @@ def format_currency(value):
     except (ValueError, TypeError):
         return "Không xác định"
 
+def pagination_links(base_path, params, next_cursor=None, prev_cursor=None):
+    """
+    Tạo thanh điều hướng "Trang trước / Trang sau" cho danh sách phân trang theo con trỏ.
+    Các tham số hiện tại (sắp xếp, bộ lọc) được giữ nguyên trong link.
+
+    Args:
+        base_path (str): Đường dẫn trang (vd: '/products_stock').
+        params (dict): Các tham số cần giữ lại (giá trị rỗng bị bỏ qua).
+        next_cursor, prev_cursor (str, optional): Con trỏ trang sau / trang trước.
+
+    Returns:
+        str: Khối HTML (rỗng nếu chỉ có một trang).
+    """
+    if not next_cursor and not prev_cursor:
+        return ""
+    base_params = {key: value for key, value in params.items() if value not in (None, '')}
+
+    def link(extra_params, text):
+        url = f"{base_path}?{urlencode(dict(base_params, **extra_params))}"
+        return f'<a href="{html.escape(url)}" class="btn btn-secondary">{text}</a>'
+
+    parts = []
+    if prev_cursor:
+        parts.append(link({}, "&laquo; Trang đầu"))
+        parts.append(link({'before': prev_cursor}, "&lsaquo; Trang trước"))
+    if next_cursor:
+        parts.append(link({'after': next_cursor}, "Trang sau &rsaquo;"))
+    return f'<div class="pagination">{"".join(parts)}</div>'
+
+# Đường dẫn gợi ý sản phẩm và số gợi ý hiển thị cho mỗi lần gõ.
+PRODUCT_SUGGEST_PATH = '/products/suggest'
+PRODUCT_SUGGEST_LIMIT = 10
+
+def product_suggest_input(field_id, value="", required=False):
+    """
+    Tạo ô nhập sản phẩm có gợi ý khi gõ (type-ahead): người dùng gõ SKU hoặc tên (có dấu hoặc
+    không), trình duyệt hỏi PRODUCT_SUGGEST_PATH và hiện tối đa PRODUCT_SUGGEST_LIMIT gợi ý.
+    Giá trị gửi lên server là SKU của sản phẩm được chọn.
+
+    Args:
+        field_id (str): id và name của ô nhập.
+        value (str): SKU đang chọn (nếu có).
+        required (bool): Ô nhập bắt buộc hay không.
+
+    Returns:
+        str: Khối HTML gồm ô nhập, <datalist> và đoạn JavaScript gọi gợi ý.
+    """
+    list_id = f"{field_id}_suggestions"
+    return f"""<input type="text" id="{field_id}" name="{field_id}" list="{list_id}" value="{html.escape(value)}"
+        autocomplete="off" placeholder="Gõ mã SKU hoặc tên sản phẩm" {'required' if required else ''}>
+    <datalist id="{list_id}"></datalist>
+    <script>
+        (function () {{
+            const input = document.getElementById('{field_id}');
+            const list = document.getElementById('{list_id}');
+            let timer = null, lastRequest = 0;
+            input.addEventListener('input', () => {{
+                clearTimeout(timer);
+                // Chờ người dùng ngừng gõ một chút rồi mới hỏi server.
+                timer = setTimeout(() => {{
+                    const text = input.value.trim();
+                    if (!text) {{ list.replaceChildren(); return; }}
+                    const requestId = ++lastRequest;
+                    fetch('{PRODUCT_SUGGEST_PATH}?limit={PRODUCT_SUGGEST_LIMIT}&q=' + encodeURIComponent(text))
+                        .then(response => response.json())
+                        .then(items => {{
+                            if (requestId !== lastRequest) return; // Bỏ kết quả của lần gõ cũ.
+                            list.replaceChildren(...items.map(p => {{
+                                const option = document.createElement('option');
+                                option.value = p.sku;
+                                option.label = `${{p.name}} - Tồn: ${{p.current_stock}}`;
+                                return option;
+                            }}));
+                        }})
+                        .catch(() => {{}});
+                }}, 150);
+            }});
+        }})();
+    </script>"""
+
 def html_page_wrapper(title, body_content, message="", msg_type="info"):
     """
     Tạo cấu trúc HTML hoàn chỉnh cho một trang web.
@@ -65,6 +158,14 @@ def html_page_wrapper(title, body_content, message="", msg_type="info"):
     Returns:
         str: Một chuỗi HTML hoàn chỉnh sẵn sàng để gửi về client.
     """
+    return f"""{html_page_head(title, message, msg_type)}
+            {body_content}{html_page_tail()}"""
+
+def html_page_head(title, message="", msg_type="info"):
+    """
+    Phần đầu của template chung (đến ngay trước nội dung chính): head, header, navigation,
+    tiêu đề trang và thông báo. Dùng riêng khi gửi trang dạng luồng (nội dung là generator).
+    """
     # Khối HTML cho thanh điều hướng
     nav_links = """
         <nav>
@@ -75,6 +176,7 @@ def html_page_wrapper(title, body_content, message="", msg_type="info"):
                 <li><a href="/stock/in">Tạo Nhập kho</a></li>
                 <li><a href="/stock/out">Tạo Xuất kho</a></li>
                 <li><a href="/transactions">Lịch sử Giao dịch</a></li>
+                <li><a href="/audit">Nhật ký</a></li>
                 <li><a href="/report/low_stock">Báo cáo sắp hết hàng</a></li>
                 <li><a href="/reports_charts">Thống kê & Báo cáo</a></li>
             </ul>
@@ -88,7 +190,6 @@ def html_page_wrapper(title, body_content, message="", msg_type="info"):
         escaped_message = escaped_message.replace("\\n", "<br>")
         message_html = f"<div class='message {msg_type}'>{escaped_message}</div>"
 
-    # Trả về chuỗi HTML hoàn chỉnh
     return f"""
     <!DOCTYPE html>
     <html lang="vi">
@@ -103,8 +204,11 @@ def html_page_wrapper(title, body_content, message="", msg_type="info"):
         {nav_links}
         <main class="container">
             <h2>{title}</h2>
-            {message_html}
-            {body_content}
+            {message_html}"""
+
+def html_page_tail():
+    """Phần cuối của template chung (sau nội dung chính): đóng main, footer."""
+    return f"""
         </main>
         <footer><p>&copy; {datetime.datetime.now().year} MiniVentory.</p></footer>
     </body>
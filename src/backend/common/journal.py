@@ -0,0 +1,293 @@
+# /src/backend/common/journal.py
+# File này chứa nhật ký giao dịch có cấu trúc (thay cho file text 'lichsugiaodich.txt'), dùng cho
+# `ghi_log_giao_dich` (quan_ly_du_lieu.py) và trang /audit:
+#   - File nhật ký chỉ ghi nối (append-only), mỗi dòng là một bản ghi JSON với các trường có kiểu:
+#     ts, event, message và (tùy chọn) sku, file, ok, total, user.
+#   - File chỉ mục đi kèm '<nhật_ký>.idx' gồm các phần tử có kích thước cố định, theo đúng thứ tự
+#     bản ghi: (thời điểm, vị trí, độ dài, hash SKU, phần tử trước có cùng nhóm SKU). Thời điểm
+#     trong chỉ mục không giảm nên tìm theo khoảng thời gian bằng `bisect`: O(log n).
+#   - File '<nhật_ký>.sku' chứa phần tử mới nhất của mỗi nhóm SKU (bảng băm kích thước cố định);
+#     tìm theo SKU đi ngược chuỗi phần tử của nhóm đó, không duyệt các bản ghi khác.
+#   - Khi tìm, chỉ mục và nhật ký được đọc qua mmap: chỉ các bản ghi khớp mới được đọc và giải mã.
+#   - Việc ghi do luồng nền của log_writer thực hiện theo lô. Nhiều tiến trình (prefork) ghi chung:
+#     mỗi lô khóa file nhật ký (flock), ghi nối bản ghi rồi cập nhật chỉ mục. Các bản ghi chưa có
+#     trong chỉ mục (vd. tiến trình bị dừng giữa chừng) được đánh chỉ mục bổ sung ở lô ghi tiếp theo.
+
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+from datetime import datetime
+from .log_writer import log_writer, OVERFLOW_BLOCK
+try:
+    import fcntl # Khóa file giữa các tiến trình khi ghi (chỉ có trên Unix)
+except ImportError:
+    fcntl = None
+
+# --- Cấu hình nhật ký ---
+JOURNAL_FILE = 'lichsugiaodich.jsonl'
+JOURNAL_SKU_BUCKETS = 65536     # Số nhóm SKU trong file '<nhật_ký>.sku' (mỗi nhóm 8 byte).
+# Độ lệch tối đa (giây) giữa thời điểm của bản ghi và thời điểm trong chỉ mục: các tiến trình ghi
+# theo lô nên bản ghi có thể được ghi sau một bản ghi mới hơn của tiến trình khác.
+JOURNAL_CLOCK_SKEW = 60.0
+# Số bản ghi mặc định / tối đa của một lần tìm.
+JOURNAL_SEARCH_LIMIT = 200
+JOURNAL_SEARCH_LIMIT_MAX = 1000
+
+# Phần tử chỉ mục: thời điểm (float), vị trí bản ghi, độ dài bản ghi, hash SKU (0 = không có SKU),
+# số thứ tự phần tử trước đó cùng nhóm SKU (-1 = không có).
+_INDEX_ENTRY = struct.Struct('<dQIQq')
+_SKU_HEAD = struct.Struct('<q')
+_NO_ENTRY = -1
+_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def sku_hash(sku):
+    """Hash 64 bit (ổn định giữa các tiến trình) của một SKU; 0 nếu không có SKU."""
+    if not sku:
+        return 0
+    value = int.from_bytes(hashlib.blake2b(str(sku).encode('utf-8'), digest_size=8).digest(), 'little')
+    return value or 1
+
+def _parse_record(raw):
+    """Giải mã một dòng nhật ký; None nếu dòng hỏng."""
+    try:
+        record = json.loads(raw)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return record if isinstance(record, dict) else None
+
+def _record_key(record, default_time):
+    """(thời điểm, hash SKU) của một bản ghi để đưa vào chỉ mục."""
+    try:
+        timestamp = datetime.strptime(record['ts'], _TIMESTAMP_FORMAT).timestamp()
+    except (TypeError, KeyError, ValueError):
+        timestamp = default_time
+    return timestamp, sku_hash(record.get('sku'))
+
+def _to_timestamp(value, default):
+    return datetime.strptime(value, _TIMESTAMP_FORMAT).timestamp() if value else default
+
+class _IndexTimes:
+    """Dãy thời điểm của các phần tử chỉ mục (đọc trực tiếp từ mmap), dùng với `bisect`."""
+
+    def __init__(self, view, count):
+        self._view = view
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, position):
+        return _INDEX_ENTRY.unpack_from(self._view, position * _INDEX_ENTRY.size)[0]
+
+class TransactionJournal:
+    """
+    Nhật ký giao dịch có chỉ mục theo thời gian và SKU.
+
+    Ví dụ:
+        transaction_journal.append("IN_FILE: 'nhap.csv', TC: 3/10.", event='IN_FILE',
+                                   file='nhap.csv', ok=3, total=10, user='file_csv')
+        page = transaction_journal.search(start='2025-01-01 00:00:00', sku='SP-20DC6')
+        page['items']   # các bản ghi khớp, mới nhất trước
+    """
+
+    def __init__(self, path=JOURNAL_FILE):
+        self.path = os.path.abspath(path)
+        self.index_path = self.path + '.idx'
+        self.sku_path = self.path + '.sku'
+        self._lock = threading.Lock()
+        log_writer.register_sink(self.path, self._write_records)
+
+    # --- Ghi ---
+
+    def append(self, message, event=None, sku=None, file=None, ok=None, total=None, user=None):
+        """
+        Thêm một bản ghi vào nhật ký (được ghi bởi luồng nền; nếu hàng đợi đầy thì chờ, không mất bản ghi).
+        `event` mặc định là phần đứng trước dấu ':' của `message` (vd. 'THEM_SP_WEB').
+        """
+        if event is None:
+            event = message.split(':', 1)[0].split(' ', 1)[0]
+        record = {'ts': datetime.now().strftime(_TIMESTAMP_FORMAT), 'event': event}
+        for key, value in (('sku', sku), ('file', file), ('ok', ok), ('total', total), ('user', user)):
+            if value is not None:
+                record[key] = value
+        record['message'] = message
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+        log_writer.write(self.path, line, overflow=OVERFLOW_BLOCK)
+
+    def _write_records(self, lines):
+        """Hàm ghi của log_writer: ghi nối một lô bản ghi rồi cập nhật chỉ mục (giữ khóa file)."""
+        data = ''.join(lines).encode('utf-8')
+        with self._lock, open(self.path, 'ab') as journal:
+            if fcntl is not None:
+                fcntl.flock(journal, fcntl.LOCK_EX)
+            # Dòng cuối bị ghi dở (tiến trình bị dừng giữa chừng): kết thúc dòng đó trước khi ghi nối.
+            size = os.fstat(journal.fileno()).st_size
+            if size and not self._ends_with_newline(size):
+                data = b'\n' + data
+            journal.write(data)
+            journal.flush()
+            self._update_index()
+
+    def _ends_with_newline(self, size):
+        with open(self.path, 'rb') as journal:
+            journal.seek(size - 1)
+            return journal.read(1) == b'\n'
+
+    def _open_sku_heads(self, reset=False):
+        """Mở (tạo nếu chưa có) file nhóm SKU; trả về (file, mmap_ghi, file_vừa_tạo)."""
+        expected_size = JOURNAL_SKU_BUCKETS * _SKU_HEAD.size
+        created = reset or not os.path.exists(self.sku_path) or os.path.getsize(self.sku_path) != expected_size
+        if created:
+            with open(self.sku_path, 'wb') as heads:
+                heads.write(_SKU_HEAD.pack(_NO_ENTRY) * JOURNAL_SKU_BUCKETS)
+        heads = open(self.sku_path, 'r+b')
+        return heads, mmap.mmap(heads.fileno(), expected_size), created
+
+    def _update_index(self, rebuild=False):
+        """
+        Đánh chỉ mục các bản ghi nằm sau bản ghi cuối cùng đã có trong chỉ mục (phải giữ khóa file).
+        Chỉ mục được tạo lại từ đầu nếu `rebuild`, nếu file nhóm SKU bị thiếu / hỏng, hoặc nếu
+        nhật ký ngắn hơn những gì chỉ mục ghi nhận (file nhật ký đã bị thay thế).
+
+        Returns:
+            int: Số bản ghi vừa được đánh chỉ mục.
+        """
+        heads_file, heads, heads_created = self._open_sku_heads(reset=rebuild)
+        try:
+            with open(self.index_path, 'a+b') as index, open(self.path, 'rb') as journal:
+                journal_size = os.fstat(journal.fileno()).st_size
+                count = os.fstat(index.fileno()).st_size // _INDEX_ENTRY.size
+                last_time, indexed_end = 0.0, 0
+                if count and not heads_created:
+                    index.seek((count - 1) * _INDEX_ENTRY.size)
+                    last_time, offset, length, _, _ = _INDEX_ENTRY.unpack(index.read(_INDEX_ENTRY.size))
+                    indexed_end = offset + length
+                if not count or heads_created or indexed_end > journal_size:
+                    if not heads_created:
+                        heads[:] = _SKU_HEAD.pack(_NO_ENTRY) * JOURNAL_SKU_BUCKETS
+                    count, last_time, indexed_end = 0, 0.0, 0
+                # Bỏ phần tử ghi dở ở cuối chỉ mục (nếu có).
+                index.truncate(count * _INDEX_ENTRY.size)
+                journal.seek(indexed_end)
+                entries = bytearray()
+                new_heads = {}  # vị trí nhóm SKU trong file '.sku' -> phần tử mới nhất
+                position, added = indexed_end, 0
+                for raw in journal:
+                    if not raw.endswith(b'\n'):
+                        break # Dòng đang ghi dở: chờ lần sau.
+                    record = _parse_record(raw)
+                    record_time, record_sku = _record_key(record, last_time) if record else (last_time, 0)
+                    last_time = max(last_time, record_time)
+                    previous = _NO_ENTRY
+                    if record_sku:
+                        head_offset = (record_sku % JOURNAL_SKU_BUCKETS) * _SKU_HEAD.size
+                        previous = new_heads.get(head_offset)
+                        if previous is None:
+                            previous = _SKU_HEAD.unpack_from(heads, head_offset)[0]
+                        new_heads[head_offset] = count + added
+                    entries += _INDEX_ENTRY.pack(last_time, position, len(raw), record_sku, previous)
+                    position += len(raw)
+                    added += 1
+                # Chỉ mục được ghi trước, nhóm SKU sau: người đọc không bao giờ thấy phần tử chưa có.
+                index.write(entries)
+                index.flush()
+            for head_offset, entry in new_heads.items():
+                _SKU_HEAD.pack_into(heads, head_offset, entry)
+            heads.flush()
+            return added
+        finally:
+            heads.close()
+            heads_file.close()
+
+    def rebuild_index(self):
+        """
+        Tạo lại toàn bộ chỉ mục từ file nhật ký (lệnh bảo trì).
+
+        Returns:
+            tuple: (bool_thành_công, str_thông_báo)
+        """
+        log_writer.flush()
+        if not os.path.exists(self.path):
+            return False, f"Không có file nhật ký giao dịch '{self.path}'."
+        try:
+            with self._lock, open(self.path, 'ab') as journal:
+                if fcntl is not None:
+                    fcntl.flock(journal, fcntl.LOCK_EX)
+                added = self._update_index(rebuild=True)
+        except OSError as e:
+            return False, f"Lỗi khi tạo lại chỉ mục nhật ký giao dịch: {e}"
+        return True, f"Đã tạo lại chỉ mục nhật ký giao dịch: {added} bản ghi."
+
+    # --- Tìm kiếm ---
+
+    def search(self, start=None, end=None, sku=None, event=None, limit=JOURNAL_SEARCH_LIMIT, before=None):
+        """
+        Tìm các bản ghi trong khoảng thời gian [start, end] (chuỗi 'YYYY-mm-dd HH:MM:SS', None = không
+        giới hạn), lọc theo SKU và loại sự kiện, từ mới đến cũ.
+
+        Args:
+            before (int, optional): Con trỏ 'next' của trang trước (đi tiếp về các bản ghi cũ hơn).
+
+        Returns:
+            dict: {'items': [bản_ghi, ...], 'next': con_trỏ_trang_sau_hoặc_None}
+        """
+        page = {'items': [], 'next': None}
+        limit = max(1, min(limit, JOURNAL_SEARCH_LIMIT_MAX))
+        start_time = _to_timestamp(start, float('-inf'))
+        end_time = _to_timestamp(end, float('inf')) + JOURNAL_CLOCK_SKEW
+        log_writer.flush(timeout=1.0) # Thấy được các bản ghi vừa gửi từ tiến trình này.
+        target = sku_hash(sku)
+        # Đọc nhóm SKU TRƯỚC kích thước chỉ mục: phần tử mà nhóm trỏ tới luôn đã có trong chỉ mục.
+        position = before if before is not None else self._sku_head(target) if target else None
+        try:
+            index_file = open(self.index_path, 'rb')
+            journal_file = open(self.path, 'rb')
+        except FileNotFoundError:
+            return page
+        with index_file, journal_file:
+            count = os.fstat(index_file.fileno()).st_size // _INDEX_ENTRY.size
+            journal_size = os.fstat(journal_file.fileno()).st_size
+            if not count or not journal_size:
+                return page
+            with mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ) as index, \
+                 mmap.mmap(journal_file.fileno(), 0, access=mmap.ACCESS_READ) as journal:
+                if position is None:
+                    position = bisect.bisect_right(_IndexTimes(index, count), end_time) - 1
+                while 0 <= position < count and len(page['items']) < limit:
+                    entry_time, offset, length, entry_sku, previous = _INDEX_ENTRY.unpack_from(
+                        index, position * _INDEX_ENTRY.size)
+                    if entry_time < start_time:
+                        position = _NO_ENTRY # Các phần tử phía trước đều cũ hơn khoảng cần tìm.
+                        break
+                    next_position = previous if target else position - 1
+                    if (not target or entry_sku == target) and entry_time <= end_time \
+                            and offset + length <= journal_size:
+                        record = _parse_record(journal[offset:offset + length])
+                        if record is not None and self._matches(record, start, end, sku, event):
+                            page['items'].append(record)
+                    position = next_position
+                if 0 <= position < count:
+                    page['next'] = position
+        return page
+
+    def _sku_head(self, target):
+        """Phần tử mới nhất trong nhóm của SKU (hash `target`), -1 nếu nhóm trống."""
+        try:
+            with open(self.sku_path, 'rb') as heads:
+                heads.seek((target % JOURNAL_SKU_BUCKETS) * _SKU_HEAD.size)
+                return _SKU_HEAD.unpack(heads.read(_SKU_HEAD.size))[0]
+        except (OSError, struct.error):
+            return _NO_ENTRY
+
+    @staticmethod
+    def _matches(record, start, end, sku, event):
+        timestamp = record.get('ts', '')
+        return ((not start or timestamp >= start) and (not end or timestamp <= end)
+                and (not sku or record.get('sku') == sku) and (not event or record.get('event') == event))
+
+# Nhật ký giao dịch dùng chung trong tiến trình.
+transaction_journal = TransactionJournal()
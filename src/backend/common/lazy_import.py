@@ -0,0 +1,41 @@
+# /src/backend/common/lazy_import.py
+# File này chứa công cụ import "trễ" (lazy import): module chỉ thực sự được nạp
+# ở lần đầu tiên có thuộc tính của nó được truy cập. Nhờ đó server khởi động nhanh,
+# các phần nặng (handlers báo cáo, biểu đồ, ...) chỉ được nạp khi có request cần đến.
+
+import importlib
+
+class LazyModule:
+    """
+    Đại diện cho một module chưa được import.
+
+    Ví dụ:
+        report_handlers = LazyModule('.report.handlers', __package__)
+        report_handlers.handle_get_charts_report(...)  # Lúc này module mới được import.
+    """
+
+    def __init__(self, name, package=None):
+        self._lazy_name = name
+        self._lazy_package = package
+        self._lazy_module = None
+
+    def load(self):
+        """Import module (nếu chưa) và trả về module thật."""
+        module = self._lazy_module
+        if module is None:
+            # importlib tự giữ khóa import cho từng module nên gọi đồng thời từ nhiều luồng vẫn an toàn.
+            module = importlib.import_module(self._lazy_name, self._lazy_package)
+            self._lazy_module = module
+        return module
+
+    @property
+    def is_loaded(self):
+        return self._lazy_module is not None
+
+    def __getattr__(self, attr):
+        # Chỉ được gọi khi thuộc tính không có sẵn trên đối tượng LazyModule.
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        state = 'đã nạp' if self.is_loaded else 'chưa nạp'
+        return f"<LazyModule {self._lazy_name!r} ({state})>"
@@ -0,0 +1,348 @@
+# /src/backend/common/log_writer.py
+# File này chứa bộ ghi log chạy nền, dùng cho `ghi_log_loi` / `ghi_log_giao_dich` (quan_ly_du_lieu.py):
+#   - Luồng gọi (request, xử lý CSV) chỉ đưa dòng log vào một hàng đợi có giới hạn rồi quay lại
+#     ngay; một luồng nền gom các dòng và ghi theo lô (một lần write + flush cho mỗi file mỗi lô).
+#   - Khi hàng đợi đầy, áp dụng chính sách của từng loại log (OVERFLOW_DROP / OVERFLOW_BLOCK).
+#   - Xoay vòng file (rotation) khi file vượt LOG_MAX_BYTES hoặc đã ghi quá LOG_ROTATE_INTERVAL:
+#     file hiện tại được đổi tên thành '<tên>.<YYYYmmdd-HHMMSS>' và một file mới được tạo. Các file
+#     đã xoay vòng được nén gzip ở lần xoay vòng SAU (giống 'delaycompress' của logrotate, vì ở chế
+#     độ prefork các tiến trình khác có thể vẫn đang ghi nốt vào file vừa đổi tên), chỉ giữ lại
+#     LOG_BACKUP_COUNT file gần nhất.
+#   - Nhiều tiến trình ghi chung một file: mỗi lô kiểm tra file đang mở còn là file hiện tại không
+#     (so sánh inode) và mở lại nếu tiến trình khác đã xoay vòng; việc xoay vòng được khóa bằng
+#     file '<tên>.rotate' (mtime của file này là thời điểm xoay vòng gần nhất).
+#   - Sau fork, tiến trình con có hàng đợi và luồng ghi riêng; khi thoát (atexit hoặc `close`)
+#     các dòng còn trong hàng đợi được ghi hết.
+#   - Một file có thể được giao cho một hàm ghi riêng (`register_sink`, vd. nhật ký giao dịch có
+#     chỉ mục trong journal.py): hàm đó nhận các dòng của mỗi lô và tự ghi; file không bị xoay vòng.
+
+import atexit
+import gzip
+import os
+import re
+import shutil
+import threading
+import time
+from collections import deque
+from datetime import datetime
+try:
+    import fcntl # Khóa file giữa các tiến trình khi xoay vòng (chỉ có trên Unix)
+except ImportError:
+    fcntl = None
+
+# --- Cấu hình bộ ghi log ---
+LOG_QUEUE_SIZE = 10000               # Số dòng tối đa chờ ghi trong hàng đợi.
+LOG_BATCH_SIZE = 500                 # Số dòng tối đa trong một lô ghi.
+LOG_FLUSH_INTERVAL = 0.2             # Số giây tối đa một dòng nằm trong hàng đợi trước khi được ghi.
+LOG_MAX_BYTES = 5 * 1024 * 1024      # Kích thước file tối đa trước khi xoay vòng.
+LOG_ROTATE_INTERVAL = 24 * 3600      # Số giây tối đa giữa hai lần xoay vòng (0 = chỉ theo kích thước).
+LOG_BACKUP_COUNT = 10                # Số file đã xoay vòng được giữ lại (.gz và chưa nén).
+
+# --- Chính sách khi hàng đợi đầy ---
+OVERFLOW_DROP = 'drop'    # Bỏ dòng mới, đếm số dòng bị bỏ và ghi một dòng thông báo khi hàng đợi có chỗ.
+OVERFLOW_BLOCK = 'block'  # Luồng gọi chờ đến khi hàng đợi có chỗ (không mất dòng nào).
+
+# Phần đuôi tên file đã xoay vòng: '.20250131-235959', '.20250131-235959-1', có thể kèm '.gz'.
+_ROTATED_SUFFIX = re.compile(r'\.(\d{8}-\d{6})(?:-(\d+))?(?:\.gz)?$')
+
+class _FlushRequest:
+    """Phần tử đặc biệt trong hàng đợi: báo cho luồng gọi `flush` biết các dòng trước nó đã được ghi."""
+    __slots__ = ('done',)
+
+    def __init__(self):
+        self.done = threading.Event()
+
+class AsyncLogWriter:
+    """
+    Bộ ghi log bất đồng bộ cho nhiều file, an toàn khi dùng từ nhiều luồng.
+
+    Ví dụ:
+        log_writer.write('log.txt', "2025-01-31 10:00:00 - Khởi động server.\\n")
+        log_writer.flush()   # chờ các dòng đã gửi được ghi xuống file
+    """
+
+    def __init__(self, queue_size=LOG_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._sinks = {}                    # đường dẫn tuyệt đối -> hàm ghi riêng (giữ nguyên qua fork)
+        self._reset_state()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(before=self._before_fork, after_in_parent=self._after_fork_in_parent,
+                                after_in_child=self._after_fork_in_child)
+        atexit.register(self.close)
+
+    def _reset_state(self):
+        self._lock = threading.Lock()       # Bảo vệ trạng thái luồng ghi và bộ đếm
+        self._io_lock = threading.Lock()    # Giữ trong lúc ghi một lô (fork phải chờ lô ghi xong)
+        # Hàng đợi là một deque: append/popleft an toàn giữa các luồng mà không cần khóa, nên
+        # luồng gọi gần như không tốn thời gian. Giới hạn kích thước được kiểm tra bằng len()
+        # (có thể vượt quá một chút khi nhiều luồng cùng ghi).
+        self._pending = deque()
+        self._wakeup = threading.Event()    # Đánh thức luồng ghi sớm (đủ một lô, flush, đóng)
+        self._thread = None
+        self._closed = False
+        self._paths = {}                    # đường dẫn truyền vào -> đường dẫn tuyệt đối
+        self._files = {}                    # đường dẫn tuyệt đối -> file đang mở
+        self._dropped = {}                  # đường dẫn tuyệt đối -> số dòng bị bỏ do hàng đợi đầy
+        self._written = 0
+        self._batches = 0
+        self._rotations = 0
+
+    # --- Fork ---
+
+    def _before_fork(self):
+        self._io_lock.acquire()
+
+    def _after_fork_in_parent(self):
+        self._io_lock.release()
+
+    def _after_fork_in_child(self):
+        # Bộ đệm của các file đã được flush sau mỗi lô (và fork chờ lô đang ghi xong), nên chỉ
+        # cần bỏ các đối tượng file thừa kế; hàng đợi của tiến trình cha không được ghi lại lần nữa.
+        self._reset_state()
+
+    # --- Phía luồng gọi ---
+
+    def _ensure_writer(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+
+    def register_sink(self, path, sink):
+        """
+        Giao việc ghi file `path` cho hàm `sink(danh_sách_dòng)`: luồng ghi gọi hàm này với các dòng
+        của mỗi lô (theo thứ tự gửi) thay vì tự ghi nối vào file.
+        """
+        self._sinks[os.path.abspath(path)] = sink
+
+    def write(self, path, text, overflow=OVERFLOW_DROP):
+        """
+        Gửi `text` (một hoặc nhiều dòng, đã có ký tự xuống dòng) để ghi nối vào file `path`.
+        Sau khi bộ ghi đã đóng (lúc tiến trình thoát), dòng log được ghi trực tiếp.
+        """
+        full_path = self._paths.get(path)
+        if full_path is None:
+            full_path = self._paths[path] = os.path.abspath(path)
+        if self._closed:
+            self._write_direct(full_path, text)
+            return
+        if self._thread is None:
+            self._ensure_writer()
+        if len(self._pending) >= self.queue_size:
+            if overflow != OVERFLOW_BLOCK:
+                with self._lock:
+                    self._dropped[full_path] = self._dropped.get(full_path, 0) + 1
+                return
+            while len(self._pending) >= self.queue_size and not self._closed:
+                self._ensure_writer()
+                self._wakeup.set()
+                time.sleep(0.001)
+        self._pending.append((full_path, text))
+        if len(self._pending) >= LOG_BATCH_SIZE:
+            self._wakeup.set()
+
+    def flush(self, timeout=None):
+        """Chờ đến khi mọi dòng đã gửi trước lời gọi này được ghi xuống file."""
+        if self._closed or self._thread is None:
+            return
+        request = _FlushRequest()
+        self._pending.append(request)
+        self._wakeup.set()
+        request.done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        """Ghi hết các dòng còn trong hàng đợi, dừng luồng ghi và đóng các file."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._wakeup.set()
+            thread.join(timeout)
+        # Các dòng được gửi đúng lúc đang đóng (sau lần ghi cuối của luồng ghi) được ghi trực tiếp.
+        while self._pending:
+            item = self._pending.popleft()
+            if isinstance(item, _FlushRequest):
+                item.done.set()
+            else:
+                self._write_direct(*item)
+
+    def stats(self):
+        """Trả về thông tin thống kê của bộ ghi (trong tiến trình hiện tại)."""
+        with self._lock:
+            return {'pending': len(self._pending), 'queue_size': self.queue_size, 'written': self._written,
+                    'batches': self._batches, 'rotations': self._rotations,
+                    'dropped': sum(self._dropped.values())}
+
+    # --- Phía luồng ghi ---
+
+    def _run(self):
+        """Vòng lặp của luồng ghi: mỗi LOG_FLUSH_INTERVAL giây (hoặc khi được đánh thức) ghi hết hàng đợi."""
+        while True:
+            self._wakeup.wait(LOG_FLUSH_INTERVAL)
+            self._wakeup.clear()
+            closing = self._closed # Đọc trước khi lấy hàng đợi: các dòng gửi trước lệnh đóng đều được ghi
+            self._drain()
+            if closing:
+                break
+        with self._io_lock:
+            for handle in self._files.values():
+                handle.close()
+            self._files.clear()
+
+    def _drain(self):
+        """Ghi toàn bộ các dòng đang có trong hàng đợi, theo lô tối đa LOG_BATCH_SIZE dòng."""
+        batch, flush_requests = [], []
+        while True:
+            try:
+                item = self._pending.popleft()
+            except IndexError:
+                break
+            if isinstance(item, _FlushRequest):
+                flush_requests.append(item)
+                continue
+            batch.append(item)
+            if len(batch) >= LOG_BATCH_SIZE:
+                self._write_batch(batch)
+                batch = []
+        self._write_batch(batch)
+        for request in flush_requests:
+            request.done.set()
+
+    def _write_batch(self, batch):
+        texts = {}
+        for path, text in batch:
+            texts.setdefault(path, []).append(text)
+        with self._lock:
+            dropped, self._dropped = self._dropped, {}
+        if not texts and not dropped:
+            return
+        for path, count in dropped.items():
+            if path in self._sinks:
+                continue
+            notice = f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - [log] Bỏ qua {count} dòng log do hàng đợi ghi log bị đầy.\n"
+            texts.setdefault(path, []).insert(0, notice)
+        with self._io_lock:
+            for path, parts in texts.items():
+                try:
+                    sink = self._sinks.get(path)
+                    if sink is not None:
+                        sink(parts)
+                        continue
+                    handle = self._get_handle(path)
+                    handle = self._rotate_if_needed(path, handle)
+                    handle.write(''.join(parts))
+                    handle.flush()
+                except Exception: # Luồng ghi không được dừng vì một lỗi (IO, mã hóa ký tự, ...)
+                    self._discard_handle(path)
+                    print(f"LỖI HỆ THỐNG NGHIÊM TRỌNG: Không thể ghi vào file log: {path}")
+        with self._lock:
+            self._written += len(batch)
+            self._batches += 1
+
+    def _write_direct(self, path, text):
+        try:
+            sink = self._sinks.get(path)
+            if sink is not None:
+                sink([text])
+                return
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(text)
+        except OSError:
+            print(f"LỖI HỆ THỐNG NGHIÊM TRỌNG: Không thể ghi vào file log: {path}")
+
+    def _get_handle(self, path):
+        """Trả về file đang mở của `path`; mở lại nếu tiến trình khác đã xoay vòng file."""
+        handle = self._files.get(path)
+        if handle is not None:
+            try:
+                if os.stat(path).st_ino == os.fstat(handle.fileno()).st_ino:
+                    return handle
+            except OSError:
+                pass
+            self._discard_handle(path)
+        handle = open(path, 'a', encoding='utf-8')
+        self._files[path] = handle
+        marker = path + '.rotate'
+        if not os.path.exists(marker):
+            open(marker, 'a').close()
+        return handle
+
+    def _discard_handle(self, path):
+        handle = self._files.pop(path, None)
+        if handle is not None:
+            try:
+                handle.close()
+            except OSError:
+                pass
+
+    def _rotation_due(self, path, size):
+        if size <= 0:
+            return False
+        if size >= LOG_MAX_BYTES:
+            return True
+        if LOG_ROTATE_INTERVAL <= 0:
+            return False
+        try:
+            return time.time() - os.stat(path + '.rotate').st_mtime >= LOG_ROTATE_INTERVAL
+        except OSError:
+            return False
+
+    def _rotate_if_needed(self, path, handle):
+        if not self._rotation_due(path, os.fstat(handle.fileno()).st_size):
+            return handle
+        marker = path + '.rotate'
+        try:
+            with open(marker, 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                # Kiểm tra lại sau khi có khóa: có thể tiến trình khác vừa xoay vòng xong
+                # (file mới có thể chưa được tạo).
+                try:
+                    current = os.stat(path)
+                except FileNotFoundError:
+                    return self._get_handle(path)
+                if current.st_ino == os.fstat(handle.fileno()).st_ino and self._rotation_due(path, current.st_size):
+                    self._discard_handle(path)
+                    os.replace(path, self._rotated_name(path))
+                    os.utime(marker)
+                    with self._lock:
+                        self._rotations += 1
+                    self._compress_and_prune(path)
+        except OSError as e:
+            # Không xoay vòng được (vd. file đang bị mở trên Windows): tiếp tục ghi vào file cũ.
+            print(f"Không thể xoay vòng file log {path}: {e}")
+        return self._get_handle(path)
+
+    def _rotated_name(self, path):
+        base = f"{path}.{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+        name, counter = base, 0
+        while os.path.exists(name) or os.path.exists(name + '.gz'):
+            counter += 1
+            name = f"{base}-{counter}"
+        return name
+
+    def _list_rotated(self, path):
+        """Các file đã xoay vòng của `path`, từ cũ đến mới (theo thời điểm và số thứ tự trong tên)."""
+        directory, base = os.path.split(path)
+        rotated = []
+        for name in os.listdir(directory):
+            match = _ROTATED_SUFFIX.fullmatch(name[len(base):]) if name.startswith(base + '.') else None
+            if match:
+                rotated.append(((match.group(1), int(match.group(2) or 0)), os.path.join(directory, name)))
+        return [name for _, name in sorted(rotated)]
+
+    def _compress_and_prune(self, path):
+        """Nén các file đã xoay vòng (trừ file mới nhất) và xóa các file cũ vượt LOG_BACKUP_COUNT."""
+        for name in self._list_rotated(path)[:-1]:
+            if not name.endswith('.gz'):
+                with open(name, 'rb') as source, gzip.open(name + '.gz', 'wb') as target:
+                    shutil.copyfileobj(source, target)
+                os.remove(name)
+        rotated = self._list_rotated(path)
+        for name in rotated[:max(0, len(rotated) - LOG_BACKUP_COUNT)]:
+            os.remove(name)
+
+# Bộ ghi log dùng chung trong tiến trình.
+log_writer = AsyncLogWriter()
@@ -0,0 +1,357 @@
+# /src/backend/common/migrations.py
+# File này chứa hệ thống migration (nâng cấp cấu trúc) cơ sở dữ liệu theo phiên bản.
+# Phiên bản schema hiện tại được lưu trong `PRAGMA user_version` của file SQLite.
+# Mỗi migration là một hàm nhận cursor, được đánh số tăng dần và chỉ chạy đúng một lần,
+# bên trong một transaction: hoặc toàn bộ migration được áp dụng, hoặc không có gì thay đổi.
+#
+# Để thay đổi schema: KHÔNG sửa các migration cũ, hãy thêm một hàm mới vào cuối MIGRATIONS.
+
+import sqlite3
+from .database_base import DB_NAME
+from .text_search import sql_fold, sql_sku_key
+
+def _migration_1_tao_bang_co_ban(cursor):
+    """Tạo các bảng gốc 'products' và 'stock_transactions' (tương thích với DB cũ đã có bảng)."""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, sku TEXT NOT NULL UNIQUE,
+        description TEXT, unit_of_measure TEXT DEFAULT 'cái',
+        current_stock INTEGER DEFAULT 0, price INTEGER DEFAULT 0,
+        is_deleted INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS stock_transactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, product_id INTEGER NOT NULL,
+        transaction_type TEXT NOT NULL, quantity INTEGER NOT NULL,
+        unit_price INTEGER DEFAULT 0, total_amount INTEGER DEFAULT 0,
+        timestamp TIMESTAMP, notes TEXT, user TEXT,
+        FOREIGN KEY (product_id) REFERENCES products (id)
+    )''')
+
+def _migration_2_index_truy_van(cursor):
+    """Thêm các index phục vụ lọc theo thời gian và liệt kê sản phẩm."""
+    # Lịch sử giao dịch, báo cáo doanh thu và luồng nhập/xuất lọc theo khoảng thời gian.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_stock_transactions_timestamp ON stock_transactions (timestamp)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_stock_transactions_type_timestamp ON stock_transactions (transaction_type, timestamp)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_stock_transactions_product_timestamp ON stock_transactions (product_id, timestamp)")
+    # Danh sách sản phẩm (đang hiển thị / đã ẩn) sắp xếp theo tên.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_products_deleted_name ON products (is_deleted, name)")
+
+def _migration_3_bang_tong_hop_ngay(cursor):
+    """
+    Tạo bảng tổng hợp 'daily_product_rollup' (mỗi dòng = một sản phẩm trong một ngày),
+    được trigger cập nhật ngay trong transaction ghi giao dịch, và điền dữ liệu từ lịch sử cũ.
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS daily_product_rollup (
+        day TEXT NOT NULL, product_id INTEGER NOT NULL,
+        in_qty INTEGER NOT NULL DEFAULT 0, out_qty INTEGER NOT NULL DEFAULT 0,
+        revenue INTEGER NOT NULL DEFAULT 0, txn_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, product_id)
+    ) WITHOUT ROWID''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_daily_product_rollup_product_day ON daily_product_rollup (product_id, day)")
+    # Ngày lấy từ 10 ký tự đầu của timestamp dạng ISO ('YYYY-MM-DDTHH:MM:SS...').
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_stock_transactions_rollup_insert
+    AFTER INSERT ON stock_transactions
+    BEGIN
+        INSERT INTO daily_product_rollup (day, product_id, in_qty, out_qty, revenue, txn_count)
+        VALUES (
+            COALESCE(substr(NEW.timestamp, 1, 10), ''), NEW.product_id,
+            CASE WHEN NEW.transaction_type = 'IN' THEN NEW.quantity ELSE 0 END,
+            CASE WHEN NEW.transaction_type = 'OUT' THEN NEW.quantity ELSE 0 END,
+            CASE WHEN NEW.transaction_type = 'OUT' THEN COALESCE(NEW.total_amount, 0) ELSE 0 END,
+            1
+        )
+        ON CONFLICT (day, product_id) DO UPDATE SET
+            in_qty = in_qty + excluded.in_qty,
+            out_qty = out_qty + excluded.out_qty,
+            revenue = revenue + excluded.revenue,
+            txn_count = txn_count + 1;
+    END''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_stock_transactions_rollup_delete
+    AFTER DELETE ON stock_transactions
+    BEGIN
+        UPDATE daily_product_rollup SET
+            in_qty = in_qty - CASE WHEN OLD.transaction_type = 'IN' THEN OLD.quantity ELSE 0 END,
+            out_qty = out_qty - CASE WHEN OLD.transaction_type = 'OUT' THEN OLD.quantity ELSE 0 END,
+            revenue = revenue - CASE WHEN OLD.transaction_type = 'OUT' THEN COALESCE(OLD.total_amount, 0) ELSE 0 END,
+            txn_count = txn_count - 1
+        WHERE day = COALESCE(substr(OLD.timestamp, 1, 10), '') AND product_id = OLD.product_id;
+        DELETE FROM daily_product_rollup
+        WHERE day = COALESCE(substr(OLD.timestamp, 1, 10), '') AND product_id = OLD.product_id AND txn_count <= 0;
+    END''')
+    # Điền dữ liệu tổng hợp cho các giao dịch đã có trước migration này.
+    cursor.execute("DELETE FROM daily_product_rollup")
+    cursor.execute('''
+    INSERT INTO daily_product_rollup (day, product_id, in_qty, out_qty, revenue, txn_count)
+    SELECT COALESCE(substr(timestamp, 1, 10), ''), product_id,
+           SUM(CASE WHEN transaction_type = 'IN' THEN quantity ELSE 0 END),
+           SUM(CASE WHEN transaction_type = 'OUT' THEN quantity ELSE 0 END),
+           COALESCE(SUM(CASE WHEN transaction_type = 'OUT' THEN total_amount ELSE 0 END), 0),
+           COUNT(*)
+    FROM stock_transactions
+    GROUP BY 1, product_id''')
+
+def _migration_4_bo_dem_dashboard(cursor):
+    """
+    Tạo bảng 'dashboard_counters' (đúng một dòng, id = 1) chứa các chỉ số của trang chủ,
+    được trigger trên 'products' và 'stock_transactions' cập nhật trong cùng transaction ghi.
+    Quy ước: sản phẩm "đang hiển thị" có is_deleted = 0, "đã ẩn" có is_deleted = 1;
+    giá trị tồn kho tính trên TẤT CẢ sản phẩm (kể cả đã ẩn) vì hàng vẫn nằm trong kho.
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS dashboard_counters (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        active_products INTEGER NOT NULL DEFAULT 0, hidden_products INTEGER NOT NULL DEFAULT 0,
+        total_in_transactions INTEGER NOT NULL DEFAULT 0, total_out_transactions INTEGER NOT NULL DEFAULT 0,
+        total_revenue INTEGER NOT NULL DEFAULT 0, current_warehouse_value INTEGER NOT NULL DEFAULT 0
+    )''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_products_counters_insert
+    AFTER INSERT ON products
+    BEGIN
+        UPDATE dashboard_counters SET
+            active_products = active_products + (COALESCE(NEW.is_deleted, 0) = 0),
+            hidden_products = hidden_products + (COALESCE(NEW.is_deleted, 0) <> 0),
+            current_warehouse_value = current_warehouse_value + COALESCE(NEW.current_stock * NEW.price, 0)
+        WHERE id = 1;
+    END''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_products_counters_delete
+    AFTER DELETE ON products
+    BEGIN
+        UPDATE dashboard_counters SET
+            active_products = active_products - (COALESCE(OLD.is_deleted, 0) = 0),
+            hidden_products = hidden_products - (COALESCE(OLD.is_deleted, 0) <> 0),
+            current_warehouse_value = current_warehouse_value - COALESCE(OLD.current_stock * OLD.price, 0)
+        WHERE id = 1;
+    END''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_products_counters_update
+    AFTER UPDATE OF is_deleted, current_stock, price ON products
+    BEGIN
+        UPDATE dashboard_counters SET
+            active_products = active_products - (COALESCE(OLD.is_deleted, 0) = 0) + (COALESCE(NEW.is_deleted, 0) = 0),
+            hidden_products = hidden_products - (COALESCE(OLD.is_deleted, 0) <> 0) + (COALESCE(NEW.is_deleted, 0) <> 0),
+            current_warehouse_value = current_warehouse_value
+                - COALESCE(OLD.current_stock * OLD.price, 0) + COALESCE(NEW.current_stock * NEW.price, 0)
+        WHERE id = 1;
+    END''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_stock_transactions_counters_insert
+    AFTER INSERT ON stock_transactions
+    BEGIN
+        UPDATE dashboard_counters SET
+            total_in_transactions = total_in_transactions + (NEW.transaction_type = 'IN'),
+            total_out_transactions = total_out_transactions + (NEW.transaction_type = 'OUT'),
+            total_revenue = total_revenue + CASE WHEN NEW.transaction_type = 'OUT' THEN COALESCE(NEW.total_amount, 0) ELSE 0 END
+        WHERE id = 1;
+    END''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_stock_transactions_counters_delete
+    AFTER DELETE ON stock_transactions
+    BEGIN
+        UPDATE dashboard_counters SET
+            total_in_transactions = total_in_transactions - (OLD.transaction_type = 'IN'),
+            total_out_transactions = total_out_transactions - (OLD.transaction_type = 'OUT'),
+            total_revenue = total_revenue - CASE WHEN OLD.transaction_type = 'OUT' THEN COALESCE(OLD.total_amount, 0) ELSE 0 END
+        WHERE id = 1;
+    END''')
+    # Khởi tạo giá trị ban đầu từ dữ liệu hiện có.
+    cursor.execute("DELETE FROM dashboard_counters")
+    cursor.execute('''
+    INSERT INTO dashboard_counters (id, active_products, hidden_products, total_in_transactions,
+                                    total_out_transactions, total_revenue, current_warehouse_value)
+    SELECT 1,
+           (SELECT COUNT(*) FROM products WHERE COALESCE(is_deleted, 0) = 0),
+           (SELECT COUNT(*) FROM products WHERE COALESCE(is_deleted, 0) <> 0),
+           (SELECT COUNT(*) FROM stock_transactions WHERE transaction_type = 'IN'),
+           (SELECT COUNT(*) FROM stock_transactions WHERE transaction_type = 'OUT'),
+           (SELECT COALESCE(SUM(total_amount), 0) FROM stock_transactions WHERE transaction_type = 'OUT'),
+           (SELECT COALESCE(SUM(current_stock * price), 0) FROM products)''')
+
+def _migration_5_phien_ban_du_lieu(cursor):
+    """
+    Tạo bảng 'cache_versions' chứa các bộ đếm phiên bản dữ liệu dùng cho cache.
+    'report_data' tăng mỗi khi bảng 'products' hoặc 'stock_transactions' thay đổi,
+    nên mọi kết quả (biểu đồ) được cache kèm phiên bản cũ sẽ tự động hết hạn -
+    kể cả khi thay đổi đến từ một tiến trình worker khác.
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS cache_versions (
+        name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID''')
+    cursor.execute("INSERT OR IGNORE INTO cache_versions (name, version) VALUES ('report_data', 0)")
+    for table in ('products', 'stock_transactions'):
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_report_version_{event.lower()}
+            AFTER {event} ON {table}
+            BEGIN
+                UPDATE cache_versions SET version = version + 1 WHERE name = 'report_data';
+            END''')
+
+def _migration_6_index_phan_trang_san_pham(cursor):
+    """
+    Thêm index cho phân trang danh sách sản phẩm theo con trỏ với các cột sắp xếp trên giao diện
+    (tên đã có index từ migration 2). SQLite tự thêm rowid (id) vào cuối mỗi index nên
+    ORDER BY cột, id đọc thẳng theo index, không cần sắp xếp lại.
+    """
+    for column in ('sku', 'unit_of_measure', 'current_stock', 'price'):
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_products_deleted_{column} ON products (is_deleted, {column})")
+
+# Bảng chỉ mục tìm kiếm toàn văn của sản phẩm (FTS5).
+PRODUCT_SEARCH_TABLE = 'products_fts'
+# Bộ tách từ: bỏ dấu tiếng Việt; lập sẵn chỉ mục tiền tố 2 và 3 ký tự để tìm theo tiền tố nhanh.
+_PRODUCT_SEARCH_OPTIONS = ("tokenize = 'unicode61 remove_diacritics 2'", "prefix = '2 3'")
+
+def _product_search_values(row):
+    """Các giá trị (name, sku, description) được lập chỉ mục cho dòng `row` ('NEW', 'OLD', 'products')."""
+    return f"{sql_fold(f'{row}.name')}, {sql_sku_key(f'{row}.sku')}, {sql_fold(f'{row}.description')}"
+
+def create_product_search_index(cursor):
+    """
+    Tạo bảng FTS5 'products_fts' (rowid = products.id) chứa tên, SKU và mô tả của các sản phẩm
+    chưa bị ẩn, các trigger giữ bảng này đồng bộ với 'products', rồi nạp dữ liệu hiện có.
+    Trigger chỉ chạy khi các cột được lập chỉ mục (hoặc cờ ẩn) thay đổi, nên nhập/xuất kho
+    (chỉ cập nhật tồn kho) không tốn thêm chi phí.
+
+    Returns:
+        bool: False nếu SQLite không hỗ trợ FTS5 (khi đó tìm kiếm dùng LIKE).
+    """
+    try:
+        cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {PRODUCT_SEARCH_TABLE} "
+                       f"USING fts5(name, sku, description, {', '.join(_PRODUCT_SEARCH_OPTIONS)})")
+    except sqlite3.OperationalError:
+        return False
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_products_search_insert AFTER INSERT ON products
+    WHEN NEW.is_deleted = 0
+    BEGIN
+        INSERT INTO {PRODUCT_SEARCH_TABLE} (rowid, name, sku, description) VALUES (NEW.id, {_product_search_values('NEW')});
+    END''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_products_search_update AFTER UPDATE OF name, sku, description, is_deleted ON products
+    BEGIN
+        DELETE FROM {PRODUCT_SEARCH_TABLE} WHERE rowid = OLD.id;
+        INSERT INTO {PRODUCT_SEARCH_TABLE} (rowid, name, sku, description)
+        SELECT NEW.id, {_product_search_values('NEW')} WHERE NEW.is_deleted = 0;
+    END''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_products_search_delete AFTER DELETE ON products
+    BEGIN
+        DELETE FROM {PRODUCT_SEARCH_TABLE} WHERE rowid = OLD.id;
+    END''')
+    cursor.execute(f"DELETE FROM {PRODUCT_SEARCH_TABLE}")
+    cursor.execute(f'''
+    INSERT INTO {PRODUCT_SEARCH_TABLE} (rowid, name, sku, description)
+    SELECT id, {_product_search_values('products')} FROM products WHERE is_deleted = 0''')
+    cursor.execute(f"INSERT INTO {PRODUCT_SEARCH_TABLE} ({PRODUCT_SEARCH_TABLE}) VALUES ('optimize')")
+    return True
+
+def _migration_7_tim_kiem_toan_van(cursor):
+    """
+    Tạo chỉ mục tìm kiếm toàn văn cho sản phẩm (xem `create_product_search_index`).
+    Nếu SQLite không có FTS5, migration vẫn hoàn tất và tìm kiếm tiếp tục dùng LIKE;
+    sau khi nâng cấp SQLite có thể tạo chỉ mục bằng lệnh `--rebuild-search-index`.
+    """
+    create_product_search_index(cursor)
+
+def _migration_8_phien_ban_danh_muc(cursor):
+    """
+    Thêm bộ đếm 'product_catalog' vào 'cache_versions': tăng mỗi khi danh mục sản phẩm
+    (SKU, tên, trạng thái ẩn) thay đổi - nhưng không tăng khi chỉ tồn kho thay đổi. Các chỉ mục
+    trong bộ nhớ của từng tiến trình (gợi ý sản phẩm) dựa vào bộ đếm này để biết khi nào cần nạp lại.
+    """
+    cursor.execute("INSERT OR IGNORE INTO cache_versions (name, version) VALUES ('product_catalog', 0)")
+    for event in ('INSERT', 'UPDATE OF sku, name, is_deleted', 'DELETE'):
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_products_catalog_version_{event.split()[0].lower()}
+        AFTER {event} ON products
+        BEGIN
+            UPDATE cache_versions SET version = version + 1 WHERE name = 'product_catalog';
+        END''')
+
+# Số dòng gần nhất được giữ lại trong nhật ký thay đổi sản phẩm 'product_changes'.
+PRODUCT_CHANGES_RETAIN = 10000
+
+def _migration_9_nhat_ky_thay_doi_san_pham(cursor):
+    """
+    Tạo bảng 'product_changes': nhật ký (seq tăng dần, product_id) ghi lại mỗi lần một dòng của
+    'products' bị sửa hoặc xóa, kể cả khi chỉ tồn kho thay đổi. Cache sản phẩm của từng tiến trình
+    đọc các dòng có seq mới hơn lần kiểm tra trước để chỉ bỏ đúng các sản phẩm bị tiến trình khác
+    thay đổi. Trigger chỉ giữ lại PRODUCT_CHANGES_RETAIN dòng mới nhất.
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS product_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT, product_id INTEGER NOT NULL
+    )''')
+    for event, row in (('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_products_change_log_{event.lower()}
+        AFTER {event} ON products
+        BEGIN
+            INSERT INTO product_changes (product_id) VALUES ({row}.id);
+            DELETE FROM product_changes WHERE seq <= last_insert_rowid() - {PRODUCT_CHANGES_RETAIN};
+        END''')
+
+# Danh sách migration theo thứ tự: (phiên_bản, mô_tả, hàm_thực_hiện).
+MIGRATIONS = [
+    (1, "Tạo bảng products và stock_transactions", _migration_1_tao_bang_co_ban),
+    (2, "Thêm index cho truy vấn theo thời gian và danh sách sản phẩm", _migration_2_index_truy_van),
+    (3, "Tạo bảng tổng hợp theo ngày daily_product_rollup", _migration_3_bang_tong_hop_ngay),
+    (4, "Tạo bảng bộ đếm dashboard_counters cho trang chủ", _migration_4_bo_dem_dashboard),
+    (5, "Tạo bảng cache_versions đánh dấu phiên bản dữ liệu cho cache", _migration_5_phien_ban_du_lieu),
+    (6, "Thêm index cho phân trang sản phẩm theo các cột sắp xếp", _migration_6_index_phan_trang_san_pham),
+    (7, "Tạo chỉ mục tìm kiếm toàn văn products_fts cho sản phẩm", _migration_7_tim_kiem_toan_van),
+    (8, "Thêm bộ đếm phiên bản danh mục sản phẩm product_catalog", _migration_8_phien_ban_danh_muc),
+    (9, "Tạo nhật ký thay đổi sản phẩm product_changes cho cache", _migration_9_nhat_ky_thay_doi_san_pham),
+]
+
+LATEST_SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(conn):
+    """Đọc phiên bản schema hiện tại của database."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def run_migrations(db_name=DB_NAME):
+    """
+    Áp dụng lần lượt các migration còn thiếu cho database.
+    Nếu database đã ở phiên bản mới nhất, hàm chỉ tốn một lệnh đọc `PRAGMA user_version`.
+
+    Args:
+        db_name (str): Đường dẫn file database.
+
+    Returns:
+        list: Danh sách (phiên_bản, mô_tả) của các migration vừa được áp dụng.
+
+    Raises:
+        sqlite3.Error: Nếu một migration thất bại (migration đó đã được rollback).
+    """
+    # isolation_level=None: tự quản lý BEGIN/COMMIT để DDL nằm trọn trong transaction.
+    conn = sqlite3.connect(db_name, isolation_level=None)
+    applied = []
+    try:
+        if get_schema_version(conn) >= LATEST_SCHEMA_VERSION:
+            return applied
+        for version, description, migrate in MIGRATIONS:
+            # BEGIN IMMEDIATE và kiểm tra lại phiên bản bên trong transaction, để nhiều
+            # tiến trình khởi động cùng lúc không áp dụng trùng một migration.
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if get_schema_version(conn) >= version:
+                    conn.execute("COMMIT")
+                    continue
+                migrate(conn.cursor())
+                conn.execute(f"PRAGMA user_version = {int(version)}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            applied.append((version, description))
+        return applied
+    finally:
+        conn.close()
@@ -0,0 +1,259 @@
+# /src/backend/common/multipart.py
+# File này chứa bộ phân tích (parser) dữ liệu form dạng multipart/form-data theo kiểu
+# luồng (streaming), thay thế cho `cgi.parse_multipart` (module `cgi` đã bị loại bỏ
+# khỏi các phiên bản Python mới). Phần nội dung file tải lên được ghi thẳng ra
+# file tạm theo từng khối có kích thước giới hạn, nên bộ nhớ sử dụng không phụ thuộc
+# vào kích thước file.
+
+import os
+import tempfile
+
+# Kích thước tối đa (bytes) của toàn bộ request body được chấp nhận.
+MAX_UPLOAD_SIZE = 50 * 1024 * 1024
+# Kích thước mỗi lần đọc từ socket.
+READ_CHUNK_SIZE = 64 * 1024
+# Giới hạn kích thước phần header của mỗi part (tránh header dài bất thường).
+MAX_PART_HEADER_SIZE = 16 * 1024
+# Tên trường chứa nguyên văn body (bytes) của các request không phải form, ví dụ JSON của API.
+RAW_BODY_FIELD = '__body__'
+# Tên file tạm dùng khi tên file gốc rỗng hoặc không dùng được làm tên file ('.', '..').
+DEFAULT_UPLOAD_FILENAME = 'upload.csv'
+
+class MultipartError(ValueError):
+    """Lỗi khi dữ liệu multipart không đúng định dạng."""
+
+class UploadTooLargeError(MultipartError):
+    """Lỗi khi request body vượt quá giới hạn kích thước cho phép."""
+
+class UploadedFile:
+    """
+    Đại diện cho một file được tải lên, đã được lưu vào file tạm trên đĩa.
+
+    Attributes:
+        filename (str): Tên file gốc phía client.
+        path (str): Đường dẫn file tạm chứa nội dung.
+        size (int): Kích thước nội dung (bytes).
+    """
+
+    def __init__(self, filename, path, size=0):
+        self.filename = filename
+        self.path = path
+        self.size = size
+
+    def cleanup(self):
+        """Xóa file tạm (và thư mục tạm chứa nó) nếu còn tồn tại."""
+        if self.path and os.path.isfile(self.path):
+            os.remove(self.path)
+        tmp_dir = os.path.dirname(self.path or '')
+        if os.path.basename(tmp_dir).startswith('miniventory_upload_'):
+            try:
+                os.rmdir(tmp_dir)
+            except OSError:
+                pass
+
+    def __repr__(self):
+        return f"UploadedFile(filename={self.filename!r}, path={self.path!r}, size={self.size})"
+
+def parse_header(line):
+    """
+    Phân tích một header dạng `value; key1=val1; key2="val 2"` (thay cho `cgi.parse_header`).
+
+    Returns:
+        tuple: (giá_trị_chính_viết_thường, dict_tham_số)
+    """
+    parts = _split_header_params(line or '')
+    main_value = parts[0].strip().lower() if parts else ''
+    params = {}
+    for item in parts[1:]:
+        if '=' not in item:
+            continue
+        key, value = item.split('=', 1)
+        key, value = key.strip().lower(), value.strip()
+        if len(value) >= 2 and value[0] == value[-1] == '"':
+            value = value[1:-1].replace('\\\\', '\\').replace('\\"', '"')
+        params[key] = value
+    return main_value, params
+
+def _split_header_params(line):
+    """Tách header theo dấu ';' nhưng bỏ qua các dấu ';' nằm trong cặp nháy kép."""
+    parts, current, in_quotes, escaped = [], [], False, False
+    for ch in line:
+        if escaped:
+            current.append(ch)
+            escaped = False
+        elif ch == '\\' and in_quotes:
+            current.append(ch)
+            escaped = True
+        elif ch == '"':
+            current.append(ch)
+            in_quotes = not in_quotes
+        elif ch == ';' and not in_quotes:
+            parts.append(''.join(current))
+            current = []
+        else:
+            current.append(ch)
+    parts.append(''.join(current))
+    return parts
+
+def _decode_text(value_bytes):
+    """Giải mã giá trị của trường văn bản, ưu tiên UTF-8."""
+    try:
+        return value_bytes.decode('utf-8')
+    except UnicodeDecodeError:
+        return value_bytes.decode('latin-1', errors='ignore')
+
+class _MultipartStream:
+    """Đọc request body theo khối (không vượt quá Content-Length) và giữ bộ đệm nhỏ."""
+
+    def __init__(self, rfile, content_length):
+        self.rfile = rfile
+        self.remaining = content_length
+        self.buffer = b''
+
+    def fill(self):
+        """Đọc thêm một khối vào bộ đệm. Trả về False nếu đã hết dữ liệu."""
+        if self.remaining <= 0:
+            return False
+        data = self.rfile.read(min(READ_CHUNK_SIZE, self.remaining))
+        if not data:
+            self.remaining = 0
+            return False
+        self.remaining -= len(data)
+        self.buffer += data
+        return True
+
+    def drain(self):
+        """Đọc bỏ phần body còn lại để kết nối không bị lệch dữ liệu."""
+        self.buffer = b''
+        while self.fill():
+            self.buffer = b''
+
+    def skip_past(self, marker, error_message):
+        """Bỏ qua dữ liệu cho tới hết `marker` đầu tiên."""
+        while True:
+            idx = self.buffer.find(marker)
+            if idx != -1:
+                self.buffer = self.buffer[idx + len(marker):]
+                return
+            self.buffer = self.buffer[-len(marker):]
+            if not self.fill():
+                raise MultipartError(error_message)
+
+    def read_headers(self):
+        """Đọc khối header của một part, trả về dict {tên_header_viết_thường: giá_trị}."""
+        while b'\r\n\r\n' not in self.buffer:
+            if len(self.buffer) > MAX_PART_HEADER_SIZE or not self.fill():
+                raise MultipartError("Header của một phần dữ liệu không hợp lệ.")
+        raw_headers, self.buffer = self.buffer.split(b'\r\n\r\n', 1)
+        headers = {}
+        for line in raw_headers.decode('utf-8', errors='replace').split('\r\n'):
+            if ':' in line:
+                key, value = line.split(':', 1)
+                headers[key.strip().lower()] = value.strip()
+        return headers
+
+    def copy_until(self, marker, write):
+        """
+        Chuyển nội dung tới `write` theo từng khối cho tới `marker`, luôn giữ lại
+        trong bộ đệm đủ số byte để không cắt đôi marker. Trả về tổng số byte đã ghi.
+        """
+        written = 0
+        keep = len(marker)
+        while True:
+            idx = self.buffer.find(marker)
+            if idx != -1:
+                if idx:
+                    write(self.buffer[:idx])
+                    written += idx
+                self.buffer = self.buffer[idx + len(marker):]
+                return written
+            if len(self.buffer) > keep:
+                chunk = self.buffer[:-keep]
+                write(chunk)
+                written += len(chunk)
+                self.buffer = self.buffer[-keep:]
+            if not self.fill():
+                raise MultipartError("Dữ liệu multipart bị cắt ngang (thiếu boundary kết thúc).")
+
+def parse_multipart_stream(rfile, boundary, content_length, max_size=None, tmp_dir=None):
+    """
+    Phân tích request body dạng multipart/form-data theo luồng.
+    Các trường văn bản được trả về dưới dạng chuỗi; các trường file được ghi ra
+    file tạm và trả về dưới dạng `UploadedFile`. Người gọi có trách nhiệm gọi
+    `cleanup_uploaded_files` sau khi xử lý xong.
+
+    Args:
+        rfile: Luồng đọc của request (handler.rfile).
+        boundary (str): Chuỗi boundary lấy từ header Content-Type.
+        content_length (int): Độ dài body (header Content-Length).
+        max_size (int, optional): Kích thước body tối đa cho phép (mặc định MAX_UPLOAD_SIZE).
+        tmp_dir (str, optional): Thư mục chứa file tạm (mặc định là thư mục tạm của hệ thống).
+
+    Returns:
+        dict: {tên_trường: [giá_trị, ...]} giống định dạng của `parse_qs`.
+
+    Raises:
+        UploadTooLargeError: Nếu body vượt quá `max_size` (khi đó body không được đọc).
+        MultipartError: Nếu dữ liệu không đúng định dạng multipart.
+    """
+    if max_size is None:
+        max_size = MAX_UPLOAD_SIZE
+    if content_length > max_size:
+        raise UploadTooLargeError(f"Dữ liệu tải lên vượt quá giới hạn {max_size // (1024 * 1024)} MB.")
+
+    stream = _MultipartStream(rfile, content_length)
+    fields = {}
+    try:
+        if not boundary:
+            raise MultipartError("Thiếu boundary trong Content-Type.")
+        delimiter = b'--' + boundary.encode('latin-1')
+        # Giữa các part, delimiter luôn đứng sau CRLF.
+        part_delimiter = b'\r\n' + delimiter
+
+        # Bỏ qua phần mở đầu (preamble) cho tới delimiter đầu tiên.
+        stream.skip_past(delimiter, "Không tìm thấy boundary trong dữ liệu gửi lên.")
+        while True:
+            # Sau delimiter: '--' nghĩa là kết thúc, CRLF nghĩa là còn part tiếp theo.
+            while len(stream.buffer) < 2 and stream.fill():
+                pass
+            if stream.buffer.startswith(b'--'):
+                break
+            if not stream.buffer.startswith(b'\r\n'):
+                raise MultipartError("Dữ liệu multipart không hợp lệ sau boundary.")
+            stream.buffer = stream.buffer[2:]
+
+            headers = stream.read_headers()
+            _, disposition = parse_header(headers.get('content-disposition', ''))
+            name = disposition.get('name')
+            filename = disposition.get('filename')
+
+            if filename is not None:
+                # Part là file: ghi thẳng ra file tạm theo từng khối.
+                # Mỗi file nằm trong một thư mục tạm riêng và giữ tên gốc, để các thông báo
+                # kết quả (vd: "Hoàn tất xử lý file 'nhap_kho.csv'") hiển thị đúng tên file.
+                safe_name = os.path.basename(filename.replace('\\', '/')).strip()
+                if safe_name in ('', '.', '..'):
+                    safe_name = DEFAULT_UPLOAD_FILENAME
+                tmp_path = os.path.join(tempfile.mkdtemp(prefix='miniventory_upload_', dir=tmp_dir), safe_name)
+                uploaded = UploadedFile(safe_name, tmp_path)
+                fields.setdefault(name or '', []).append(uploaded)
+                with open(tmp_path, 'wb') as sink:
+                    uploaded.size = stream.copy_until(part_delimiter, sink.write)
+            else:
+                collected = []
+                stream.copy_until(part_delimiter, collected.append)
+                if name:
+                    fields.setdefault(name, []).append(_decode_text(b''.join(collected)))
+    except Exception:
+        cleanup_uploaded_files(fields)
+        raise
+    finally:
+        stream.drain()
+    return fields
+
+def cleanup_uploaded_files(fields):
+    """Xóa tất cả các file tạm trong một dict fields do `parse_multipart_stream` trả về."""
+    for values in fields.values():
+        for value in values:
+            if isinstance(value, UploadedFile):
+                value.cleanup()
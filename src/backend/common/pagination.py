@@ -0,0 +1,128 @@
+# /src/backend/common/pagination.py
+# File này chứa các hàm dùng chung cho phân trang kiểu "keyset" (con trỏ / cursor):
+# thay vì OFFSET (SQLite phải đọc rồi bỏ qua tất cả các dòng phía trước), mỗi trang
+# bắt đầu ngay sau khóa sắp xếp (giá_trị_cột_sắp_xếp, id) của dòng cuối trang trước.
+# Với index phù hợp, thời gian lấy một trang không phụ thuộc vào kích thước bảng.
+
+import base64
+import json
+
+# Số dòng mặc định / tối đa trên một trang.
+PAGE_SIZE_DEFAULT = 50
+PAGE_SIZE_MAX = 500
+# Tên cột (trong câu SELECT) chứa giá trị sắp xếp thô dùng để tạo con trỏ.
+SORT_KEY_COLUMN = 'sort_key'
+
+def encode_cursor(sort_value, row_id):
+    """Mã hóa khóa (giá_trị_sắp_xếp, id) của một dòng thành chuỗi an toàn cho URL."""
+    raw = json.dumps([sort_value, row_id], ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(token):
+    """
+    Giải mã con trỏ do `encode_cursor` tạo ra.
+
+    Returns:
+        tuple: (giá_trị_sắp_xếp, id) hoặc None nếu con trỏ rỗng / không hợp lệ.
+    """
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        sort_value, row_id = json.loads(raw.decode('utf-8'))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(row_id, int) or isinstance(sort_value, (list, dict)):
+        return None
+    return sort_value, row_id
+
+def parse_page_size(raw_value, default=PAGE_SIZE_DEFAULT):
+    """Đọc kích thước trang từ chuỗi, giới hạn trong [1, PAGE_SIZE_MAX]."""
+    try:
+        return max(1, min(int(raw_value), PAGE_SIZE_MAX))
+    except (TypeError, ValueError):
+        return default
+
+def keyset_condition(column, id_column, cursor, ascending, nullable=True):
+    """
+    Tạo điều kiện WHERE chọn các dòng nằm SAU con trỏ theo thứ tự `ORDER BY column, id_column`
+    (cùng chiều `ascending`). SQLite xếp NULL trước mọi giá trị khi tăng dần, nên NULL được
+    xử lý riêng để không dòng nào bị bỏ sót hay lặp lại giữa các trang. Nhánh `OR column IS NULL`
+    khiến SQLite không tìm thẳng (seek) trên index được, nên chỉ thêm vào khi cột có thể NULL.
+
+    Args:
+        column (str): Cột sắp xếp (đã được kiểm tra hợp lệ, không lấy trực tiếp từ người dùng).
+        id_column (str): Cột khóa chính dùng để phân định các dòng có cùng giá trị sắp xếp.
+        cursor (tuple): (giá_trị_sắp_xếp, id) của dòng cuối trang trước.
+        ascending (bool): Chiều sắp xếp.
+        nullable (bool): Cột sắp xếp có thể chứa NULL hay không.
+
+    Returns:
+        tuple: (str_điều_kiện_sql, list_tham_số)
+    """
+    sort_value, row_id = cursor
+    op = '>' if ascending else '<'
+    if sort_value is None:
+        if ascending:
+            return f"(({column} IS NULL AND {id_column} > ?) OR {column} IS NOT NULL)", [row_id]
+        return f"({column} IS NULL AND {id_column} < ?)", [row_id]
+    # So sánh bộ giá trị (row value) để SQLite dùng được index trên (column, id); thêm cận
+    # `column >= / <= ?` để cả index chỉ có riêng `column` cũng giới hạn được khoảng cần quét.
+    condition = f"{column} {op}= ? AND ({column}, {id_column}) {op} (?, ?)"
+    if not ascending and nullable:
+        return f"(({condition}) OR {column} IS NULL)", [sort_value, sort_value, row_id]
+    return condition, [sort_value, sort_value, row_id]
+
+def fetch_keyset_page(conn, select_sql, where_conditions, params, sort_column, id_column,
+                      ascending, limit, after=None, before=None, nullable=True):
+    """
+    Lấy một trang dữ liệu theo con trỏ.
+
+    Args:
+        conn: Kết nối SQLite.
+        select_sql (str): Phần 'SELECT ... FROM ...' (chưa có WHERE/ORDER BY/LIMIT). Phải có cột
+            'id' và cột SORT_KEY_COLUMN chứa giá trị sắp xếp thô như lưu trong DB (vd
+            `CAST(updated_at AS TEXT) AS sort_key`) để tạo con trỏ; cột này bị bỏ khỏi kết quả.
+        where_conditions (list): Các điều kiện lọc (nối bằng AND).
+        params (list): Tham số cho các điều kiện lọc.
+        sort_column, id_column (str): Cột sắp xếp và cột khóa chính (tên dùng trong SQL).
+        ascending (bool): Chiều sắp xếp của danh sách.
+        limit (int): Số dòng tối đa trên trang.
+        after (str): Con trỏ - lấy trang ngay sau dòng này (trang kế tiếp).
+        before (str): Con trỏ - lấy trang ngay trước dòng này (trang trước).
+        nullable (bool): Cột sắp xếp có thể chứa NULL hay không (xem `keyset_condition`).
+
+    Returns:
+        dict: {'items': list_dòng, 'next': con_trỏ_trang_sau hoặc None, 'prev': con_trỏ_trang_trước hoặc None}
+    """
+    after_key, before_key = decode_cursor(after), decode_cursor(before)
+    backwards = before_key is not None and after_key is None
+    conditions, query_params = list(where_conditions), list(params)
+    cursor_key = before_key if backwards else after_key
+    # Trang trước = đọc ngược chiều từ con trỏ rồi đảo lại kết quả.
+    scan_ascending = ascending != backwards
+    if cursor_key is not None:
+        condition, condition_params = keyset_condition(sort_column, id_column, cursor_key, scan_ascending, nullable)
+        conditions.append(condition)
+        query_params += condition_params
+
+    direction = 'ASC' if scan_ascending else 'DESC'
+    where_clause = " AND ".join(conditions) if conditions else "1=1"
+    query = f"{select_sql} WHERE {where_clause} ORDER BY {sort_column} {direction}, {id_column} {direction} LIMIT ?"
+    # Lấy thêm một dòng để biết còn dữ liệu phía sau hay không.
+    rows = [dict(row) for row in conn.execute(query, query_params + [limit + 1]).fetchall()]
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+    keys = [encode_cursor(row.pop(SORT_KEY_COLUMN), row['id']) for row in rows]
+
+    next_cursor = prev_cursor = None
+    if rows:
+        # Đi lùi thì luôn còn trang sau (chính dòng con trỏ); đi tiếp thì còn nếu đọc được dư một dòng.
+        if backwards or has_more:
+            next_cursor = keys[-1]
+        # Ngược lại cho trang trước: đi tiếp từ một con trỏ thì luôn có trang trước.
+        if (backwards and has_more) or (not backwards and cursor_key is not None):
+            prev_cursor = keys[0]
+    return {'items': rows, 'next': next_cursor, 'prev': prev_cursor}
@@ -5,48 +5,123 @@
 import csv
 import os
 from datetime import datetime
+from .log_writer import log_writer, OVERFLOW_DROP
+from .journal import transaction_journal, JOURNAL_FILE
 
 # Định nghĩa hằng số cho tên file log để dễ dàng thay đổi và quản lý.
 FILE_LOG_LOI = 'log.txt'
-FILE_LICH_SU_GIAO_DICH = 'lichsugiaodich.txt'
+FILE_LICH_SU_GIAO_DICH = JOURNAL_FILE
 
 def ghi_log_loi(thong_bao_loi):
     """
     Ghi một thông báo lỗi (hoặc thông báo hệ thống) vào file log lỗi
     kèm theo timestamp hiện tại.
+    Dòng log được ghi bởi luồng nền (xem log_writer.py); nếu hàng đợi ghi log
+    đầy thì dòng log bị bỏ qua (có đếm và ghi thông báo) thay vì làm chậm request.
 
     Args:
         thong_bao_loi (str): Nội dung thông báo cần ghi.
     """
-    try:
-        with open(FILE_LOG_LOI, 'a', encoding='utf-8') as f:
-            f.write(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {thong_bao_loi}\n")
-    except IOError:
-        # In ra console nếu không thể ghi file, đây là một lỗi nghiêm trọng.
-        print(f"LỖI HỆ THỐNG NGHIÊM TRỌNG: Không thể ghi vào file log: {FILE_LOG_LOI}")
+    log_writer.write(FILE_LOG_LOI, f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {thong_bao_loi}\n",
+                     overflow=OVERFLOW_DROP)
 
-def ghi_log_giao_dich(thong_tin_giao_dich):
+def ghi_log_giao_dich(thong_tin_giao_dich, event=None, sku=None, file=None, ok=None, total=None, user=None):
     """
-    Ghi một thông tin tóm tắt về giao dịch vào file lịch sử giao dịch
-    kèm theo timestamp.
+    Ghi một bản ghi tóm tắt giao dịch vào nhật ký giao dịch có chỉ mục (xem journal.py),
+    kèm theo timestamp và các trường có kiểu để tra cứu trên trang /audit.
+    Bản ghi được ghi bởi luồng nền (xem log_writer.py); nhật ký giao dịch không
+    được phép mất bản ghi nào nên khi hàng đợi đầy, hàm này chờ đến khi có chỗ.
 
     Args:
         thong_tin_giao_dich (str): Nội dung tóm tắt giao dịch.
+        event (str, optional): Loại sự kiện (mặc định: phần trước dấu ':' của nội dung).
+        sku, file, ok, total, user (optional): SKU sản phẩm, tên file CSV, số dòng thành công /
+            tổng số dòng, người thực hiện.
+    """
+    transaction_journal.append(thong_tin_giao_dich, event=event, sku=sku, file=file, ok=ok, total=total, user=user)
+
+# Các biến thể tên cột được chấp nhận (đã chuẩn hóa: chữ thường, bỏ khoảng trắng hai đầu).
+CAC_COT_MA_SP = ['masp', 'mãsp', 'mã sp', 'sku']
+CAC_COT_SO_LUONG = ['soluong', 'sốlượng', 'soluongnhap', 'soluongxuat', 'quantity']
+CAC_COT_GHI_CHU = ['ghichu', 'ghi chú', 'notes', 'note', 'diengiai']
+
+def _xac_dinh_cot_csv(fieldnames, ten_file):
+    """
+    Xác định vị trí các cột Mã SP, Số lượng và Ghi chú (tùy chọn) từ dòng header.
+
+    Returns:
+        tuple: ((vị_trí_cột_sku, vị_trí_cột_số_lượng, vị_trí_cột_ghi_chú_hoặc_None), None)
+               hoặc (None, thông_báo_lỗi) nếu thiếu cột bắt buộc.
     """
+    # Chuẩn hóa tên cột: chuyển thành chữ thường và xóa khoảng trắng để so sánh.
+    actual_cols = [col.strip().lower() for col in fieldnames]
+
+    def tim_cot(possible_cols):
+        return next((actual_cols.index(col) for col in possible_cols if col in actual_cols), None)
+
+    sku_idx = tim_cot(CAC_COT_MA_SP)
+    if sku_idx is None:
+        return None, f"Lỗi: File '{ten_file}' thiếu cột Mã Sản Phẩm (ví dụ: maSP, SKU)."
+    qty_idx = tim_cot(CAC_COT_SO_LUONG)
+    if qty_idx is None:
+        return None, f"Lỗi: File '{ten_file}' thiếu cột Số Lượng (ví dụ: soLuong)."
+    return (sku_idx, qty_idx, tim_cot(CAC_COT_GHI_CHU)), None
+
+def doc_file_csv_theo_luong(ten_file):
+    """
+    Mở file CSV nhập/xuất kho và trả về một generator đọc từng dòng (streaming).
+    Header chỉ được phân tích một lần; mỗi dòng chỉ sinh ra đúng ba trường đã chuẩn hóa
+    ('maSP', 'soLuongProcessed', 'ghiChu'), không giữ lại toàn bộ file trong bộ nhớ.
+
+    Args:
+        ten_file (str): Đường dẫn đến file CSV.
+
+    Returns:
+        tuple: (generator_các_dòng, None) nếu header hợp lệ,
+               hoặc (None, thông_báo_lỗi) nếu file không tồn tại / thiếu cột.
+               Generator có thể ném `csv.Error` nếu gặp dòng sai định dạng giữa chừng.
+    """
+    if not os.path.exists(ten_file):
+        ghi_log_loi(f"Đọc file CSV: File '{ten_file}' không tồn tại.")
+        return None, f"Lỗi: File '{ten_file}' không tồn tại."
+    # Mở file với encoding 'utf-8-sig' để xử lý ký tự BOM (Byte Order Mark) nếu có.
+    file = open(ten_file, mode='r', encoding='utf-8-sig', newline='')
+    try:
+        reader = csv.reader(file)
+        fieldnames = next(reader, None)
+        if not fieldnames:
+            file.close()
+            return None, f"Lỗi: File '{ten_file}' trống hoặc không có header."
+        columns, error_msg = _xac_dinh_cot_csv(fieldnames, ten_file)
+        if error_msg:
+            file.close()
+            return None, error_msg
+    except Exception:
+        file.close()
+        raise
+    return _sinh_dong_csv(file, reader, *columns), None
+
+def _sinh_dong_csv(file, reader, sku_idx, qty_idx, notes_idx):
+    """Generator sinh các dòng đã chuẩn hóa; tự đóng file khi đọc xong hoặc bị hủy."""
     try:
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        with open(FILE_LICH_SU_GIAO_DICH, 'a', encoding='utf-8') as f:
-            f.write(f"[{timestamp}] {thong_tin_giao_dich}\n")
-    except IOError:
-        msg = f"Lỗi IO khi ghi log giao dịch vào file: {FILE_LICH_SU_GIAO_DICH}"
-        print(msg)
-        ghi_log_loi(f"Không thể ghi log giao dịch (text) vào file: {msg}")
+        for row in reader:
+            if not row:
+                continue # Bỏ qua dòng trống giống csv.DictReader
+            n = len(row)
+            yield {
+                'maSP': row[sku_idx].strip() if sku_idx < n else '',
+                'soLuongProcessed': row[qty_idx].strip() if qty_idx < n else '',
+                'ghiChu': row[notes_idx].strip() if notes_idx is not None and notes_idx < n else ''
+            }
+    finally:
+        file.close()
 
 def doc_file_csv_cho_nhap_xuat(ten_file):
     """
     Đọc và phân tích file CSV cho chức năng nhập/xuất kho hàng loạt.
     Hàm này được thiết kế linh hoạt để chấp nhận nhiều biến thể tên cột phổ biến
     (ví dụ: 'maSP', 'sku', 'soLuong', 'quantity').
+    Đọc toàn bộ file vào bộ nhớ; với file lớn nên dùng `doc_file_csv_theo_luong`.
 
     Args:
         ten_file (str): Đường dẫn đến file CSV.
@@ -57,56 +132,11 @@ def doc_file_csv_cho_nhap_xuat(ten_file):
                - thông_báo_trạng_thái: String mô tả kết quả đọc file.
                Trả về (None, thông_báo_lỗi) nếu có lỗi nghiêm trọng không thể xử lý.
     """
-    data_rows = []
-    if not os.path.exists(ten_file):
-        ghi_log_loi(f"Đọc file CSV: File '{ten_file}' không tồn tại.")
-        return None, f"Lỗi: File '{ten_file}' không tồn tại."
     try:
-        # Mở file với encoding 'utf-8-sig' để xử lý ký tự BOM (Byte Order Mark) nếu có.
-        with open(ten_file, mode='r', encoding='utf-8-sig') as file:
-            reader = csv.DictReader(file)
-            if not reader.fieldnames:
-                 return None, f"Lỗi: File '{ten_file}' trống hoặc không có header."
-
-            # Chuẩn hóa tên cột: chuyển thành chữ thường và xóa khoảng trắng để so sánh.
-            actual_cols = [col.strip().lower() for col in reader.fieldnames]
-
-            # Tìm tên cột Mã Sản Phẩm thực tế trong file dựa trên danh sách các tên có thể có.
-            sku_col_name = None
-            possible_sku_cols = ['masp', 'mãsp', 'mã sp', 'sku']
-            for col_name in possible_sku_cols:
-                if col_name in actual_cols:
-                    sku_col_name = reader.fieldnames[actual_cols.index(col_name)] 
-                    break
-            if not sku_col_name:
-                return None, f"Lỗi: File '{ten_file}' thiếu cột Mã Sản Phẩm (ví dụ: maSP, SKU)."
-
-            # Tương tự, tìm tên cột Số Lượng.
-            qty_col_name = None
-            possible_qty_cols = ['soluong', 'sốlượng', 'soluongnhap', 'soluongxuat', 'quantity']
-            for col_name in possible_qty_cols:
-                if col_name in actual_cols:
-                    qty_col_name = reader.fieldnames[actual_cols.index(col_name)]
-                    break
-            if not qty_col_name:
-                 return None, f"Lỗi: File '{ten_file}' thiếu cột Số Lượng (ví dụ: soLuong)."
-            # Tìm các cột tùy chọn (ghi chú).
-            notes_col_name = next((reader.fieldnames[actual_cols.index(col)] for col in ['ghichu', 'ghi chú', 'notes', 'note', 'diengiai'] if col in actual_cols), None)
-            
-            # Đọc và xử lý từng dòng trong file CSV.
-            for row_dict_original in reader:
-                # Làm sạch dữ liệu: xóa khoảng trắng thừa.
-                cleaned_row = {key.strip(): str(value).strip() if value is not None else '' 
-                               for key, value in row_dict_original.items()}
-
-                # Tạo một dictionary mới với các key đã được chuẩn hóa.
-                processed_entry = {
-                    'maSP': cleaned_row.get(sku_col_name, ''),
-                    'soLuongProcessed': cleaned_row.get(qty_col_name, '0'),
-                    'ghiChu': cleaned_row.get(notes_col_name, '') if notes_col_name else ''
-                }
-                
-                data_rows.append(processed_entry)
+        rows_iter, error_msg = doc_file_csv_theo_luong(ten_file)
+        if rows_iter is None:
+            return None, error_msg
+        data_rows = list(rows_iter)
         
         if not data_rows:
             return [], "Thông báo: File CSV không có dữ liệu."
@@ -0,0 +1,212 @@
+# /src/backend/common/routing.py
+# File này chứa bảng định tuyến (route registry) của server:
+#   - Mỗi route gồm phương thức HTTP, mẫu đường dẫn và hàm xử lý.
+#   - Đường dẫn cố định (vd: '/products/add') được tra trong dict: O(1).
+#   - Đường dẫn có tham số (vd: '/products/edit/<int:product_id>') được biên dịch sẵn
+#     thành biểu thức chính quy một lần khi đăng ký; tham số được chuyển kiểu tự động.
+#   - Mỗi route mang thêm thông tin (metadata) về cache, đo thời gian và quyền truy cập.
+
+import re
+import threading
+
+# Các kiểu tham số hỗ trợ trong mẫu đường dẫn: tên -> (biểu thức chính quy, hàm chuyển kiểu).
+PARAM_CONVERTERS = {
+    'int': (r'\d+', int),
+    'str': (r'[^/]+', str),
+}
+_PARAM_PATTERN = re.compile(r'<(?:(\w+):)?(\w+)>')
+
+# Kiểu phản hồi của route:
+#   'page': hàm xử lý trả về (tiêu_đề, nội_dung_html), router bọc vào template chung rồi gửi.
+#           nội_dung_html có thể là generator các mảnh HTML: trang được gửi dạng luồng (chunked).
+#   'raw' : hàm xử lý tự gửi phản hồi (redirect, ảnh, file tĩnh, ...).
+RESPONSE_KINDS = ('page', 'raw')
+# Mức quyền của route (kiểm tra trong MiniVentoryRequestHandler._is_authorized):
+#   None   : ai cũng truy cập được.
+#   'write': route thay đổi dữ liệu, chỉ client trong mạng được phép hoặc có mã truy cập.
+AUTH_LEVELS = (None, 'write')
+
+class RouteError(ValueError):
+    """Lỗi khi khai báo route không hợp lệ."""
+
+class Route:
+    """
+    Thông tin của một route.
+
+    Attributes:
+        method (str): Phương thức HTTP ('GET', 'POST').
+        pattern (str): Mẫu đường dẫn, vd '/products/edit/<int:product_id>'.
+        handler (callable): Hàm xử lý, nhận (request_handler, dữ_liệu, **tham_số_đường_dẫn).
+            Với GET, dữ_liệu là query string đã parse; với POST là dữ liệu form.
+        response (str): 'page' hoặc 'raw' (xem RESPONSE_KINDS).
+        cache (str): Giá trị header Cache-Control mặc định cho phản hồi (None = không gửi).
+        timed (bool): Có đo thời gian xử lý (header Server-Timing và thống kê) hay không.
+        auth (str): Quyền cần có để truy cập route (xem AUTH_LEVELS; None = ai cũng truy cập được).
+    """
+    __slots__ = ('method', 'pattern', 'handler', 'response', 'cache', 'timed', 'auth',
+                 'regex', 'shape_regex', 'converters', 'count', 'total_seconds', 'max_seconds')
+
+    def __init__(self, method, pattern, handler, response='page', cache=None, timed=True, auth=None):
+        if response not in RESPONSE_KINDS:
+            raise RouteError(f"Kiểu phản hồi không hợp lệ: '{response}'.")
+        if auth not in AUTH_LEVELS:
+            raise RouteError(f"Mức quyền không hợp lệ: '{auth}'.")
+        self.method = method.upper()
+        self.pattern = pattern
+        self.handler = handler
+        self.response = response
+        self.cache = cache
+        self.timed = timed
+        self.auth = auth
+        self.regex, self.shape_regex, self.converters = _compile_pattern(pattern)
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    @property
+    def is_static(self):
+        """Route không có tham số (tra cứu bằng dict)."""
+        return self.regex is None
+
+    def __repr__(self):
+        return f"<Route {self.method} {self.pattern}>"
+
+def _compile_pattern(pattern):
+    """
+    Biên dịch mẫu đường dẫn thành (regex, regex_hình_dạng, {tên_tham_số: hàm_chuyển_kiểu}).
+    regex_hình_dạng chấp nhận mọi giá trị cho tham số (dùng để nhận ra tham số sai kiểu, vd.
+    '/products/edit/abc'). Trả về (None, None, {}) nếu mẫu không có tham số.
+    """
+    if not pattern.startswith('/'):
+        raise RouteError(f"Mẫu đường dẫn phải bắt đầu bằng '/': '{pattern}'.")
+    converters = {}
+    regex_parts = []
+    shape_parts = []
+    position = 0
+    for match in _PARAM_PATTERN.finditer(pattern):
+        type_name, param_name = match.group(1) or 'str', match.group(2)
+        if type_name not in PARAM_CONVERTERS:
+            raise RouteError(f"Kiểu tham số không hỗ trợ: '{type_name}' trong '{pattern}'.")
+        if param_name in converters:
+            raise RouteError(f"Tham số '{param_name}' bị lặp trong '{pattern}'.")
+        regex_parts.append(re.escape(pattern[position:match.start()]))
+        regex_parts.append(f'(?P<{param_name}>{PARAM_CONVERTERS[type_name][0]})')
+        shape_parts.append(re.escape(pattern[position:match.start()]))
+        shape_parts.append(PARAM_CONVERTERS['str'][0])
+        converters[param_name] = PARAM_CONVERTERS[type_name][1]
+        position = match.end()
+    if not converters:
+        return None, None, {}
+    regex_parts.append(re.escape(pattern[position:]))
+    shape_parts.append(re.escape(pattern[position:]))
+    return re.compile(''.join(regex_parts) + r'\Z'), re.compile(''.join(shape_parts) + r'\Z'), converters
+
+class RouteRegistry:
+    """
+    Bảng định tuyến: ánh xạ (phương thức, đường dẫn) tới route.
+
+    Ví dụ:
+        routes = RouteRegistry()
+
+        @routes.get('/products/edit/<int:product_id>')
+        def get_edit_product(handler, query_params, product_id):
+            ...
+
+        route, params = routes.match('GET', '/products/edit/12')  # params == {'product_id': 12}
+    """
+
+    def __init__(self):
+        self._static = {}    # (method, path) -> Route
+        self._dynamic = {}   # method -> [Route, ...] theo thứ tự đăng ký
+        self._lock = threading.Lock()
+
+    def add(self, method, pattern, handler, **metadata):
+        """Đăng ký một route. Báo lỗi nếu (phương thức, mẫu) đã được đăng ký."""
+        route = Route(method, pattern, handler, **metadata)
+        if route.is_static:
+            key = (route.method, pattern)
+            if key in self._static:
+                raise RouteError(f"Route đã tồn tại: {route.method} {pattern}.")
+            self._static[key] = route
+        else:
+            routes = self._dynamic.setdefault(route.method, [])
+            if any(existing.pattern == pattern for existing in routes):
+                raise RouteError(f"Route đã tồn tại: {route.method} {pattern}.")
+            routes.append(route)
+        return route
+
+    def route(self, method, pattern, **metadata):
+        """Decorator đăng ký một hàm xử lý cho route."""
+        def decorator(handler):
+            self.add(method, pattern, handler, **metadata)
+            return handler
+        return decorator
+
+    def get(self, pattern, **metadata):
+        return self.route('GET', pattern, **metadata)
+
+    def post(self, pattern, **metadata):
+        return self.route('POST', pattern, **metadata)
+
+    def match(self, method, path):
+        """
+        Tìm route cho một request.
+
+        Returns:
+            tuple: (route, tham_số_đường_dẫn) hoặc (None, None) nếu không có route phù hợp.
+        """
+        method = method.upper()
+        route = self._static.get((method, path))
+        if route is not None:
+            return route, {}
+        for route in self._dynamic.get(method, ()):
+            found = route.regex.match(path)
+            if found:
+                return route, {name: route.converters[name](value) for name, value in found.groupdict().items()}
+        return None, None
+
+    def _matches_shape(self, method, path):
+        """Có route nào của `method` khớp `path` nếu bỏ qua kiểu của tham số hay không."""
+        if (method, path) in self._static:
+            return True
+        return any(route.shape_regex.match(path) for route in self._dynamic.get(method, ()))
+
+    def no_match_status(self, method, path):
+        """
+        Mã lỗi HTTP cho một request mà `match` không tìm được route:
+            400: đường dẫn có dạng của một route cùng phương thức nhưng tham số sai kiểu
+                 (vd. '/products/edit/abc' với '<int:product_id>').
+            405: đường dẫn chỉ được đăng ký với phương thức khác.
+            404: không có route nào có đường dẫn này.
+        """
+        method = method.upper()
+        if self._matches_shape(method, path):
+            return 400
+        methods = {key[0] for key in self._static} | set(self._dynamic)
+        if any(self._matches_shape(other, path) for other in methods - {method}):
+            return 405
+        return 404
+
+    def record_timing(self, route, seconds):
+        """Cộng dồn thời gian xử lý của một route (dùng cho thống kê)."""
+        with self._lock:
+            route.count += 1
+            route.total_seconds += seconds
+            if seconds > route.max_seconds:
+                route.max_seconds = seconds
+
+    def all_routes(self):
+        """Danh sách tất cả route theo thứ tự: route cố định trước, route có tham số sau."""
+        routes = list(self._static.values())
+        for dynamic_routes in self._dynamic.values():
+            routes.extend(dynamic_routes)
+        return routes
+
+    def stats(self):
+        """Thống kê thời gian xử lý của các route đã được gọi: {'GET /path': {...}}."""
+        with self._lock:
+            return {f"{route.method} {route.pattern}": {
+                        'count': route.count,
+                        'avg_ms': route.total_seconds * 1000 / route.count,
+                        'max_ms': route.max_seconds * 1000}
+                    for route in self.all_routes() if route.count}
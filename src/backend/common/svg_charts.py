@@ -0,0 +1,188 @@
+# /src/backend/common/svg_charts.py
+# File này chứa bộ vẽ biểu đồ SVG viết hoàn toàn bằng Python thuần (không cần matplotlib).
+# Hỗ trợ đúng các dạng biểu đồ mà hệ thống dùng:
+#   - Biểu đồ cột theo thời gian (doanh thu theo ngày/tháng).
+#   - Biểu đồ đường kép (số lượng nhập/xuất của một sản phẩm).
+#   - Biểu đồ cột theo danh mục (top sản phẩm theo doanh thu).
+# Kết quả là một chuỗi SVG (văn bản), trình duyệt hiển thị trực tiếp và sắc nét ở mọi kích thước.
+
+import datetime
+import math
+from xml.sax.saxutils import escape
+
+from .chart_utils import format_currency_for_chart
+
+# --- Kích thước và bố cục (tương đương figsize=(10, 6), dpi=90 của bản matplotlib) ---
+SVG_WIDTH = 900
+SVG_HEIGHT = 540
+MARGIN_LEFT = 110
+MARGIN_RIGHT = 30
+MARGIN_TOP = 60
+MARGIN_BOTTOM = 120
+MAX_X_LABELS = 15        # Số nhãn tối đa trên trục X (nhiều điểm hơn thì nhãn được giãn cách).
+MAX_CATEGORY_LABEL = 22  # Độ dài tối đa của nhãn danh mục (tên sản phẩm).
+FONT_FAMILY = "DejaVu Sans, Arial, sans-serif"
+
+def _nice_step(raw_step):
+    """Làm tròn bước chia trục Y về dạng 1, 2, 2.5, 5 x 10^k."""
+    if raw_step <= 0:
+        return 1
+    exponent = math.floor(math.log10(raw_step))
+    fraction = raw_step / 10 ** exponent
+    for nice in (1, 2, 2.5, 5, 10):
+        if fraction <= nice:
+            return nice * 10 ** exponent
+    return 10 ** (exponent + 1)
+
+def _y_ticks(values, integer=False, tick_count=5):
+    """Tính các mốc chia trục Y (bắt đầu từ 0 hoặc giá trị âm nhỏ nhất)."""
+    low = min(0, min(values)) if values else 0
+    high = max(0, max(values)) if values else 0
+    if high == low:
+        high = low + 1
+    step = _nice_step((high - low) / tick_count)
+    if integer:
+        step = max(1, math.ceil(step))
+    start = math.floor(low / step) * step
+    ticks = []
+    tick = start
+    while tick < high + step * 0.999:
+        ticks.append(tick)
+        tick += step
+    return ticks
+
+def _format_x_label(label, is_monthly, is_daily):
+    """Định dạng nhãn trục X giống bản matplotlib: '%m/%Y' cho tháng, '%d/%m/%y' cho ngày."""
+    try:
+        if is_monthly:
+            return datetime.datetime.strptime(label + "-01", '%Y-%m-%d').strftime('%m/%Y')
+        if is_daily:
+            return datetime.datetime.strptime(label, '%Y-%m-%d').strftime('%d/%m/%y')
+    except ValueError:
+        pass
+    label = str(label)
+    return label if len(label) <= MAX_CATEGORY_LABEL else label[:MAX_CATEGORY_LABEL - 1] + '…'
+
+def _text(x, y, content, size=12, anchor='middle', weight='normal', rotate=None, fill='#333'):
+    transform = f' transform="rotate({rotate} {x:.1f} {y:.1f})"' if rotate is not None else ''
+    return (f'<text x="{x:.1f}" y="{y:.1f}" font-size="{size}" text-anchor="{anchor}" '
+            f'font-weight="{weight}" fill="{fill}"{transform}>{escape(str(content))}</text>')
+
+def render_chart_svg(dates, values, title, ylabel,
+                     x_labels_override=None,
+                     color='skyblue', chart_type='bar',
+                     y_values2=None, label2=None, color2='red'):
+    """
+    Vẽ biểu đồ dạng SVG với cùng tham số như `chart_utils.render_chart_image`.
+
+    Returns:
+        bytes: Nội dung SVG (UTF-8).
+    """
+    dates = list(dates or [])
+    values = [v or 0 for v in (values or [])]
+    series2 = [v or 0 for v in y_values2] if y_values2 is not None else None
+    labels = list(x_labels_override) if x_labels_override else dates
+    is_monthly = bool(dates) and all(len(d) == 7 and d.count('-') == 1 for d in dates)
+    is_daily = bool(dates) and all(len(d) == 10 and d.count('-') == 2 for d in dates)
+
+    plot_left, plot_right = MARGIN_LEFT, SVG_WIDTH - MARGIN_RIGHT
+    plot_top, plot_bottom = MARGIN_TOP, SVG_HEIGHT - MARGIN_BOTTOM
+    plot_width, plot_height = plot_right - plot_left, plot_bottom - plot_top
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{SVG_WIDTH}" height="{SVG_HEIGHT}" '
+        f'viewBox="0 0 {SVG_WIDTH} {SVG_HEIGHT}" font-family="{FONT_FAMILY}">',
+        f'<rect width="{SVG_WIDTH}" height="{SVG_HEIGHT}" fill="#fff"/>',
+        _text(SVG_WIDTH / 2, 32, title, size=18, weight='bold'),
+        _text(24, plot_top + plot_height / 2, ylabel, size=13, rotate=-90),
+        _text(plot_left + plot_width / 2, SVG_HEIGHT - 12, "Thời gian" if not x_labels_override else "Sản phẩm", size=13),
+    ]
+
+    if not dates:
+        parts.append(_text(plot_left + plot_width / 2, plot_top + plot_height / 2, 'Không có dữ liệu để hiển thị', size=14))
+        parts.append(f'<rect x="{plot_left}" y="{plot_top}" width="{plot_width}" height="{plot_height}" fill="none" stroke="#999"/>')
+        parts.append('</svg>')
+        return ''.join(parts).encode('utf-8')
+
+    # --- Trục Y: mốc chia, lưới và nhãn ---
+    all_values = values + (series2 or [])
+    is_currency = "VNĐ" in ylabel
+    ticks = _y_ticks(all_values, integer=not is_currency)
+    y_min, y_max = ticks[0], ticks[-1]
+    y_span = (y_max - y_min) or 1
+
+    def y_pos(value):
+        return plot_bottom - (value - y_min) / y_span * plot_height
+
+    for tick in ticks:
+        y = y_pos(tick)
+        parts.append(f'<line x1="{plot_left}" y1="{y:.1f}" x2="{plot_right}" y2="{y:.1f}" '
+                     f'stroke="#bbb" stroke-dasharray="4 3" stroke-width="1"/>')
+        tick_label = format_currency_for_chart(int(tick)) if is_currency else format(int(tick), ',')
+        parts.append(_text(plot_left - 8, y + 4, tick_label, size=11, anchor='end'))
+
+    # --- Trục X: mỗi điểm dữ liệu chiếm một "khe" có độ rộng bằng nhau ---
+    count = len(dates)
+    band = plot_width / count
+
+    def x_center(index):
+        return plot_left + band * (index + 0.5)
+
+    label_every = max(1, math.ceil(count / MAX_X_LABELS))
+    for index, label in enumerate(labels):
+        if index % label_every:
+            continue
+        x = x_center(index)
+        parts.append(f'<line x1="{x:.1f}" y1="{plot_bottom}" x2="{x:.1f}" y2="{plot_bottom + 5}" stroke="#555"/>')
+        parts.append(_text(x, plot_bottom + 18, _format_x_label(label, is_monthly, is_daily), size=11, anchor='end', rotate=-30))
+
+    # --- Vẽ dữ liệu ---
+    if chart_type == 'line':
+        parts.append(_polyline(values, x_center, y_pos, color, marker='o'))
+        if series2 is not None:
+            parts.append(_polyline(series2, x_center, y_pos, color2, marker='x'))
+            parts.append(_legend([(ylabel.split('/')[0], color, 'o'), (label2 if label2 else 'Dữ liệu 2', color2, 'x')], plot_right))
+    else:
+        bar_width = band * 0.8
+        base_y = y_pos(max(y_min, 0))
+        for index, value in enumerate(values):
+            top = y_pos(value)
+            y, height = (top, base_y - top) if value >= 0 else (base_y, top - base_y)
+            parts.append(f'<rect x="{x_center(index) - bar_width / 2:.1f}" y="{y:.1f}" width="{bar_width:.1f}" '
+                         f'height="{max(height, 0):.1f}" fill="{escape(color)}"><title>{escape(str(labels[index]))}: '
+                         f'{escape(format(value, ","))}</title></rect>')
+
+    # Khung vùng vẽ
+    parts.append(f'<rect x="{plot_left}" y="{plot_top}" width="{plot_width}" height="{plot_height}" fill="none" stroke="#555"/>')
+    parts.append('</svg>')
+    return ''.join(parts).encode('utf-8')
+
+def _polyline(series, x_center, y_pos, color, marker):
+    """Vẽ một đường nối các điểm kèm ký hiệu điểm ('o' hình tròn, 'x' dấu chéo)."""
+    points = [(x_center(i), y_pos(v)) for i, v in enumerate(series)]
+    color = escape(color)
+    out = [f'<polyline fill="none" stroke="{color}" stroke-width="2" points="'
+           + ' '.join(f'{x:.1f},{y:.1f}' for x, y in points) + '"/>']
+    for x, y in points:
+        out.append(_marker(x, y, color, marker))
+    return ''.join(out)
+
+def _marker(x, y, color, marker):
+    if marker == 'x':
+        return (f'<path d="M{x - 4:.1f},{y - 4:.1f}L{x + 4:.1f},{y + 4:.1f}M{x - 4:.1f},{y + 4:.1f}L{x + 4:.1f},{y - 4:.1f}" '
+                f'stroke="{color}" stroke-width="2"/>')
+    return f'<circle cx="{x:.1f}" cy="{y:.1f}" r="3.5" fill="{color}"/>'
+
+def _legend(entries, plot_right):
+    """Chú thích ở góc trên bên phải vùng vẽ."""
+    width, row_height = 170, 20
+    x0, y0 = plot_right - width - 10, MARGIN_TOP + 10
+    out = [f'<rect x="{x0}" y="{y0}" width="{width}" height="{row_height * len(entries) + 10}" '
+           f'fill="#fff" fill-opacity="0.85" stroke="#ccc"/>']
+    for i, (label, color, marker) in enumerate(entries):
+        y = y0 + 15 + i * row_height
+        color = escape(color)
+        out.append(f'<line x1="{x0 + 10}" y1="{y}" x2="{x0 + 40}" y2="{y}" stroke="{color}" stroke-width="2"/>')
+        out.append(_marker(x0 + 25, y, color, marker))
+        out.append(_text(x0 + 48, y + 4, label, size=12, anchor='start'))
+    return ''.join(out)
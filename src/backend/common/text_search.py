@@ -0,0 +1,89 @@
+# /src/backend/common/text_search.py
+# File này chứa các hàm chuẩn hóa văn bản cho tìm kiếm toàn văn (SQLite FTS5):
+#   - Bỏ dấu tiếng Việt để "ao thun" tìm được "Áo thun". Bộ tách từ unicode61 (remove_diacritics 2)
+#     đã bỏ các dấu thanh/dấu mũ, nhưng 'đ' là một chữ cái riêng chứ không phải 'd' + dấu,
+#     nên phải được thay bằng 'd' trước khi lập chỉ mục và trước khi tìm.
+#   - SKU được lập chỉ mục dạng "dính liền" (bỏ dấu gạch, ...): 'SP-0A1B2' -> 'SP0A1B2'. Nếu để
+#     bộ tách từ chia thành 'sp' + '0a1b2' thì từ 'sp' có mặt ở mọi sản phẩm, làm việc xếp hạng
+#     (bm25 phải đếm số dòng chứa từng từ) chậm theo kích thước cả bảng.
+# Phía SQL (trigger) và phía Python (câu truy vấn) dùng chung các bảng ký tự bên dưới.
+
+import re
+import unicodedata
+
+# Các ký tự cần thay trước khi lập chỉ mục: 'đ', 'Đ' và 'Ð' (chữ Eth, hay bị gõ nhầm thay cho 'Đ').
+FOLD_CHARS = (('đ', 'd'), ('Đ', 'D'), ('Ð', 'D'))
+# Các ký tự phân cách bị bỏ khỏi SKU khi lập chỉ mục.
+SKU_SEPARATORS = ('-', '_', '.', '/', ' ')
+# Số từ tối đa lấy từ chuỗi tìm kiếm (phần còn lại bị bỏ qua).
+MAX_QUERY_TOKENS = 10
+# Độ dài tối thiểu của từ cuối để được khớp theo tiền tố.
+MIN_PREFIX_LENGTH = 2
+
+# Chữ cái/chữ số liên tiếp (không gồm '_', vì bộ tách từ unicode61 coi '_' là dấu phân cách).
+_WORD_PATTERN = re.compile(r'[^\W_]+')
+
+def _sql_replace_chain(expr, pairs):
+    for old, new in pairs:
+        expr = f"replace({expr}, '{old}', '{new}')"
+    return expr
+
+def sql_fold(expr):
+    """Biểu thức SQL chuẩn hóa chữ 'đ' của `expr` (dùng trong trigger)."""
+    return _sql_replace_chain(expr, FOLD_CHARS)
+
+def sql_sku_key(expr):
+    """Biểu thức SQL tạo dạng SKU dính liền để lập chỉ mục."""
+    return _sql_replace_chain(sql_fold(expr), [(sep, '') for sep in SKU_SEPARATORS])
+
+def fold_text(text):
+    """Chuẩn hóa chữ 'đ' giống `sql_fold` (các dấu còn lại do bộ tách từ của FTS5 xử lý)."""
+    for old, new in FOLD_CHARS:
+        text = text.replace(old, new)
+    return text
+
+def normalize_text(text):
+    """
+    Chuẩn hóa hoàn toàn bằng Python (không cần FTS5): bỏ mọi dấu (kể cả 'đ'), chuyển chữ thường
+    và gộp khoảng trắng. Vd: '  Sữa ĐẶC  Ông Thọ' -> 'sua dac ong tho'.
+    """
+    decomposed = unicodedata.normalize('NFD', fold_text(text or ''))
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return ' '.join(stripped.casefold().split())
+
+def build_match_query(search_term):
+    """
+    Chuyển chuỗi người dùng nhập thành biểu thức MATCH của FTS5, theo kiểu "gõ đến đâu tìm đến đó":
+    các từ đã gõ xong phải khớp nguyên từ, riêng từ cuối cùng được khớp theo tiền tố (nếu dài từ
+    MIN_PREFIX_LENGTH ký tự - tiền tố quá ngắn khớp với quá nhiều từ). Mỗi từ được đặt trong ngoặc
+    kép nên người dùng không thể chèn cú pháp FTS5; các từ nối với nhau bằng AND. Một cụm có dấu
+    phân cách (vd 'SP-0A1' hay 'Coca-Cola') khớp với các từ rời HOẶC với dạng dính liền (SKU).
+
+    Ví dụ:
+        build_match_query('áo thun')  -> '"áo" "thun"*'
+        build_match_query('SP-0A1')   -> '("SP" "0A1"* OR "SP0A1"*)'
+
+    Returns:
+        str: Biểu thức MATCH, hoặc None nếu chuỗi không có từ nào.
+    """
+    chunks = []
+    token_count = 0
+    for chunk in fold_text(search_term or '').split():
+        words = _WORD_PATTERN.findall(chunk)[:MAX_QUERY_TOKENS - token_count]
+        if words:
+            chunks.append(words)
+            token_count += len(words)
+        if token_count >= MAX_QUERY_TOKENS:
+            break
+    if not chunks:
+        return None
+
+    def term(word, is_prefix):
+        return f'"{word}"*' if is_prefix and len(word) >= MIN_PREFIX_LENGTH else f'"{word}"'
+
+    terms = []
+    for index, words in enumerate(chunks):
+        is_last = index == len(chunks) - 1
+        separate = " ".join(term(word, is_last and i == len(words) - 1) for i, word in enumerate(words))
+        terms.append(separate if len(words) == 1 else f'({separate} OR {term("".join(words), is_last)})')
+    return " ".join(terms)
@@ -1,13 +1,14 @@
 # src/backend/database_utils.py
 from .common.database_base import DB_NAME
-from .product import database as product_db
-from .transaction import database as transaction_db
+from .common import migrations
 
 def init_db():
     """
-    Khởi tạo tất cả các bảng cần thiết trong cơ sở dữ liệu (products, stock_transactions).
+    Khởi tạo / nâng cấp cấu trúc cơ sở dữ liệu bằng cách chạy các migration còn thiếu
+    (xem `common/migrations.py`). Nếu schema đã ở phiên bản mới nhất thì không làm gì thêm.
     """
     print(f"Bắt đầu khởi tạo cơ sở dữ liệu '{DB_NAME}'...")
-    product_db.init_db(DB_NAME)
-    transaction_db.init_db(DB_NAME)
-    print(f"Cơ sở dữ liệu đã được khởi tạo thành công.")
\ No newline at end of file
+    applied = migrations.run_migrations(DB_NAME)
+    for version, description in applied:
+        print(f"  - Đã áp dụng migration {version}: {description}")
+    print(f"Cơ sở dữ liệu đã được khởi tạo thành công (schema phiên bản {migrations.LATEST_SCHEMA_VERSION}).")
@@ -0,0 +1,174 @@
+# /src/backend/product/cache.py
+# File này chứa cache sản phẩm trong bộ nhớ của tiến trình, dùng cho các lần đọc một sản phẩm
+# theo ID hoặc SKU (form nhập/xuất kho, báo cáo luồng sản phẩm, tạo SKU, API máy quét mã vạch, ...):
+#   - Cache LRU có giới hạn số sản phẩm, tra được theo ID và theo SKU.
+#   - Ghi xuyên (write-through): mọi hàm ghi vào bảng 'products' (thêm/sửa/ẩn/khôi phục, nhập/xuất
+#     kho) gọi `invalidate` sau khi commit để bỏ sản phẩm khỏi cache của tiến trình hiện tại.
+#   - Nhiều tiến trình (chế độ prefork): mỗi tiến trình có cache riêng, nên trước khi tra cache sẽ đọc
+#     nhật ký 'product_changes' (do trigger ghi) để bỏ các sản phẩm bị tiến trình khác thay đổi.
+
+import threading
+import time
+from collections import OrderedDict
+from ..common.database_base import borrow_db_connection
+
+# Số sản phẩm tối đa giữ trong cache (0 = tắt cache).
+PRODUCT_CACHE_SIZE = 2048
+# Khoảng thời gian (giây) tối thiểu giữa hai lần đọc nhật ký thay đổi khi bật kiểm tra nhất quán
+# giữa các tiến trình. Đây cũng là giới hạn độ cũ: thay đổi từ tiến trình khác được thấy chậm nhất
+# sau chừng này giây (thay đổi trong cùng tiến trình luôn được thấy ngay). 0 = kiểm tra trước mỗi
+# lần tra cache, tức mỗi lần tra đều tốn thêm một truy vấn vào 'product_changes'.
+PRODUCT_CACHE_CHECK_INTERVAL = 0.5
+
+class ProductCache:
+    """
+    Cache LRU các dòng của bảng 'products' (kể cả sản phẩm đã ẩn), an toàn khi dùng từ nhiều luồng.
+
+    Ví dụ:
+        generation = product_cache.generation
+        product = product_cache.get_by_sku('SP-20DC6')
+        if product is None:
+            product = ...đọc từ DB...
+            product_cache.put(product, generation)
+        ...
+        product_cache.invalidate(product_id)   # sau khi ghi vào bảng 'products'
+    """
+
+    def __init__(self, max_size=PRODUCT_CACHE_SIZE):
+        self.max_size = max_size
+        self.check_interval = None   # None = không kiểm tra nhất quán giữa các tiến trình
+        # Khoảng kiểm tra dùng khi gọi `enable_coherence_check` (có thể đổi trước khi fork).
+        self.coherence_interval = PRODUCT_CACHE_CHECK_INTERVAL
+        self._lock = threading.Lock()
+        self._reset_state()
+
+    def _reset_state(self):
+        self._by_id = OrderedDict()  # id -> dict sản phẩm, theo thứ tự dùng gần nhất
+        self._id_by_sku = {}
+        # Tăng ở mỗi lần bỏ dữ liệu khỏi cache: kết quả đọc từ DB bắt đầu trước một lần bỏ
+        # có thể đã cũ nên không được đưa vào cache (xem `put`).
+        self.generation = 0
+        self._last_seq = None
+        self._last_check = 0.0
+        self._hits = self._misses = self._evictions = 0
+        self._invalidations = self._remote_invalidations = self._coherence_checks = 0
+
+    def enable_coherence_check(self, interval=None):
+        """
+        Bật kiểm tra nhất quán giữa các tiến trình (gọi trong mỗi worker prefork ngay sau khi fork).
+        Cache thừa kế từ tiến trình cha bị xóa và thống kê được tính lại từ đầu.
+        Mặc định dùng `coherence_interval` (giây).
+        """
+        with self._lock:
+            self._reset_state()
+            self.check_interval = self.coherence_interval if interval is None else interval
+
+    def _drop(self, product_id):
+        """Bỏ một sản phẩm khỏi cache (phải giữ self._lock)."""
+        product = self._by_id.pop(product_id, None)
+        if product is not None and self._id_by_sku.get(product['sku']) == product_id:
+            del self._id_by_sku[product['sku']]
+
+    def _clear(self):
+        self._by_id.clear()
+        self._id_by_sku.clear()
+        self.generation += 1
+
+    def _sync_with_other_processes(self):
+        """Đọc nhật ký 'product_changes' và bỏ các sản phẩm đã bị thay đổi từ tiến trình khác."""
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        with borrow_db_connection() as conn:
+            if self._last_seq is None:
+                row = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM product_changes").fetchone()
+                changes, last_seq = None, row[0]
+            else:
+                changes = conn.execute("SELECT seq, product_id FROM product_changes WHERE seq > ? ORDER BY seq LIMIT ?",
+                                       (self._last_seq, self.max_size + 1)).fetchall()
+                last_seq = changes[-1]['seq'] if changes else self._last_seq
+        with self._lock:
+            self._coherence_checks += 1
+            if changes is None or last_seq < (self._last_seq or 0):
+                self._clear()
+            elif changes:
+                # Nhật ký bị cắt bớt (đọc không liên tục) hoặc quá nhiều thay đổi: xóa cả cache.
+                if changes[0]['seq'] != self._last_seq + 1 or len(changes) > self.max_size:
+                    self._clear()
+                else:
+                    for change in changes:
+                        self._drop(change['product_id'])
+                    self.generation += 1
+                self._remote_invalidations += len(changes)
+            self._last_seq = last_seq
+
+    def _get(self, product_id=None, sku=None):
+        if self.check_interval is not None:
+            self._sync_with_other_processes()
+        with self._lock:
+            if sku is not None:
+                product_id = self._id_by_sku.get(sku)
+            product = self._by_id.get(product_id) if product_id is not None else None
+            if product is None:
+                self._misses += 1
+                return None
+            self._by_id.move_to_end(product_id)
+            self._hits += 1
+            return dict(product)
+
+    def get_by_id(self, product_id):
+        """Trả về bản sao dict sản phẩm có ID `product_id`, hoặc None nếu chưa có trong cache."""
+        return self._get(product_id)
+
+    def get_by_sku(self, sku):
+        """Trả về bản sao dict sản phẩm có SKU `sku`, hoặc None nếu chưa có trong cache."""
+        return self._get(sku=sku)
+
+    def put(self, product, generation):
+        """
+        Đưa một dòng sản phẩm vừa đọc từ DB vào cache. `generation` là giá trị của
+        `self.generation` lấy TRƯỚC khi đọc DB: nếu từ đó đến giờ đã có lần bỏ dữ liệu nào
+        (ghi từ luồng khác), dòng vừa đọc có thể đã cũ và không được lưu.
+        """
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            product_id = product['id']
+            self._drop(product_id)
+            self._by_id[product_id] = dict(product)
+            self._id_by_sku[product['sku']] = product_id
+            while len(self._by_id) > self.max_size:
+                _, evicted = self._by_id.popitem(last=False)
+                self._id_by_sku.pop(evicted['sku'], None)
+                self._evictions += 1
+
+    def invalidate(self, *product_ids):
+        """Bỏ các sản phẩm khỏi cache (gọi sau khi commit thay đổi vào bảng 'products')."""
+        with self._lock:
+            for product_id in product_ids:
+                self._drop(product_id)
+            self.generation += 1
+            self._invalidations += len(product_ids)
+
+    def clear(self):
+        """Xóa toàn bộ cache."""
+        with self._lock:
+            self._clear()
+
+    def stats(self):
+        """Trả về thông tin thống kê của cache."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {'size': len(self._by_id), 'max_size': self.max_size,
+                    'hits': self._hits, 'misses': self._misses,
+                    'hit_rate': round(self._hits / lookups, 4) if lookups else None,
+                    'evictions': self._evictions, 'invalidations': self._invalidations,
+                    'coherence_check': self.check_interval is not None,
+                    'coherence_checks': self._coherence_checks,
+                    'remote_invalidations': self._remote_invalidations}
+
+# Cache dùng chung trong tiến trình.
+product_cache = ProductCache()
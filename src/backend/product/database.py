@@ -6,22 +6,11 @@
 import sqlite3
 import uuid
 import datetime
-from ..common.database_base import get_db_connection
-
-def init_db(db_name):
-    """Tạo bảng 'products' trong database nếu nó chưa tồn tại."""
-    conn = get_db_connection(db_name)
-    cursor = conn.cursor()
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS products (
-        id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, sku TEXT NOT NULL UNIQUE,
-        description TEXT, unit_of_measure TEXT DEFAULT 'cái',
-        current_stock INTEGER DEFAULT 0, price INTEGER DEFAULT 0,
-        is_deleted INTEGER DEFAULT 0, -- Thêm cột này
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )''')
-    conn.commit()
-    conn.close()
+from ..common.database_base import borrow_db_connection, SQLITE_MAX_PARAMS
+from ..common.pagination import fetch_keyset_page, PAGE_SIZE_DEFAULT, SORT_KEY_COLUMN
+from ..common.migrations import PRODUCT_SEARCH_TABLE, create_product_search_index
+from ..common.text_search import build_match_query
+from .cache import product_cache
 
 def generate_unique_sku():
     """
@@ -56,44 +45,43 @@ def db_add_product(name, sku, description, unit_of_measure, current_stock=0, pri
         tuple: (ID_sản_phẩm_mới, thông_báo_kết_quả)
                Trả về (None, thông_báo_lỗi) nếu có lỗi xảy ra.
     """
-    conn = get_db_connection()
-    try:
-        conn.execute("BEGIN TRANSACTION")
-        cursor = conn.cursor()
-        current_time = datetime.datetime.now()
-
-        # 1. Thêm sản phẩm vào bảng 'products'
-        cursor.execute('''
-        INSERT INTO products (name, sku, description, unit_of_measure, current_stock, price, created_at, updated_at, is_deleted)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)
-        ''', (name, sku, description, unit_of_measure, int(current_stock), int(price), current_time, current_time))
-        
-        product_id = cursor.lastrowid
-        if not product_id:
-            raise Exception("Không thể lấy ID sản phẩm vừa tạo.")
+    with borrow_db_connection() as conn:
+        try:
+            conn.execute("BEGIN TRANSACTION")
+            cursor = conn.cursor()
+            current_time = datetime.datetime.now()
 
-        # 2. Nếu có tồn kho ban đầu, tạo một giao dịch 'IN'
-        if int(current_stock) > 0:
-            total_amount = int(current_stock) * int(price)
+            # 1. Thêm sản phẩm vào bảng 'products'
             cursor.execute('''
-            INSERT INTO stock_transactions (product_id, transaction_type, quantity, unit_price, total_amount, notes, user, timestamp)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (product_id, 'IN', int(current_stock), int(price), total_amount, 'Tồn kho ban đầu khi tạo sản phẩm', 'system_init', current_time))
-        
-        conn.commit()
-        return product_id, f"Thêm sản phẩm '{name}' (SKU: {sku}) thành công!"
-
-    except sqlite3.IntegrityError:
-        conn.rollback()
-        return None, f"Lỗi: Mã SKU '{sku}' đã tồn tại."
-    except ValueError:
-        conn.rollback()
-        return None, "Lỗi: Số lượng tồn hoặc đơn giá phải là số nguyên hợp lệ."
-    except Exception as e:
-        conn.rollback()
-        return None, f"Lỗi khi thêm sản phẩm và giao dịch ban đầu: {e}"
-    finally:
-        conn.close()
+            INSERT INTO products (name, sku, description, unit_of_measure, current_stock, price, created_at, updated_at, is_deleted)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)
+            ''', (name, sku, description, unit_of_measure, int(current_stock), int(price), current_time, current_time))
+            
+            product_id = cursor.lastrowid
+            if not product_id:
+                raise Exception("Không thể lấy ID sản phẩm vừa tạo.")
+
+            # 2. Nếu có tồn kho ban đầu, tạo một giao dịch 'IN'
+            if int(current_stock) > 0:
+                total_amount = int(current_stock) * int(price)
+                cursor.execute('''
+                INSERT INTO stock_transactions (product_id, transaction_type, quantity, unit_price, total_amount, notes, user, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (product_id, 'IN', int(current_stock), int(price), total_amount, 'Tồn kho ban đầu khi tạo sản phẩm', 'system_init', current_time))
+            
+            conn.commit()
+            product_cache.invalidate(product_id)
+            return product_id, f"Thêm sản phẩm '{name}' (SKU: {sku}) thành công!"
+
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            return None, f"Lỗi: Mã SKU '{sku}' đã tồn tại."
+        except ValueError:
+            conn.rollback()
+            return None, "Lỗi: Số lượng tồn hoặc đơn giá phải là số nguyên hợp lệ."
+        except Exception as e:
+            conn.rollback()
+            return None, f"Lỗi khi thêm sản phẩm và giao dịch ban đầu: {e}"
         
 def db_get_all_products(sort_by='name', order='ASC'):
     """
@@ -106,139 +94,309 @@ def db_get_all_products(sort_by='name', order='ASC'):
     Returns:
         list: Danh sách các sản phẩm, mỗi sản phẩm là một dictionary.
     """
-    conn = get_db_connection()
     # Danh sách các cột hợp lệ để tránh lỗi SQL Injection
     valid_sort_columns = ['name', 'sku', 'current_stock', 'price', 'updated_at', 'id', 'unit_of_measure']
     if sort_by not in valid_sort_columns: sort_by = 'name'
     order_direction = 'ASC' if order.upper() == 'ASC' else 'DESC'
     
     query = f"SELECT id, name, sku, description, unit_of_measure, current_stock, price, updated_at FROM products WHERE is_deleted = 0 ORDER BY {sort_by} {order_direction}, id {order_direction}"
-    products = [dict(row) for row in conn.execute(query).fetchall()]
-    conn.close()
+    with borrow_db_connection() as conn:
+        products = [dict(row) for row in conn.execute(query).fetchall()]
     return products
 
+# Các cột được phép sắp xếp danh sách sản phẩm theo trang: tên cột -> biểu thức lấy giá trị thô cho con trỏ.
+PRODUCT_PAGE_SORT_COLUMNS = {
+    'name': 'name', 'sku': 'sku', 'current_stock': 'current_stock', 'price': 'price',
+    'unit_of_measure': 'unit_of_measure', 'id': 'id', 'updated_at': 'CAST(updated_at AS TEXT)',
+}
+# Các cột sắp xếp khai báo NOT NULL (không cần xử lý NULL khi phân trang).
+PRODUCT_NOT_NULL_SORT_COLUMNS = ('name', 'sku', 'id')
+# Giá trị sort_by đặc biệt: xếp kết quả tìm kiếm theo mức độ phù hợp (bm25, tốt nhất trước).
+SORT_BY_RELEVANCE = 'relevance'
+# Trọng số bm25 của các cột (name, sku, description) trong bảng tìm kiếm: khớp SKU/tên quan trọng hơn mô tả.
+PRODUCT_SEARCH_WEIGHTS = (4.0, 8.0, 1.0)
+# Số kết quả tối đa được chấm điểm khi xếp theo mức độ phù hợp. Chi phí xếp hạng tỉ lệ với số dòng
+# khớp, nên với từ khóa quá chung chỉ xếp hạng các sản phẩm mới nhất; sắp xếp theo cột để xem hết.
+SEARCH_RANK_CANDIDATES = 2000
+
+_PRODUCT_COLUMNS = ('id', 'name', 'sku', 'description', 'unit_of_measure', 'current_stock', 'price', 'updated_at')
+# Kết quả kiểm tra bảng tìm kiếm toàn văn (None = chưa kiểm tra).
+_search_index_available = None
+
+def product_search_index_available():
+    """Kiểm tra (một lần cho mỗi tiến trình) database có bảng tìm kiếm toàn văn FTS5 hay không."""
+    global _search_index_available
+    if _search_index_available is None:
+        with borrow_db_connection() as conn:
+            row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                               (PRODUCT_SEARCH_TABLE,)).fetchone()
+        _search_index_available = row is not None
+    return _search_index_available
+
+def _search_filter(search_term):
+    """
+    Điều kiện WHERE lọc sản phẩm (bảng 'products') theo từ khóa: dùng chỉ mục FTS5 nếu có,
+    ngược lại dùng LIKE trên SKU/Tên.
+
+    Returns:
+        tuple: (str_điều_kiện_sql, list_tham_số)
+    """
+    if product_search_index_available():
+        match_query = build_match_query(search_term)
+        if match_query is None:
+            return "0", []
+        return f"id IN (SELECT rowid FROM {PRODUCT_SEARCH_TABLE} WHERE {PRODUCT_SEARCH_TABLE} MATCH ?)", [match_query]
+    return "(sku LIKE ? OR name LIKE ?)", [f"%{search_term}%", f"%{search_term}%"]
+
+def _ranked_search_select(match_query):
+    """
+    Câu SELECT các sản phẩm khớp `match_query` (tối đa SEARCH_RANK_CANDIDATES sản phẩm mới nhất)
+    kèm điểm bm25 (cột SORT_KEY_COLUMN, càng nhỏ càng phù hợp), chưa sắp xếp.
+    """
+    weights = ", ".join(str(weight) for weight in PRODUCT_SEARCH_WEIGHTS)
+    columns = ", ".join(f"p.{column}" for column in _PRODUCT_COLUMNS)
+    select_sql = (f"SELECT {columns}, f.score AS {SORT_KEY_COLUMN} FROM "
+                  f"(SELECT rowid, bm25({PRODUCT_SEARCH_TABLE}, {weights}) AS score FROM {PRODUCT_SEARCH_TABLE} "
+                  f"WHERE {PRODUCT_SEARCH_TABLE} MATCH ? ORDER BY rowid DESC LIMIT ?) AS f "
+                  f"JOIN products AS p ON p.id = f.rowid")
+    return select_sql, [match_query, SEARCH_RANK_CANDIDATES]
+
+def db_get_products_keyset(sort_by='name', order='ASC', search_term=None, limit=PAGE_SIZE_DEFAULT, after=None, before=None):
+    """
+    Lấy một trang sản phẩm (chưa bị ẩn) theo con trỏ (keyset), có hỗ trợ sắp xếp và tìm kiếm theo SKU/Tên/Mô tả.
+    Mỗi trang bắt đầu ngay sau khóa (cột_sắp_xếp, id) của trang trước, không dùng OFFSET.
+    Tìm kiếm dùng chỉ mục toàn văn (không phân biệt dấu, khớp theo tiền tố) nếu SQLite hỗ trợ FTS5.
+
+    Args:
+        sort_by (str): Cột sắp xếp (xem PRODUCT_PAGE_SORT_COLUMNS), hoặc SORT_BY_RELEVANCE để xếp
+            kết quả tìm kiếm theo mức độ phù hợp (khi không có FTS5 thì xếp theo tên).
+        order (str): 'ASC' hoặc 'DESC' (bỏ qua khi xếp theo mức độ phù hợp).
+        search_term (str, optional): Từ khóa tìm kiếm.
+        limit (int): Số sản phẩm tối đa trên trang.
+        after, before (str, optional): Con trỏ trang sau / trang trước.
+
+    Returns:
+        dict: {'items': list_sản_phẩm, 'next': con_trỏ hoặc None, 'prev': con_trỏ hoặc None}
+    """
+    if sort_by == SORT_BY_RELEVANCE and search_term and product_search_index_available():
+        match_query = build_match_query(search_term)
+        if match_query is None:
+            return {'items': [], 'next': None, 'prev': None}
+        select_sql, params = _ranked_search_select(match_query)
+        with borrow_db_connection() as conn:
+            return fetch_keyset_page(conn, select_sql, ["p.is_deleted = 0"], params, 'f.score', 'p.id', True, limit, after, before,
+                                     nullable=False)
+
+    if sort_by not in PRODUCT_PAGE_SORT_COLUMNS: sort_by = 'name'
+    ascending = order.upper() != 'DESC'
+    conditions, params = ["is_deleted = 0"], []
+    if search_term:
+        condition, condition_params = _search_filter(search_term)
+        conditions.append(condition)
+        params += condition_params
+    select_sql = (f"SELECT {', '.join(_PRODUCT_COLUMNS)}, "
+                  f"{PRODUCT_PAGE_SORT_COLUMNS[sort_by]} AS {SORT_KEY_COLUMN} FROM products")
+    with borrow_db_connection() as conn:
+        return fetch_keyset_page(conn, select_sql, conditions, params, sort_by, 'id', ascending, limit, after, before,
+                                 nullable=sort_by not in PRODUCT_NOT_NULL_SORT_COLUMNS)
+
+def _get_cached_product(column, value, include_hidden):
+    """
+    Đọc một sản phẩm theo ID hoặc SKU, qua cache sản phẩm (xem product/cache.py).
+    Cache giữ cả sản phẩm đã ẩn; điều kiện is_deleted được lọc ở đây.
+    """
+    if column == 'id':
+        product = product_cache.get_by_id(value)
+    else:
+        product = product_cache.get_by_sku(value)
+    if product is None:
+        generation = product_cache.generation
+        with borrow_db_connection() as conn:
+            product_data = conn.execute(f"SELECT * FROM products WHERE {column} = ?", (value,)).fetchone()
+        if product_data is None:
+            return None
+        product = dict(product_data)
+        product_cache.put(product, generation)
+    if product['is_deleted'] and not include_hidden:
+        return None
+    return product
+
 def db_get_product_by_id(product_id, include_hidden=False):
     """Lấy thông tin một sản phẩm dựa trên ID."""
-    conn = get_db_connection()
-    query = "SELECT * FROM products WHERE id = ?"
-    if not include_hidden:
-        query += " AND is_deleted = 0"
-    product_data = conn.execute(query, (product_id,)).fetchone()
-    conn.close()
-    return dict(product_data) if product_data else None
+    return _get_cached_product('id', product_id, include_hidden)
 
 def db_get_product_by_sku(sku):
     """Lấy thông tin một sản phẩm dựa trên SKU."""
-    conn = get_db_connection()
-    product_data = conn.execute("SELECT * FROM products WHERE sku = ? AND is_deleted = 0", (sku,)).fetchone()
-    conn.close()
-    return dict(product_data) if product_data else None
+    return _get_cached_product('sku', sku, False)
 
-def db_search_products_flexible(search_term):
+def db_get_products_by_skus(skus):
     """
-    Tìm kiếm sản phẩm trong DB một cách linh hoạt theo SKU hoặc Tên.
-    Sử dụng toán tử LIKE để tìm kiếm gần đúng.
+    Lấy thông tin nhiều sản phẩm (chưa bị ẩn) theo danh sách SKU chỉ với một lượt truy vấn
+    (chia nhỏ theo giới hạn số tham số của SQLite nếu danh sách quá dài).
+    Dùng cho xử lý hàng loạt, thay cho việc gọi `db_get_product_by_sku` cho từng dòng.
+
+    Args:
+        skus (iterable): Các mã SKU cần tra cứu (có thể trùng lặp).
+
+    Returns:
+        dict: {sku: dict_sản_phẩm} cho các SKU tồn tại.
+    """
+    unique_skus = list(dict.fromkeys(sku for sku in skus if sku))
+    products = {}
+    with borrow_db_connection() as conn:
+        for start in range(0, len(unique_skus), SQLITE_MAX_PARAMS):
+            batch = unique_skus[start:start + SQLITE_MAX_PARAMS]
+            placeholders = ", ".join("?" * len(batch))
+            query = f"SELECT * FROM products WHERE sku IN ({placeholders}) AND is_deleted = 0"
+            for row in conn.execute(query, batch):
+                products[row['sku']] = dict(row)
+    return products
+
+def db_get_products_by_ids(product_ids):
+    """
+    Lấy thông tin nhiều sản phẩm (chưa bị ẩn) theo danh sách ID chỉ với một lượt truy vấn
+    (chia nhỏ theo giới hạn số tham số của SQLite nếu danh sách quá dài).
+
+    Args:
+        product_ids (iterable): Các ID cần tra cứu.
+
+    Returns:
+        dict: {id: dict_sản_phẩm} cho các ID tồn tại.
+    """
+    unique_ids = list(dict.fromkeys(product_ids))
+    products = {}
+    with borrow_db_connection() as conn:
+        for start in range(0, len(unique_ids), SQLITE_MAX_PARAMS):
+            batch = unique_ids[start:start + SQLITE_MAX_PARAMS]
+            placeholders = ", ".join("?" * len(batch))
+            query = f"SELECT * FROM products WHERE id IN ({placeholders}) AND is_deleted = 0"
+            for row in conn.execute(query, batch):
+                products[row['id']] = dict(row)
+    return products
+
+def db_search_products_flexible(search_term, limit=PAGE_SIZE_DEFAULT):
+    """
+    Tìm kiếm sản phẩm trong DB một cách linh hoạt theo SKU, Tên hoặc Mô tả.
+    Dùng chỉ mục toàn văn FTS5 (không phân biệt dấu, khớp theo tiền tố, xếp theo mức độ phù hợp);
+    nếu SQLite không hỗ trợ FTS5 thì dùng toán tử LIKE trên SKU/Tên và xếp theo tên.
 
     Args:
         search_term (str): Từ khóa tìm kiếm.
+        limit (int): Số kết quả tối đa.
 
     Returns:
         list: Danh sách các sản phẩm khớp với từ khóa.
     """
-    conn = get_db_connection()
-    like_term = f"%{search_term}%"
-    products = [dict(row) for row in conn.execute("SELECT id, name, sku, description, unit_of_measure, current_stock, price, updated_at FROM products WHERE (sku LIKE ? OR name LIKE ?) AND is_deleted = 0 ORDER BY name ASC", (like_term, like_term)).fetchall()]
-    conn.close()
-    return products
-    
+    return db_get_products_keyset(SORT_BY_RELEVANCE, 'ASC', search_term, limit)['items']
+
+def db_rebuild_product_search_index():
+    """
+    Xóa và tạo lại chỉ mục tìm kiếm toàn văn của sản phẩm (bảng FTS5 và các trigger) từ bảng 'products'.
+    Dùng khi dữ liệu bị sửa trực tiếp ngoài ứng dụng hoặc sau khi nâng cấp lên SQLite có FTS5.
+
+    Returns:
+        tuple: (bool_thành_công, str_thông_báo)
+    """
+    global _search_index_available
+    with borrow_db_connection() as conn:
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(f"DROP TABLE IF EXISTS {PRODUCT_SEARCH_TABLE}")
+            if not create_product_search_index(conn.cursor()):
+                conn.rollback()
+                return False, "SQLite không hỗ trợ FTS5: tìm kiếm sản phẩm tiếp tục dùng LIKE."
+            row_count = conn.execute(f"SELECT COUNT(*) FROM {PRODUCT_SEARCH_TABLE}").fetchone()[0]
+            conn.commit()
+            _search_index_available = True
+            return True, f"Đã tạo lại chỉ mục tìm kiếm sản phẩm: {row_count} sản phẩm."
+        except sqlite3.Error as e:
+            conn.rollback()
+            return False, f"Lỗi khi tạo lại chỉ mục tìm kiếm sản phẩm: {e}"
+
 def db_update_product(product_id, name, description, unit_of_measure, price):
     """Cập nhật thông tin chi tiết của một sản phẩm đã có."""
-    conn = get_db_connection()
-    try:
-        current_time = datetime.datetime.now()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE products 
-            SET name = ?, description = ?, unit_of_measure = ?, price = ?, updated_at = ?
-            WHERE id = ?
-        ''', (name, description, unit_of_measure, int(price), current_time, product_id))
-        conn.commit()
-        return True, f"Cập nhật sản phẩm '{name}' thành công!"
-    except ValueError:
-        return False, "Lỗi: Đơn giá phải là số nguyên hợp lệ."
-    except Exception as e:
-        return False, f"Lỗi khi cập nhật sản phẩm: {e}"
-    finally:
-        conn.close()
+    with borrow_db_connection() as conn:
+        try:
+            current_time = datetime.datetime.now()
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE products 
+                SET name = ?, description = ?, unit_of_measure = ?, price = ?, updated_at = ?
+                WHERE id = ?
+            ''', (name, description, unit_of_measure, int(price), current_time, product_id))
+            conn.commit()
+            product_cache.invalidate(product_id)
+            return True, f"Cập nhật sản phẩm '{name}' thành công!"
+        except ValueError:
+            return False, "Lỗi: Đơn giá phải là số nguyên hợp lệ."
+        except Exception as e:
+            return False, f"Lỗi khi cập nhật sản phẩm: {e}"
 
 def db_delete_product_by_id(product_id):
     """Xóa mềm một sản phẩm: cập nhật cờ is_deleted = 1 và trả về thông báo chi tiết."""
-    conn = get_db_connection()
-    try:
-        # BƯỚC 1: Lấy thông tin sản phẩm (SKU, Tên) TRƯỚC khi xóa.
-        product_info = conn.execute("SELECT sku, name FROM products WHERE id = ?", (product_id,)).fetchone()
-
-        # Kiểm tra nếu không tìm thấy sản phẩm
-        if not product_info:
-            return False, f"Lỗi: Không tìm thấy sản phẩm với ID {product_id} để xóa."
-
-        # BƯỚC 2: Thực hiện xóa mềm (UPDATE)
-        current_time = datetime.datetime.now()
-        conn.execute("UPDATE products SET is_deleted = 1, updated_at = ? WHERE id = ?", (current_time, product_id))
-        conn.commit()
-
-        # BƯỚC 3: Tạo thông báo thành công với thông tin vừa lấy được
-        sku = product_info['sku']
-        product_name = product_info['name']
-        success_message = f"Ẩn sản phẩm {sku} - {product_name} thành công"
-        
-        return True, success_message
-        
-    except Exception as e:
-        # Trong trường hợp có lỗi, rollback để đảm bảo an toàn
-        conn.rollback()
-        return False, f"Lỗi cơ sở dữ liệu khi xóa sản phẩm: {e}"
-    finally:
-        conn.close()
+    with borrow_db_connection() as conn:
+        try:
+            # BƯỚC 1: Lấy thông tin sản phẩm (SKU, Tên) TRƯỚC khi xóa.
+            product_info = conn.execute("SELECT sku, name FROM products WHERE id = ?", (product_id,)).fetchone()
+
+            # Kiểm tra nếu không tìm thấy sản phẩm
+            if not product_info:
+                return False, f"Lỗi: Không tìm thấy sản phẩm với ID {product_id} để xóa."
+
+            # BƯỚC 2: Thực hiện xóa mềm (UPDATE)
+            current_time = datetime.datetime.now()
+            conn.execute("UPDATE products SET is_deleted = 1, updated_at = ? WHERE id = ?", (current_time, product_id))
+            conn.commit()
+            product_cache.invalidate(product_id)
+
+            # BƯỚC 3: Tạo thông báo thành công với thông tin vừa lấy được
+            sku = product_info['sku']
+            product_name = product_info['name']
+            success_message = f"Ẩn sản phẩm {sku} - {product_name} thành công"
+            
+            return True, success_message
+            
+        except Exception as e:
+            # Trong trường hợp có lỗi, rollback để đảm bảo an toàn
+            conn.rollback()
+            return False, f"Lỗi cơ sở dữ liệu khi xóa sản phẩm: {e}"
         
 def db_get_all_hidden_products(sort_by='name', order='ASC'):
     """
     Lấy tất cả sản phẩm đã bị ẩn (is_deleted = 1) từ cơ sở dữ liệu.
     """
-    conn = get_db_connection()
     valid_sort_columns = ['name', 'sku', 'current_stock', 'price', 'updated_at', 'id', 'unit_of_measure']
     if sort_by not in valid_sort_columns: sort_by = 'name'
     order_direction = 'ASC' if order.upper() == 'ASC' else 'DESC'
     
     # THAY ĐỔI: Thêm điều kiện `WHERE is_deleted = 1`
     query = f"SELECT id, name, sku, description, unit_of_measure, current_stock, price, updated_at FROM products WHERE is_deleted = 1 ORDER BY {sort_by} {order_direction}, id {order_direction}"
-    products = [dict(row) for row in conn.execute(query).fetchall()]
-    conn.close()
+    with borrow_db_connection() as conn:
+        products = [dict(row) for row in conn.execute(query).fetchall()]
     return products
 
 def db_restore_product_by_id(product_id):
     """
     Khôi phục một sản phẩm đã ẩn bằng cách cập nhật cờ is_deleted = 0.
     """
-    conn = get_db_connection()
-    try:
-        current_time = datetime.datetime.now()
-        product_info = conn.execute("SELECT sku, name FROM products WHERE id = ?", (product_id,)).fetchone()
+    with borrow_db_connection() as conn:
+        try:
+            current_time = datetime.datetime.now()
+            product_info = conn.execute("SELECT sku, name FROM products WHERE id = ?", (product_id,)).fetchone()
 
-        if not product_info:
-            return False, f"Lỗi: Không tìm thấy sản phẩm với ID {product_id} để khôi phục."
+            if not product_info:
+                return False, f"Lỗi: Không tìm thấy sản phẩm với ID {product_id} để khôi phục."
 
-        conn.execute("UPDATE products SET is_deleted = 0, updated_at = ? WHERE id = ?", (current_time, product_id))
-        conn.commit()
-        
-        sku = product_info['sku']
-        product_name = product_info['name']
-        success_message = f"Hiển thị lại sản phẩm {sku} - {product_name} thành công"
-        
-        return True, success_message
-        
-    except Exception as e:
-        conn.rollback()
-        return False, f"Lỗi cơ sở dữ liệu khi khôi phục sản phẩm: {e}"
-    finally:
-        conn.close()
+            conn.execute("UPDATE products SET is_deleted = 0, updated_at = ? WHERE id = ?", (current_time, product_id))
+            conn.commit()
+            product_cache.invalidate(product_id)
+            
+            sku = product_info['sku']
+            product_name = product_info['name']
+            success_message = f"Hiển thị lại sản phẩm {sku} - {product_name} thành công"
+            
+            return True, success_message
+            
+        except Exception as e:
+            conn.rollback()
+            return False, f"Lỗi cơ sở dữ liệu khi khôi phục sản phẩm: {e}"
@@ -3,31 +3,43 @@
 # Các hàm này chịu trách nhiệm nhận request, gọi đến lớp logic/database để xử lý
 # và tạo ra nội dung HTML để trả về cho người dùng.
 
+import json
 from urllib.parse import quote_plus
 from . import database as db_product
 from . import logic as logic_product
+from . import suggest
 from ..common import html_templates as tmpl
 
+# Số sản phẩm trên một trang của danh sách sản phẩm & tồn kho.
+PRODUCTS_PAGE_SIZE = 50
+
 def handle_get_products_stock(handler, query_params):
     """
     Xử lý GET request cho trang danh sách sản phẩm và tồn kho.
     Hỗ trợ tìm kiếm và sắp xếp danh sách.
+    Nội dung trang là một generator nên được gửi dạng luồng: form tìm kiếm đến trình duyệt
+    trước khi truy vấn DB, các dòng của bảng được gửi dần khi được tạo ra.
 
     Args:
         handler: Đối tượng request handler.
         query_params (dict): Dictionary chứa các tham số từ query string của URL.
 
     Returns:
-        tuple: (str_tiêu_đề_trang, str_nội_dung_html)
+        tuple: (str_tiêu_đề_trang, generator_các_mảnh_html)
     """
+    return "Quản lý Sản phẩm & Tồn kho", _sinh_trang_san_pham_ton_kho(query_params)
+
+def _sinh_trang_san_pham_ton_kho(query_params):
+    """Sinh từng mảnh HTML của trang sản phẩm & tồn kho (xem `handle_get_products_stock`)."""
     # Lấy các tham số tìm kiếm và sắp xếp từ URL
-    page_title = "Quản lý Sản phẩm & Tồn kho"
     search_term_query = query_params.get('search_term', [''])[0]
-    sort_column = query_params.get('sort', ['name'])[0]
+    # Khi tìm kiếm, mặc định xếp kết quả theo mức độ phù hợp
+    default_sort = db_product.SORT_BY_RELEVANCE if search_term_query else 'name'
+    sort_column = query_params.get('sort', [default_sort])[0]
     sort_order = query_params.get('order', ['ASC'])[0]
 
-    # Tạo form tìm kiếm
-    body_content = f"""
+    # Form tìm kiếm được gửi ngay, trước khi truy vấn DB
+    yield f"""
     <h3>Tìm kiếm Sản phẩm</h3>
     <form method="GET" action="/products_stock">
         <label for="search_term">Nhập Mã SKU hoặc Tên sản phẩm:</label>
@@ -36,46 +48,36 @@ def handle_get_products_stock(handler, query_params):
         {"<a href='/products_stock' class='btn btn-secondary'>Xem tất cả</a>" if search_term_query else ""}
     </form><hr>"""
 
-    # Lấy dữ liệu sản phẩm dựa trên việc có tìm kiếm hay không
+    # Lấy một trang sản phẩm theo con trỏ (có tìm kiếm hoặc không), giữ nguyên cách sắp xếp hiện tại
+    page = db_product.db_get_products_keyset(
+        sort_by=sort_column, order=sort_order, search_term=search_term_query or None,
+        limit=PRODUCTS_PAGE_SIZE,
+        after=query_params.get('after', [''])[0], before=query_params.get('before', [''])[0])
+    products_data = page['items']
     if search_term_query:
-        products_data = db_product.db_search_products_flexible(search_term_query)
-        body_content += f"<h3>Kết quả tìm kiếm cho: '{search_term_query}'</h3>"
+        yield f"<h3>Kết quả tìm kiếm cho: '{search_term_query}'</h3>"
+        if sort_column != db_product.SORT_BY_RELEVANCE:
+            yield (f'<p><a href="/products_stock?sort={db_product.SORT_BY_RELEVANCE}'
+                   f'&search_term={quote_plus(search_term_query)}">Xếp theo mức độ phù hợp</a></p>')
     else:
-        products_data = db_product.db_get_all_products(sort_by=sort_column, order=sort_order)
-        body_content += "<h3>Danh sách tất cả sản phẩm</h3>"
+        yield "<h3>Danh sách tất cả sản phẩm</h3>"
+    page_params = {'search_term': search_term_query, 'sort': sort_column, 'order': sort_order}
+    pagination_html = tmpl.pagination_links('/products_stock', page_params, page['next'], page['prev'])
         
-    # Hàm nội bộ để tạo link sắp xếp trên header của bảng
+    # Hàm nội bộ để tạo link sắp xếp trên header của bảng (đổi cách sắp xếp thì quay về trang đầu)
     def sort_link(column_key, display_name):
         new_order = 'DESC' if sort_column == column_key and sort_order == 'ASC' else 'ASC'
         arrow = ' &uarr;' if sort_column == column_key and sort_order == 'ASC' else ' &darr;' if sort_column == column_key else ''
-        return f'<a href="/products_stock?sort={column_key}&order={new_order}">{display_name}{arrow}</a>'
- 
-    # Tạo các hàng của bảng sản phẩm
-    table_rows = ""
-    if products_data:
-        for p in products_data:
-            # Tạo HTML cho mỗi nút
-            edit_button_html = f'<a href="/products/edit/{p["id"]}" class="btn btn-edit">Sửa</a>'
-            # SỬA ĐỔI: Thêm class 'btn' cho nút Xóa để đảm bảo nó nằm cùng hàng
-            delete_button_html = f'<a href="/products/delete/{p["id"]}" class="btn btn-delete">Ẩn</a>'
-            
-            # Gộp 2 nút vào chung một ô <td>
-            table_rows += f"""<tr><td>{p.get('sku','N/A')}</td><td>{p.get('name','N/A')}</td>
-                <td>{p.get('unit_of_measure','N/A')}</td><td>{p.get('current_stock','N/A')}</td>
-                <td>{tmpl.format_currency(p.get('price','N/A'))}</td><td>{p.get('description','')}</td>
-                <td class="cell-center">{edit_button_html} {delete_button_html}</td></tr>"""
-    else:
-        # Cập nhật colspan thành 7
-        table_rows = "<tr><td colspan='7'>Không tìm thấy sản phẩm nào.</td></tr>"
+        search_param = f"&search_term={quote_plus(search_term_query)}" if search_term_query else ""
+        return f'<a href="/products_stock?sort={column_key}&order={new_order}{search_param}">{display_name}{arrow}</a>'
 
-    # Hoàn thiện bảng và thêm nút "Thêm sản phẩm"
-    body_content += f"""
+    # Nút "Thêm sản phẩm" và phần đầu bảng
+    yield f"""
         <div style="margin-bottom: 20px; display: flex; gap: 10px;">
             <a href="/products/add" class="btn">Thêm sản phẩm mới</a>
             <a href="/products/hidden" class="btn btn-secondary">Xem danh sách đã ẩn</a>
         </div>
-    """
-    body_content +=f"""
+    
         <table>
             <thead>
                 <tr>
@@ -88,10 +90,49 @@ def handle_get_products_stock(handler, query_params):
                     <th style="width: 15%;">Hành động</th>
                 </tr>
             </thead>
-            <tbody>{table_rows}</tbody>
-        </table>"""
+            <tbody>"""
+
+    # Mỗi hàng của bảng sản phẩm là một mảnh HTML riêng
+    for p in products_data:
+        # Tạo HTML cho mỗi nút
+        edit_button_html = f'<a href="/products/edit/{p["id"]}" class="btn btn-edit">Sửa</a>'
+        # SỬA ĐỔI: Thêm class 'btn' cho nút Xóa để đảm bảo nó nằm cùng hàng
+        delete_button_html = f'<a href="/products/delete/{p["id"]}" class="btn btn-delete">Ẩn</a>'
+
+        # Gộp 2 nút vào chung một ô <td>
+        yield f"""<tr><td>{p.get('sku','N/A')}</td><td>{p.get('name','N/A')}</td>
+            <td>{p.get('unit_of_measure','N/A')}</td><td>{p.get('current_stock','N/A')}</td>
+            <td>{tmpl.format_currency(p.get('price','N/A'))}</td><td>{p.get('description','')}</td>
+            <td class="cell-center">{edit_button_html} {delete_button_html}</td></tr>"""
+    if not products_data:
+        # Cập nhật colspan thành 7
+        yield "<tr><td colspan='7'>Không tìm thấy sản phẩm nào.</td></tr>"
 
-    return page_title, body_content
+    yield f"""</tbody>
+        </table>{pagination_html}"""
+
+def handle_get_product_suggestions(handler, query_params):
+    """
+    Xử lý GET request /products/suggest?q=&limit= : gợi ý sản phẩm khi gõ trên các form chọn sản phẩm.
+    Trả về JSON dạng [{"sku", "name", "current_stock", "price"}, ...]; thông tin sản phẩm được đọc
+    từ DB theo ID của các gợi ý (chỉ mục trong bộ nhớ chỉ chứa khóa tìm kiếm).
+
+    Args:
+        handler: Đối tượng request handler.
+        query_params (dict): Query string (q: chuỗi đang gõ, limit: số gợi ý tối đa).
+    """
+    text = query_params.get('q', [''])[0]
+    try:
+        limit = max(1, min(int(query_params.get('limit', [''])[0]), suggest.SUGGEST_LIMIT_MAX))
+    except ValueError:
+        limit = suggest.SUGGEST_LIMIT_DEFAULT
+    product_ids = suggest.product_index.suggest(text, limit)
+    # Sản phẩm vừa bị ẩn bởi tiến trình khác (chỉ mục chưa kịp nạp lại) không có trong kết quả.
+    products = db_product.db_get_products_by_ids(product_ids)
+    items = [{field: products[product_id][field] for field in ('sku', 'name', 'current_stock', 'price')}
+             for product_id in product_ids if product_id in products]
+    body = json.dumps(items, ensure_ascii=False).encode('utf-8')
+    handler._send_response_bytes(body, 'application/json; charset=utf-8')
 
 def handle_get_add_product(handler):
     """Xử lý GET request cho trang thêm sản phẩm, hiển thị form nhập liệu."""
@@ -4,6 +4,7 @@
 
 from ..common import quan_ly_du_lieu as qldl
 from . import database as db_product # Đổi tên để tránh nhầm lẫn
+from .suggest import product_index
 from ..transaction.database import db_check_product_has_transactions
 
 def them_san_pham_moi(sku, name, unit_of_measure, current_stock_str, price_str, description):
@@ -46,7 +47,8 @@ def them_san_pham_moi(sku, name, unit_of_measure, current_stock_str, price_str,
     )
     
     if product_id:
-        qldl.ghi_log_giao_dich(f"THEM_SP_WEB: SKU '{sku}', Tên '{name}'.")
+        product_index.product_changed(product_id)
+        qldl.ghi_log_giao_dich(f"THEM_SP_WEB: SKU '{sku}', Tên '{name}'.", event='THEM_SP_WEB', sku=sku)
         qldl.ghi_log_loi(f"Thêm sản phẩm (web): SKU '{sku}'. Thành công.")
         return True, add_msg
     else:
@@ -76,8 +78,9 @@ def sua_san_pham(product_id, name, unit_of_measure, price_str, description):
     
     # --- Bước 3: Ghi log ---
     if success:
+        product_index.product_changed(product_id)
         product = db_product.db_get_product_by_id(product_id)
-        qldl.ghi_log_giao_dich(f"SUA_SP_WEB: SKU '{product['sku']}', Tên '{name}'.")
+        qldl.ghi_log_giao_dich(f"SUA_SP_WEB: SKU '{product['sku']}', Tên '{name}'.", event='SUA_SP_WEB', sku=product['sku'])
     
     return success, message
 def xoa_san_pham(product_id):
@@ -92,7 +95,9 @@ def xoa_san_pham(product_id):
     # Bước 3: Gọi lớp database để xóa
     success, message = db_product.db_delete_product_by_id(product_id)
     if success:
-        qldl.ghi_log_giao_dich(f"XOA_MEM_SP_WEB: SKU '{product['sku']}', Tên '{product['name']}'.")
+        product_index.product_changed(product_id)
+        qldl.ghi_log_giao_dich(f"XOA_MEM_SP_WEB: SKU '{product['sku']}', Tên '{product['name']}'.",
+                               event='XOA_MEM_SP_WEB', sku=product['sku'])
         qldl.ghi_log_loi(f"Xoá mềm sản phẩm (web): SKU '{product['sku']}'. Thành công.")
 
     return success, message
@@ -107,7 +112,9 @@ def khoi_phuc_san_pham(product_id):
 
     success, message = db_product.db_restore_product_by_id(product_id)
     if success:
-        qldl.ghi_log_giao_dich(f"KHOI_PHUC_SP_WEB: SKU '{product['sku']}', Tên '{product['name']}'.")
+        product_index.product_changed(product_id)
+        qldl.ghi_log_giao_dich(f"KHOI_PHUC_SP_WEB: SKU '{product['sku']}', Tên '{product['name']}'.",
+                               event='KHOI_PHUC_SP_WEB', sku=product['sku'])
         qldl.ghi_log_loi(f"Khôi phục sản phẩm (web): SKU '{product['sku']}'. Thành công.")
 
     return success, message
\ No newline at end of file
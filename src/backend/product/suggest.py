@@ -0,0 +1,140 @@
+# /src/backend/product/suggest.py
+# File này chứa chỉ mục tiền tố (prefix index) trong bộ nhớ dùng để gợi ý sản phẩm khi gõ
+# (type-ahead) trên các form chọn sản phẩm, thay cho việc in toàn bộ danh mục thành <option>.
+#   - Mỗi sản phẩm chưa bị ẩn có hai khóa: SKU và tên đã chuẩn hóa (bỏ dấu, chữ thường).
+#   - Các khóa nằm trong một list đã sắp xếp; tìm theo tiền tố bằng `bisect`: O(log n).
+#     Chỉ mục chỉ giữ khóa và ID; thông tin sản phẩm của các gợi ý được đọc từ DB theo ID.
+#   - Khi thêm/sửa/ẩn/khôi phục sản phẩm qua lớp logic, chỉ mục được cập nhật ngay (không nạp lại).
+#   - Mỗi tiến trình có chỉ mục riêng. Bộ đếm 'product_catalog' trong bảng 'cache_versions'
+#     (do trigger tăng) cho biết danh mục có bị tiến trình khác / công cụ khác sửa hay không;
+#     nếu có, chỉ mục được nạp lại từ DB ở lần gợi ý tiếp theo.
+
+import bisect
+import threading
+from ..common.database_base import borrow_db_connection
+from ..common.text_search import normalize_text
+
+# Tên bộ đếm phiên bản danh mục sản phẩm trong bảng 'cache_versions'.
+CATALOG_VERSION_NAME = 'product_catalog'
+# Số gợi ý mặc định / tối đa cho một lần gõ.
+SUGGEST_LIMIT_DEFAULT = 10
+SUGGEST_LIMIT_MAX = 20
+
+# Ngăn cách khóa và ID trong một phần tử của chỉ mục ('\x00' nhỏ hơn mọi ký tự có thể gõ).
+_KEY_SEPARATOR = '\x00'
+
+def _read_catalog_version(conn):
+    row = conn.execute("SELECT version FROM cache_versions WHERE name = ?", (CATALOG_VERSION_NAME,)).fetchone()
+    return row[0] if row else 0
+
+def _index_keys(product_id, sku, name):
+    """Các phần tử của một sản phẩm trong chỉ mục (SKU và tên đã chuẩn hóa, không trùng nhau)."""
+    keys = {normalize_text(sku), normalize_text(name)}
+    return tuple(f"{key}{_KEY_SEPARATOR}{product_id}" for key in keys if key)
+
+class ProductPrefixIndex:
+    """
+    Chỉ mục tiền tố của danh mục sản phẩm, an toàn khi dùng từ nhiều luồng.
+
+    Ví dụ:
+        index = ProductPrefixIndex()
+        index.suggest('ao th')      # [id, ...] của các sản phẩm 'Áo thun ...'
+        index.product_changed(12)   # sau khi sửa sản phẩm ID 12
+    """
+
+    def __init__(self):
+        self._keys = []        # ['khóa\x00id', ...] đã sắp xếp
+        self._entries = {}     # id -> các phần tử của sản phẩm trong self._keys (dùng khi xóa/sửa)
+        self._version = None   # Phiên bản danh mục lúc nạp (None = chưa nạp / cần nạp lại)
+        self._lock = threading.Lock()
+
+    def _rebuild(self, conn):
+        """Nạp lại toàn bộ chỉ mục từ DB (phải giữ self._lock)."""
+        # Đọc phiên bản và danh mục trong cùng một transaction để có cùng một ảnh chụp dữ liệu.
+        entries = {}
+        conn.execute("BEGIN")
+        try:
+            version = _read_catalog_version(conn)
+            for product_id, sku, name in conn.execute("SELECT id, sku, name FROM products WHERE is_deleted = 0"):
+                entries[product_id] = _index_keys(product_id, sku, name)
+        finally:
+            conn.rollback()
+        keys = [key for product_keys in entries.values() for key in product_keys]
+        keys.sort()
+        self._keys, self._entries, self._version = keys, entries, version
+
+    def _ensure_fresh(self):
+        """Nạp lại chỉ mục nếu chưa nạp hoặc danh mục đã bị thay đổi từ nơi khác."""
+        with borrow_db_connection() as conn:
+            version = _read_catalog_version(conn)
+            if version == self._version:
+                return
+            with self._lock:
+                if version != self._version:
+                    self._rebuild(conn)
+
+    def _remove(self, product_id):
+        for key in self._entries.pop(product_id, ()):
+            position = bisect.bisect_left(self._keys, key)
+            if position < len(self._keys) and self._keys[position] == key:
+                del self._keys[position]
+
+    def _add(self, product_id, sku, name):
+        self._entries[product_id] = _index_keys(product_id, sku, name)
+        for key in self._entries[product_id]:
+            bisect.insort(self._keys, key)
+
+    def product_changed(self, product_id):
+        """
+        Cập nhật chỉ mục sau khi sản phẩm `product_id` được thêm, sửa, ẩn hoặc khôi phục (đã commit).
+        Nếu ngoài thay đổi này còn có thay đổi khác chưa được ghi nhận (phiên bản tăng hơn 1),
+        chỉ mục được đánh dấu để nạp lại toàn bộ ở lần gợi ý tiếp theo.
+        """
+        with borrow_db_connection() as conn:
+            conn.execute("BEGIN")
+            try:
+                version = _read_catalog_version(conn)
+                row = conn.execute("SELECT sku, name, is_deleted FROM products WHERE id = ?", (product_id,)).fetchone()
+            finally:
+                conn.rollback()
+        with self._lock:
+            if self._version is None:
+                return # Chưa nạp: lần gợi ý đầu tiên sẽ nạp dữ liệu mới nhất.
+            if version != self._version + 1:
+                self._version = None
+                return
+            self._remove(product_id)
+            if row is not None and not row['is_deleted']:
+                self._add(product_id, row['sku'], row['name'])
+            self._version = version
+
+    def suggest(self, text, limit=SUGGEST_LIMIT_DEFAULT):
+        """
+        Tìm các sản phẩm có SKU hoặc tên bắt đầu bằng `text` (không phân biệt dấu, hoa/thường).
+
+        Returns:
+            list: ID của tối đa `limit` sản phẩm, theo thứ tự chữ cái của khóa khớp.
+        """
+        prefix = normalize_text(text)
+        if not prefix:
+            return []
+        self._ensure_fresh()
+        results = []
+        seen = set()
+        with self._lock:
+            keys = self._keys
+            position = bisect.bisect_left(keys, prefix)
+            while position < len(keys) and len(results) < limit and keys[position].startswith(prefix):
+                product_id = int(keys[position].rsplit(_KEY_SEPARATOR, 1)[1])
+                position += 1
+                if product_id not in seen:
+                    seen.add(product_id)
+                    results.append(product_id)
+        return results
+
+    def warm_up(self):
+        """Nạp trước chỉ mục (dùng cho bước warm-up trước khi nhận request)."""
+        self._ensure_fresh()
+
+# Chỉ mục dùng chung trong tiến trình.
+product_index = ProductPrefixIndex()
@@ -3,11 +3,11 @@
 # Các hàm này thường phức tạp hơn, liên quan đến tổng hợp (aggregation),
 # nhóm (grouping) và nối (joining) các bảng.
 
-from ..common.database_base import get_db_connection
+import sqlite3
+from ..common.database_base import borrow_db_connection, build_timestamp_range
 
 def db_get_low_stock_products(threshold): 
     """Lấy danh sách sản phẩm có tồn kho thấp hơn hoặc bằng ngưỡng cho trước."""
-    conn = get_db_connection()
     try:
         # Đảm bảo ngưỡng là một số nguyên hợp lệ
         valid_threshold = int(threshold)
@@ -16,117 +16,190 @@ def db_get_low_stock_products(threshold):
         return []
     
     query = "SELECT id, name, sku, unit_of_measure, current_stock, price, description FROM products WHERE current_stock <= ? ORDER BY current_stock ASC, name ASC"
-    products = [dict(row) for row in conn.execute(query, (valid_threshold,)).fetchall()]
-    conn.close()
+    with borrow_db_connection() as conn:
+        products = [dict(row) for row in conn.execute(query, (valid_threshold,)).fetchall()]
     return products
 
 def db_get_revenue_data(start_date_str, end_date_str, group_by='day'):
-    """Lấy dữ liệu doanh thu (từ các giao dịch 'OUT') theo thời gian."""
-    conn = get_db_connection()
+    """
+    Lấy dữ liệu doanh thu (từ các giao dịch 'OUT') theo thời gian.
+    Đọc từ bảng tổng hợp 'daily_product_rollup' (mỗi dòng một sản phẩm/ngày) thay vì
+    nhóm lại toàn bộ bảng giao dịch.
+    """
     params = []
     # Xây dựng câu lệnh WHERE một cách linh hoạt dựa trên các bộ lọc được cung cấp
-    query_conditions = ["transaction_type = 'OUT'"]
-    if start_date_str:
-        query_conditions.append("strftime('%Y-%m-%d', timestamp) >= ?")
-        params.append(start_date_str)
-    if end_date_str:
-        query_conditions.append("strftime('%Y-%m-%d', timestamp) <= ?")
-        params.append(end_date_str)
+    query_conditions = ["out_qty > 0"]
+    range_conditions, range_params = build_timestamp_range("day", start_date_str, end_date_str)
+    query_conditions += range_conditions
+    params += range_params
     
     where_clause = " AND ".join(query_conditions)
-    # Định dạng ngày để nhóm (GROUP BY) theo ngày hoặc tháng
-    date_format_sqlite = '%Y-%m-%d' if group_by == 'day' else '%Y-%m'
-    query = f"SELECT strftime('{date_format_sqlite}', timestamp) as period, SUM(total_amount) as revenue FROM stock_transactions WHERE {where_clause} GROUP BY period ORDER BY period ASC"
+    # Cột 'day' có dạng 'YYYY-MM-DD': nhóm theo tháng chỉ cần lấy 7 ký tự đầu.
+    period_length = 10 if group_by == 'day' else 7
+    query = f"SELECT substr(day, 1, {period_length}) as period, SUM(revenue) as revenue FROM daily_product_rollup WHERE {where_clause} GROUP BY period ORDER BY period ASC"
     
-    data = [dict(row) for row in conn.execute(query, tuple(params)).fetchall()]
-    conn.close()
+    with borrow_db_connection() as conn:
+        data = [dict(row) for row in conn.execute(query, tuple(params)).fetchall()]
     return data
 
 def db_get_product_flow_data(product_id, start_date_str, end_date_str, group_by='day'):
-    """Lấy dữ liệu nhập/xuất của một sản phẩm cụ thể theo thời gian."""
-    conn = get_db_connection()
+    """Lấy dữ liệu nhập/xuất của một sản phẩm cụ thể theo thời gian (từ bảng tổng hợp theo ngày)."""
     params = [product_id]
-    query_conditions = ["st.product_id = ?"]
-    if start_date_str:
-        query_conditions.append("strftime('%Y-%m-%d', st.timestamp) >= ?")
-        params.append(start_date_str)
-    if end_date_str:
-        query_conditions.append("strftime('%Y-%m-%d', st.timestamp) <= ?")
-        params.append(end_date_str)
+    query_conditions = ["product_id = ?"]
+    range_conditions, range_params = build_timestamp_range("day", start_date_str, end_date_str)
+    query_conditions += range_conditions
+    params += range_params
         
     where_clause = " AND ".join(query_conditions)
-    date_format_sqlite = '%Y-%m-%d' if group_by == 'day' else '%Y-%m'
-    query = f"SELECT strftime('{date_format_sqlite}', st.timestamp) as period, st.transaction_type, SUM(st.quantity) as total_quantity FROM stock_transactions st WHERE {where_clause} GROUP BY period, st.transaction_type ORDER BY period ASC"
+    period_length = 10 if group_by == 'day' else 7
+    query = f"SELECT substr(day, 1, {period_length}) as period, SUM(in_qty) as in_qty, SUM(out_qty) as out_qty FROM daily_product_rollup WHERE {where_clause} GROUP BY period ORDER BY period ASC"
     
-    data = [dict(row) for row in conn.execute(query, tuple(params)).fetchall()]
-    conn.close()
+    data = []
+    with borrow_db_connection() as conn:
+        for row in conn.execute(query, tuple(params)).fetchall():
+            # Giữ định dạng kết quả cũ: mỗi dòng là (kỳ, loại giao dịch, tổng số lượng).
+            if row['in_qty'] > 0:
+                data.append({'period': row['period'], 'transaction_type': 'IN', 'total_quantity': row['in_qty']})
+            if row['out_qty'] > 0:
+                data.append({'period': row['period'], 'transaction_type': 'OUT', 'total_quantity': row['out_qty']})
     return data
 
 def db_get_revenue_by_product(start_date_str, end_date_str):
-    """Lấy tổng doanh thu theo từng sản phẩm trong khoảng thời gian."""
-    conn = get_db_connection()
+    """Lấy tổng doanh thu theo từng sản phẩm trong khoảng thời gian (từ bảng tổng hợp theo ngày)."""
     params = []
-    query_conditions = ["st.transaction_type = 'OUT'"]
-
-    if start_date_str:
-        query_conditions.append("strftime('%Y-%m-%d', st.timestamp) >= ?")
-        params.append(start_date_str)
-    if end_date_str:
-        query_conditions.append("strftime('%Y-%m-%d', st.timestamp) <= ?")
-        params.append(end_date_str)
+    query_conditions = ["r.out_qty > 0"]
+
+    range_conditions, range_params = build_timestamp_range("r.day", start_date_str, end_date_str)
+    query_conditions += range_conditions
+    params += range_params
     
     where_clause = " AND ".join(query_conditions)
     
     query = f"""
-        SELECT p.sku, p.name as product_name, SUM(st.total_amount) as total_revenue, SUM(st.quantity) as total_quantity_sold
-        FROM stock_transactions st
-        JOIN products p ON st.product_id = p.id
+        SELECT p.sku, p.name as product_name, SUM(r.revenue) as total_revenue, SUM(r.out_qty) as total_quantity_sold
+        FROM daily_product_rollup r
+        JOIN products p ON r.product_id = p.id
         WHERE {where_clause}
         GROUP BY p.id, p.sku, p.name
-        HAVING SUM(st.total_amount) > 0
+        HAVING SUM(r.revenue) > 0
         ORDER BY total_revenue DESC
     """
-    data = [dict(row) for row in conn.execute(query, tuple(params)).fetchall()]
-    conn.close()
+    with borrow_db_connection() as conn:
+        data = [dict(row) for row in conn.execute(query, tuple(params)).fetchall()]
     return data
 
+def db_rebuild_daily_product_rollup():
+    """
+    Tính lại toàn bộ bảng 'daily_product_rollup' từ bảng 'stock_transactions'.
+    Dùng khi dữ liệu giao dịch bị sửa trực tiếp ngoài ứng dụng. Việc xóa và tính lại
+    nằm trong một transaction nên các báo cáo không bao giờ thấy bảng tổng hợp dở dang.
+
+    Returns:
+        tuple: (bool_thành_công, str_thông_báo)
+    """
+    with borrow_db_connection() as conn:
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM daily_product_rollup")
+            cursor = conn.execute('''
+                INSERT INTO daily_product_rollup (day, product_id, in_qty, out_qty, revenue, txn_count)
+                SELECT COALESCE(substr(timestamp, 1, 10), ''), product_id,
+                       SUM(CASE WHEN transaction_type = 'IN' THEN quantity ELSE 0 END),
+                       SUM(CASE WHEN transaction_type = 'OUT' THEN quantity ELSE 0 END),
+                       COALESCE(SUM(CASE WHEN transaction_type = 'OUT' THEN total_amount ELSE 0 END), 0),
+                       COUNT(*)
+                FROM stock_transactions
+                GROUP BY 1, product_id
+            ''')
+            row_count = cursor.rowcount
+            conn.commit()
+            return True, f"Đã tính lại bảng tổng hợp theo ngày: {row_count} dòng (sản phẩm x ngày)."
+        except sqlite3.Error as e:
+            conn.rollback()
+            return False, f"Lỗi khi tính lại bảng tổng hợp theo ngày: {e}"
+
+# Các cột của bảng 'dashboard_counters' (xem migration 4 trong common/migrations.py).
+DASHBOARD_COUNTER_COLUMNS = ('active_products', 'hidden_products', 'total_in_transactions',
+                             'total_out_transactions', 'total_revenue', 'current_warehouse_value')
+
+# Tính các chỉ số bằng cách quét toàn bộ dữ liệu (chỉ dùng để kiểm tra / tính lại bộ đếm).
+_DASHBOARD_FULL_SCAN_QUERY = """
+    SELECT (SELECT COUNT(*) FROM products WHERE COALESCE(is_deleted, 0) = 0) AS active_products,
+           (SELECT COUNT(*) FROM products WHERE COALESCE(is_deleted, 0) <> 0) AS hidden_products,
+           (SELECT COUNT(*) FROM stock_transactions WHERE transaction_type = 'IN') AS total_in_transactions,
+           (SELECT COUNT(*) FROM stock_transactions WHERE transaction_type = 'OUT') AS total_out_transactions,
+           (SELECT COALESCE(SUM(total_amount), 0) FROM stock_transactions WHERE transaction_type = 'OUT') AS total_revenue,
+           (SELECT COALESCE(SUM(current_stock * price), 0) FROM products) AS current_warehouse_value
+"""
+
 def db_get_dashboard_stats():
-    """Lấy các thống kê chính cho trang chủ (dashboard)."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    """
+    Lấy các thống kê chính cho trang chủ (dashboard) từ bảng bộ đếm 'dashboard_counters'
+    (một dòng duy nhất, được trigger cập nhật khi ghi dữ liệu) thay vì quét các bảng.
+    'total_products' gồm cả sản phẩm đang hiển thị và đã ẩn; giá trị tồn kho tính trên tất cả sản phẩm.
+    """
     stats = {
         'total_products': 0,
+        'active_products': 0,
+        'hidden_products': 0,
         'total_in_transactions': 0,
         'total_out_transactions': 0,
         'current_warehouse_value': 0,
         'total_revenue': 0
     }
-    try:
-        # 1. Tổng số sản phẩm
-        cursor.execute("SELECT COUNT(id) FROM products")
-        stats['total_products'] = cursor.fetchone()[0]
-
-        # 2. Tổng số giao dịch Nhập
-        cursor.execute("SELECT COUNT(id) FROM stock_transactions WHERE transaction_type = 'IN'")
-        stats['total_in_transactions'] = cursor.fetchone()[0]
+    with borrow_db_connection() as conn:
+        try:
+            row = conn.execute(f"SELECT {', '.join(DASHBOARD_COUNTER_COLUMNS)} FROM dashboard_counters WHERE id = 1").fetchone()
+            if row is None:
+                # Bảng bộ đếm chưa được khởi tạo: tính trực tiếp.
+                row = conn.execute(_DASHBOARD_FULL_SCAN_QUERY).fetchone()
+            stats.update(dict(row))
+            stats['total_products'] = stats['active_products'] + stats['hidden_products']
+        except Exception as e:
+            print(f"Lỗi khi lấy dữ liệu thống kê cho trang chủ: {e}")
 
-        # 3. Tổng số giao dịch Xuất
-        cursor.execute("SELECT COUNT(id) FROM stock_transactions WHERE transaction_type = 'OUT'")
-        stats['total_out_transactions'] = cursor.fetchone()[0]
+    return stats
 
-        # 4. Giá trị kho hiện tại (Tổng của (tồn kho * đơn giá) cho mỗi sản phẩm)
-        cursor.execute("SELECT SUM(current_stock * price) FROM products")
-        value = cursor.fetchone()[0]
-        stats['current_warehouse_value'] = value if value is not None else 0
+def db_verify_dashboard_counters():
+    """
+    So sánh bảng bộ đếm với kết quả quét toàn bộ dữ liệu.
 
-        # 5. Tổng doanh thu (Tổng tiền của các giao dịch xuất)
-        cursor.execute("SELECT SUM(total_amount) FROM stock_transactions WHERE transaction_type = 'OUT'")
-        revenue = cursor.fetchone()[0]
-        stats['total_revenue'] = revenue if revenue is not None else 0
+    Returns:
+        tuple: (bool_khớp, str_thông_báo) - thông báo liệt kê các chỉ số bị lệch (nếu có).
+    """
+    with borrow_db_connection() as conn:
+        # Đọc cả hai trong cùng một transaction để có cùng một ảnh chụp dữ liệu.
+        conn.execute("BEGIN")
+        try:
+            counters = conn.execute(f"SELECT {', '.join(DASHBOARD_COUNTER_COLUMNS)} FROM dashboard_counters WHERE id = 1").fetchone()
+            expected = conn.execute(_DASHBOARD_FULL_SCAN_QUERY).fetchone()
+        finally:
+            conn.rollback()
+    if counters is None:
+        return False, "Bảng bộ đếm dashboard chưa có dữ liệu."
+    mismatches = [f"{col}: {counters[col]} (đúng: {expected[col]})"
+                  for col in DASHBOARD_COUNTER_COLUMNS if counters[col] != expected[col]]
+    if mismatches:
+        return False, "Bộ đếm dashboard bị lệch - " + "; ".join(mismatches)
+    return True, "Bộ đếm dashboard khớp với dữ liệu."
 
-    except Exception as e:
-        print(f"Lỗi khi lấy dữ liệu thống kê cho trang chủ: {e}")
-    finally:
-        conn.close()
+def db_rebuild_dashboard_counters():
+    """
+    Tính lại bảng bộ đếm dashboard từ dữ liệu gốc trong một transaction.
 
-    return stats
+    Returns:
+        tuple: (bool_thành_công, str_thông_báo)
+    """
+    with borrow_db_connection() as conn:
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            expected = conn.execute(_DASHBOARD_FULL_SCAN_QUERY).fetchone()
+            conn.execute("DELETE FROM dashboard_counters")
+            conn.execute(
+                f"INSERT INTO dashboard_counters (id, {', '.join(DASHBOARD_COUNTER_COLUMNS)}) VALUES (1, {', '.join('?' * len(DASHBOARD_COUNTER_COLUMNS))})",
+                tuple(expected[col] for col in DASHBOARD_COUNTER_COLUMNS))
+            conn.commit()
+            return True, "Đã tính lại bộ đếm dashboard."
+        except sqlite3.Error as e:
+            conn.rollback()
+            return False, f"Lỗi khi tính lại bộ đếm dashboard: {e}"
@@ -2,11 +2,15 @@
 # Chứa các hàm xử lý request cho các trang báo cáo và thống kê.
 
 import datetime
+import html
+from urllib.parse import urlencode
 from . import logic as logic_report
 from . import database as db_report
-from ..product.database import db_get_all_products, db_get_product_by_sku
+from ..product.database import db_get_product_by_sku
 from ..common import html_templates as tmpl
 from ..common import chart_utils as chart
+from ..common.chart_service import chart_service, make_etag
+from ..common.database_base import get_cache_version
 
 def handle_get_low_stock_report(handler, query_params):
     """Xử lý GET request cho báo cáo sản phẩm sắp hết hàng."""
@@ -39,11 +43,23 @@ def handle_get_low_stock_report(handler, query_params):
     
     return page_title, body_content
 
-def handle_get_charts_report(handler, query_params):
-    """Xử lý GET request cho trang thống kê và biểu đồ."""
-    page_title = "Thống kê & Báo cáo"
-    report_type = query_params.get('report_type', ['revenue_by_time'])[0]
+# Các loại biểu đồ được phục vụ qua route /charts/<loại>.
+CHART_KINDS = ('revenue_by_time', 'product_flow', 'revenue_by_product')
+# Số sản phẩm tối đa trên biểu đồ top sản phẩm theo doanh thu.
+TOP_PRODUCTS_CHART_SIZE = 15
+# Thời gian (giây) trình duyệt được giữ ảnh biểu đồ có URL gắn đúng phiên bản dữ liệu.
+CHART_BROWSER_MAX_AGE = 86400
+
+def _resolve_chart_filters(query_params):
+    """
+    Đọc các tham số lọc của báo cáo biểu đồ từ query string và chuẩn hóa chúng.
+    Dùng chung cho trang báo cáo và route ảnh /charts/<loại>, để cả hai luôn
+    hiểu cùng một bộ tham số theo cùng một cách.
 
+    Returns:
+        dict: group_by, start_query/end_query (YYYY-MM-DD, dùng truy vấn),
+              start_input/end_input (giá trị hiển thị trên form), sku.
+    """
     # Lấy các tham số filter thô từ URL
     group_by = query_params.get('group_by', ['day'])[0]
     raw_start_date = query_params.get('start_date', [''])[0]
@@ -76,7 +92,175 @@ def handle_get_charts_report(handler, query_params):
                     end_date_for_query = last_day_of_month.isoformat()
                 except (ValueError, TypeError):
                     end_date_for_query = raw_end_date + '-28'
-        
+
+    return {
+        'group_by': group_by, 'sku': selected_sku_flow,
+        'start_query': start_date_for_query, 'end_query': end_date_for_query,
+        'start_input': start_date_for_input, 'end_input': end_date_for_input,
+    }
+
+def _chart_cache_params(filters):
+    """Chuyển bộ lọc thành tuple (hashable) dùng làm khóa cache / ETag của biểu đồ."""
+    return tuple(sorted(filters.items()))
+
+def _build_revenue_by_time_chart(filters):
+    """Truy vấn dữ liệu và tạo tham số vẽ biểu đồ doanh thu theo thời gian (None nếu không có dữ liệu)."""
+    group_by = filters['group_by']
+    revenue_data_from_db = db_report.db_get_revenue_data(filters['start_query'], filters['end_query'], group_by)
+    revenue_map = {row['period']: row['revenue'] for row in revenue_data_from_db}
+    
+    periods = []
+    revenues = []
+
+    try:
+        start_dt = datetime.datetime.strptime(filters['start_query'], '%Y-%m-%d').date()
+        end_dt = datetime.datetime.strptime(filters['end_query'], '%Y-%m-%d').date()
+
+        if group_by == 'day':
+            current_dt = start_dt
+            while current_dt <= end_dt:
+                period_str = current_dt.strftime('%Y-%m-%d')
+                periods.append(period_str)
+                revenues.append(revenue_map.get(period_str, 0))
+                current_dt += datetime.timedelta(days=1)
+        else: # group_by == 'month'
+            unique_months = []
+            current_dt = start_dt
+            while current_dt <= end_dt:
+                month_str = current_dt.strftime('%Y-%m')
+                if not unique_months or unique_months[-1] != month_str:
+                    unique_months.append(month_str)
+                
+                # Tăng tháng lên 1 cách an toàn
+                next_month_first_day = (current_dt.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+                current_dt = next_month_first_day
+            
+            periods = unique_months
+            revenues = [revenue_map.get(p, 0) for p in periods]
+
+    except (ValueError, TypeError):
+         # Fallback nếu ngày tháng không hợp lệ
+         sorted_keys = sorted(revenue_map.keys())
+         periods = sorted_keys
+         revenues = [revenue_map[k] for k in sorted_keys]
+
+    if not periods:
+        return None
+    chart_title = f"Doanh thu từ {filters['start_input']} đến {filters['end_input']}"
+    return dict(dates=periods, values=revenues, title=chart_title, ylabel="Doanh thu (VNĐ)", chart_type='bar')
+
+def _build_product_flow_chart(filters, product):
+    """Tạo tham số vẽ biểu đồ xuất/nhập của một sản phẩm (None nếu không có dữ liệu)."""
+    flow_data = db_report.db_get_product_flow_data(product['id'], filters['start_query'], filters['end_query'], filters['group_by'])
+    if not flow_data:
+        return None
+    periods = sorted(list(set(row['period'] for row in flow_data)))
+    in_q = {p:0 for p in periods}; out_q = {p:0 for p in periods}
+    for row in flow_data:
+        if row['transaction_type'] == 'IN': in_q[row['period']] = row['total_quantity']
+        else: out_q[row['period']] = row['total_quantity']
+    val_in = [in_q[p] for p in periods]; val_out = [out_q[p] for p in periods]
+    chart_title = f"Xuất/Nhập cho {filters['sku']}"
+    return dict(dates=periods, values=val_in, title=chart_title, ylabel="Số lượng Nhập", chart_type='line',
+                y_values2=val_out, label2='Số lượng Xuất')
+
+def _build_revenue_by_product_chart(revenue_by_prod_data):
+    """Tạo tham số vẽ biểu đồ top sản phẩm theo doanh thu từ kết quả `db_get_revenue_by_product`."""
+    if not revenue_by_prod_data:
+        return None
+    top_items = revenue_by_prod_data[:TOP_PRODUCTS_CHART_SIZE]
+    product_names = [f"{item['product_name']}" for item in top_items]
+    revenues = [item['total_revenue'] for item in top_items]
+    chart_title = f"Top {TOP_PRODUCTS_CHART_SIZE} Sản phẩm theo Doanh thu"
+    return dict(dates=product_names, values=revenues, title=chart_title, ylabel="Doanh thu (VNĐ)",
+                x_labels_override=product_names, chart_type='bar')
+
+def _build_chart(chart_kind, filters):
+    """Tạo tham số vẽ cho một loại biểu đồ. Trả về None nếu không có dữ liệu."""
+    if chart_kind == 'revenue_by_time':
+        return _build_revenue_by_time_chart(filters)
+    if chart_kind == 'product_flow':
+        product = db_get_product_by_sku(filters['sku']) if filters['sku'] else None
+        return _build_product_flow_chart(filters, product) if product else None
+    if chart_kind == 'revenue_by_product':
+        return _build_revenue_by_product_chart(db_report.db_get_revenue_by_product(filters['start_query'], filters['end_query']))
+    return None
+
+def _chart_image_url(chart_kind, filters, data_version):
+    """
+    Tạo URL ảnh /charts/<loại> với cùng bộ lọc. Tham số 'v' (phiên bản dữ liệu) làm URL
+    thay đổi khi dữ liệu thay đổi, nên trình duyệt có thể giữ ảnh trong cache lâu dài.
+    """
+    query = {'group_by': filters['group_by'], 'start_date': filters['start_input'],
+             'end_date': filters['end_input'], 'v': data_version}
+    if chart_kind == 'product_flow':
+        query['product_sku_flow'] = filters['sku']
+    return html.escape(f"/charts/{chart_kind}?{urlencode(query)}")
+
+def _etag_matches(if_none_match, etag):
+    """Kiểm tra header If-None-Match (có thể chứa nhiều ETag, dạng W/"...") có khớp với ETag hiện tại."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return etag in (tag.strip().removeprefix('W/') for tag in if_none_match.split(','))
+
+def handle_get_chart_image(handler, chart_kind, query_params):
+    """
+    Xử lý GET /charts/<loại>: trả về ảnh biểu đồ (format=svg hoặc format=png; mặc định
+    theo bộ vẽ đang dùng - SVG cho bộ vẽ thuần Python, PNG cho matplotlib).
+    Nhận cùng các tham số lọc như trang báo cáo. ETag được tính từ loại biểu đồ, bộ lọc
+    và phiên bản dữ liệu, nên request có If-None-Match khớp được trả 304 mà không cần
+    truy vấn dữ liệu hay vẽ lại.
+    """
+    if chart_kind not in CHART_KINDS:
+        handler.send_error(404, "Chart Not Found")
+        return
+    available, err_msg = chart.chart_backend_available()
+    if not available:
+        handler.send_error(503, "Service Unavailable", err_msg)
+        return
+    image_format = query_params.get('format', [chart.default_image_format()])[0]
+    if not chart.supports_image_format(image_format):
+        handler.send_error(400, "Bad Request", f"Định dạng ảnh không hỗ trợ: '{image_format}'.")
+        return
+
+    filters = _resolve_chart_filters(query_params)
+    cache_params = _chart_cache_params(filters)
+    data_version = get_cache_version('report_data')
+    etag = make_etag(chart_kind, cache_params, data_version, image_format)
+    # URL có 'v' đúng phiên bản hiện tại sẽ không bao giờ đổi nội dung: cho phép cache lâu.
+    # Ngược lại, trình duyệt phải hỏi lại (và thường nhận 304 nhờ ETag).
+    if query_params.get('v', [''])[0] == str(data_version):
+        cache_control = f"private, max-age={CHART_BROWSER_MAX_AGE}"
+    else:
+        cache_control = "no-cache"
+    cache_headers = {'ETag': etag, 'Cache-Control': cache_control}
+
+    if _etag_matches(handler.headers.get('If-None-Match'), etag):
+        handler._send_response_bytes(b'', None, status_code=304, headers=cache_headers)
+        return
+
+    render_kwargs = _build_chart(chart_kind, filters)
+    if render_kwargs is None:
+        handler.send_error(404, "Not Found", "Không có dữ liệu cho biểu đồ với bộ lọc này.")
+        return
+    image_bytes, err_msg = chart_service.render_image(chart_kind, cache_params, data_version, render_kwargs, image_format)
+    if image_bytes is None:
+        handler.send_error(503, "Service Unavailable", err_msg)
+        return
+    handler._send_response_bytes(image_bytes, chart.IMAGE_CONTENT_TYPES[image_format], headers=cache_headers)
+
+def handle_get_charts_report(handler, query_params):
+    """Xử lý GET request cho trang thống kê và biểu đồ."""
+    page_title = "Thống kê & Báo cáo"
+    report_type = query_params.get('report_type', ['revenue_by_time'])[0]
+
+    filters = _resolve_chart_filters(query_params)
+    group_by = filters['group_by']
+    selected_sku_flow = filters['sku']
+    start_date_for_input, end_date_for_input = filters['start_input'], filters['end_input']
+
     # --- PHẦN 2: TẠO GIAO DIỆN HTML VÀ JAVASCRIPT ---
     # Chuyển giá trị hiển thị trên form thành YYYY-MM-DD nếu nó đang là YYYY-MM,
     # JavaScript sẽ xử lý việc thay đổi type và format lại.
@@ -115,14 +299,10 @@ def handle_get_charts_report(handler, query_params):
             </div>"""
 
     if report_type == 'product_flow':
-        products_db = db_get_all_products(sort_by='name')
-        product_options = "<option value=''>-- Chọn sản phẩm --</option>"
-        for p in products_db:
-            product_options += f"<option value='{p['sku']}' {'selected' if p['sku'] == selected_sku_flow else ''}>{p['name']} ({p['sku']})</option>"
         body_content += f"""
             <div>
                 <label for="product_sku_flow">Sản phẩm:</label>
-                <select name="product_sku_flow" id="product_sku_flow">{product_options}</select>
+                {tmpl.product_suggest_input('product_sku_flow', selected_sku_flow)}
             </div>"""
     
     body_content += f'<input type="submit" value="Xem" style="margin-top:20px;"></div></form>'
@@ -183,93 +363,44 @@ def handle_get_charts_report(handler, query_params):
     <hr>
     """
     
-    # --- PHẦN 3: LOGIC VẼ BIỂU ĐỒ ---
-    if not chart.MATPLOTLIB_AVAILABLE:
-        body_content += "<p class='error'>Chức năng biểu đồ không khả dụng: Thư viện 'matplotlib' chưa được cài đặt.</p>"
+    # --- PHẦN 3: BIỂU ĐỒ ---
+    # Ảnh biểu đồ được phục vụ qua route riêng /charts/<loại> (trình duyệt cache được),
+    # trang này chỉ kiểm tra có dữ liệu hay không và chèn thẻ <img>.
+    available, err_msg = chart.chart_backend_available()
+    if not available:
+        body_content += f"<p class='error'>{err_msg}</p>"
         return page_title, body_content
-    
+
+    data_version = get_cache_version('report_data')
+
     if report_type == 'revenue_by_time':
         body_content += "<h3>Biểu đồ Doanh thu xuất kho theo thời gian</h3>"
-        revenue_data_from_db = db_report.db_get_revenue_data(start_date_for_query, end_date_for_query, group_by)
-        revenue_map = {row['period']: row['revenue'] for row in revenue_data_from_db}
-        
-        periods = []
-        revenues = []
-
-        try:
-            start_dt = datetime.datetime.strptime(start_date_for_query, '%Y-%m-%d').date()
-            end_dt = datetime.datetime.strptime(end_date_for_query, '%Y-%m-%d').date()
-
-            if group_by == 'day':
-                current_dt = start_dt
-                while current_dt <= end_dt:
-                    period_str = current_dt.strftime('%Y-%m-%d')
-                    periods.append(period_str)
-                    revenues.append(revenue_map.get(period_str, 0))
-                    current_dt += datetime.timedelta(days=1)
-            else: # group_by == 'month'
-                unique_months = []
-                current_dt = start_dt
-                while current_dt <= end_dt:
-                    month_str = current_dt.strftime('%Y-%m')
-                    if not unique_months or unique_months[-1] != month_str:
-                        unique_months.append(month_str)
-                    
-                    # Tăng tháng lên 1 cách an toàn
-                    next_month_first_day = (current_dt.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
-                    current_dt = next_month_first_day
-                
-                periods = unique_months
-                revenues = [revenue_map.get(p, 0) for p in periods]
-
-        except (ValueError, TypeError):
-             # Fallback nếu ngày tháng không hợp lệ
-             sorted_keys = sorted(revenue_map.keys())
-             periods = sorted_keys
-             revenues = [revenue_map[k] for k in sorted_keys]
-
-        if periods:
-            chart_title = f"Doanh thu từ {start_date_for_input} đến {end_date_for_input}"
-            img_base64, err_msg = chart.generate_chart_image_base64(periods, revenues, chart_title, "Doanh thu (VNĐ)", chart_type='bar')
-            if img_base64: body_content += f'<img src="{img_base64}" alt="Biểu đồ doanh thu">'
-            else: body_content += f"<p class='error'>Lỗi tạo biểu đồ: {err_msg}</p>"
+        if _build_revenue_by_time_chart(filters):
+            body_content += f'<img src="{_chart_image_url(report_type, filters, data_version)}" alt="Biểu đồ doanh thu">'
         else:
             body_content += "<p>Không có dữ liệu doanh thu cho bộ lọc này.</p>"
     
     elif report_type == 'product_flow' and selected_sku_flow:
         product = db_get_product_by_sku(selected_sku_flow)
-        body_content += f"<h3>Biểu đồ Xuất/Nhập cho: {product['name']}</h3>"
-        flow_data = db_report.db_get_product_flow_data(product['id'], start_date_for_query, end_date_for_query, group_by)
-        if flow_data:
-            periods = sorted(list(set(row['period'] for row in flow_data)))
-            in_q = {p:0 for p in periods}; out_q = {p:0 for p in periods}
-            for row in flow_data:
-                if row['transaction_type'] == 'IN': in_q[row['period']] = row['total_quantity']
-                else: out_q[row['period']] = row['total_quantity']
-            val_in = [in_q[p] for p in periods]; val_out = [out_q[p] for p in periods]
-            chart_title = f"Xuất/Nhập cho {selected_sku_flow}"
-            img_base64, err_msg = chart.generate_chart_image_base64(periods, val_in, chart_title, "Số lượng Nhập", chart_type='line', y_values2=val_out, label2='Số lượng Xuất')
-            if img_base64: body_content += f'<img src="{img_base64}" alt="Biểu đồ xuất nhập">'
-            else: body_content += f"<p class='error'>Lỗi tạo biểu đồ: {err_msg}</p>"
-        else: body_content += "<p>Không có dữ liệu cho sản phẩm và bộ lọc này.</p>"
+        if not product:
+            body_content += f"<p class='error'>Không tìm thấy sản phẩm có SKU '{html.escape(selected_sku_flow)}'.</p>"
+        else:
+            body_content += f"<h3>Biểu đồ Xuất/Nhập cho: {product['name']}</h3>"
+            if _build_product_flow_chart(filters, product):
+                body_content += f'<img src="{_chart_image_url(report_type, filters, data_version)}" alt="Biểu đồ xuất nhập">'
+            else: body_content += "<p>Không có dữ liệu cho sản phẩm và bộ lọc này.</p>"
     
     elif report_type == 'revenue_by_product':
         body_content += "<h3>Thống kê Doanh thu theo Sản phẩm</h3>"
-        revenue_by_prod_data = db_report.db_get_revenue_by_product(start_date_for_query, end_date_for_query)
+        revenue_by_prod_data = db_report.db_get_revenue_by_product(filters['start_query'], filters['end_query'])
         if revenue_by_prod_data:
-            table_rows, product_names, revenues = "", [], []
+            table_rows = ""
             for item in revenue_by_prod_data:
                 table_rows += f"<tr><td>{item['sku']}</td><td>{item['product_name']}</td><td>{item['total_quantity_sold']}</td><td>{tmpl.format_currency(item['total_revenue'])}</td></tr>"
-                product_names.append(f"{item['product_name']}")
-                revenues.append(item['total_revenue'])
             body_content += f"<table><thead><tr><th>SKU</th><th>Tên Sản phẩm</th><th>Tổng SL Bán</th><th>Tổng Doanh thu</th></tr></thead><tbody>{table_rows}</tbody></table>"
             
             # Biểu đồ
-            max_items = 15
-            chart_title = f"Top {max_items} Sản phẩm theo Doanh thu"
-            img_base64, err_msg = chart.generate_chart_image_base64(product_names[:max_items], revenues[:max_items], chart_title, "Doanh thu (VNĐ)", x_labels_override=product_names[:max_items], chart_type='bar')
-            if img_base64: body_content += f'<h3>Biểu đồ Top Sản phẩm</h3><img src="{img_base64}" alt="Biểu đồ doanh thu theo sản phẩm">'
-            else: body_content += f"<p class='error'>Lỗi tạo biểu đồ: {err_msg}</p>"
+            body_content += f'<h3>Biểu đồ Top Sản phẩm</h3><img src="{_chart_image_url(report_type, filters, data_version)}" alt="Biểu đồ doanh thu theo sản phẩm">'
         else: body_content += "<p>Không có dữ liệu doanh thu theo sản phẩm cho bộ lọc này.</p>"
 
     return page_title, body_content
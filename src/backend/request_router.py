@@ -1,32 +1,223 @@
 # /src/backend/request_router.py
 from http.server import BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs, quote_plus
-import cgi
+import hmac
+import ipaddress
 import os
+import time
 
-# Import các module handlers của từng chức năng.
-from .product import handlers as product_handlers
-from .transaction import handlers as transaction_handlers
-from .report import handlers as report_handlers
-
-# Import các module dùng chung và database.
-from .report import database as report_db 
+# Import các module dùng chung.
 from .common import html_templates as tmpl
+from .common import multipart
+from .common.lazy_import import LazyModule
+from .common.routing import RouteRegistry
+
+# Các module handlers của từng chức năng (và database báo cáo) được import trễ:
+# chỉ nạp ở request đầu tiên cần đến, giúp server khởi động nhanh.
+product_handlers = LazyModule('.product.handlers', __package__)
+transaction_handlers = LazyModule('.transaction.handlers', __package__)
+report_handlers = LazyModule('.report.handlers', __package__)
+report_db = LazyModule('.report.database', __package__)
+api_handlers = LazyModule('.api.handlers', __package__)
+LAZY_MODULES = (product_handlers, transaction_handlers, report_handlers, report_db, api_handlers)
+
+def preload_handlers():
+    """Nạp trước tất cả các module handlers (dùng cho bước warm-up trước khi nhận request)."""
+    for module in LAZY_MODULES:
+        module.load()
 
 STYLE_CSS_PATH = 'frontend/static/style.css'
+STATIC_CACHE_CONTROL = 'public, max-age=3600' # File CSS được trình duyệt cache 1 giờ.
+# Giữ kết nối (keep-alive) sau mỗi phản hồi. Mặc định tắt như khi server còn trả lời bằng HTTP/1.0:
+# với pool luồng cố định, các kết nối keep-alive đang chờ sẽ chiếm hết luồng worker.
+HTTP_KEEP_ALIVE = False
+# Kích thước (byte) tối thiểu của một chunk khi gửi trang HTML dạng luồng (các mảnh nhỏ được gom lại).
+STREAM_CHUNK_SIZE = 16 * 1024
+
+# --- QUYỀN GHI (metadata auth='write' của route) ---
+# Mặc định (không cấu hình gì) mọi client đều được ghi, như trước khi có metadata auth, để các máy
+# thủ kho trong mạng LAN vẫn dùng được. Khi bật giới hạn (--write-allow / --write-token hoặc biến
+# môi trường MINIVENTORY_WRITE_ALLOW - danh sách mạng, phân cách bằng dấu phẩy - / MINIVENTORY_WRITE_TOKEN),
+# request tới route có auth='write' (thêm/sửa/ẩn sản phẩm, nhập/xuất kho, API ghi) chỉ được xử lý nếu
+# client có địa chỉ IP thuộc một trong các mạng WRITE_ALLOWED_NETWORKS, hoặc gửi đúng mã truy cập
+# WRITE_ACCESS_TOKEN (header 'Authorization: Bearer <mã>' hoặc 'X-Access-Token: <mã>'); nếu không -> 403.
+WRITE_ALLOWED_NETWORKS = os.environ.get('MINIVENTORY_WRITE_ALLOW', '')
+WRITE_ACCESS_TOKEN = os.environ.get('MINIVENTORY_WRITE_TOKEN', '')
+
+def parse_networks(networks):
+    """Chuyển chuỗi 'mạng1,mạng2' thành tuple các ipaddress.ip_network. Báo ValueError nếu sai định dạng."""
+    return tuple(ipaddress.ip_network(network.strip(), strict=False) for network in networks.split(',') if network.strip())
+
+_write_networks = parse_networks(WRITE_ALLOWED_NETWORKS)
+
+def set_write_access(allowed_networks=None, token=None):
+    """
+    Cấu hình quyền ghi (gọi trước khi server nhận request).
+
+    Args:
+        allowed_networks (str | tuple, optional): Các mạng được phép ghi, vd '127.0.0.1,192.168.1.0/24'
+            (hoặc kết quả của `parse_networks`).
+        token (str, optional): Mã truy cập cho client ngoài các mạng trên ('' = không dùng mã).
+    Không có mạng nào và không có mã truy cập = không giới hạn quyền ghi.
+    """
+    global _write_networks, WRITE_ACCESS_TOKEN
+    if allowed_networks is not None:
+        _write_networks = parse_networks(allowed_networks) if isinstance(allowed_networks, str) else tuple(allowed_networks)
+    if token is not None:
+        WRITE_ACCESS_TOKEN = token
+
+# --- BẢNG ĐỊNH TUYẾN ---
+# Mỗi hàm nhận (handler, dữ_liệu, **tham_số_đường_dẫn): với GET, dữ_liệu là query string
+# đã parse; với POST là dữ liệu form. Route 'page' trả về (tiêu_đề, nội_dung_html), trong đó
+# nội_dung_html là một chuỗi hoặc một generator sinh ra từng mảnh HTML (được gửi dạng luồng).
+routes = RouteRegistry()
+
+@routes.get(f'/{STYLE_CSS_PATH}', response='raw', cache=STATIC_CACHE_CONTROL, timed=False)
+def _get_style_css(handler, query_params):
+    handler._serve_static_file(STYLE_CSS_PATH, 'text/css')
+
+@routes.get('/')
+def _get_dashboard(handler, query_params):
+    stats = report_db.db_get_dashboard_stats()
+    return "Trang chủ", f"""
+            <h3>Chào mừng bạn!</h3>
+            <p>Dưới đây là tổng quan nhanh về hệ thống kho hàng của bạn:</p>
+            <div class="dashboard-wrapper">
+                <div class="dashboard-stats-row">
+                    <div class="stat-card"><h4>Tổng số sản phẩm</h4><p>{stats['total_products']}</p><small>{stats['active_products']} đang bán, {stats['hidden_products']} đã ẩn</small></div>
+                    <div class="stat-card"><h4>Giao dịch Nhập kho</h4><p>{stats['total_in_transactions']}</p></div>
+                    <div class="stat-card"><h4>Giao dịch Xuất kho</h4><p>{stats['total_out_transactions']}</p></div>
+                </div>
+                <div class="dashboard-stats-row">
+                    <div class="stat-card"><h4>Giá trị tồn kho</h4><p>{tmpl.format_currency(stats['current_warehouse_value'])}</p></div>
+                    <div class="stat-card"><h4>Tổng doanh thu</h4><p>{tmpl.format_currency(stats['total_revenue'])}</p></div>
+                </div>
+            </div>
+            """
+
+# Sản phẩm
+@routes.get('/products_stock')
+def _get_products_stock(handler, query_params):
+    return product_handlers.handle_get_products_stock(handler, query_params)
+
+@routes.get('/products/suggest', response='raw', cache='no-store')
+def _get_product_suggestions(handler, query_params):
+    # Gợi ý sản phẩm (JSON) cho ô chọn sản phẩm trên các form.
+    product_handlers.handle_get_product_suggestions(handler, query_params)
+
+@routes.get('/products/add')
+def _get_add_product(handler, query_params):
+    return product_handlers.handle_get_add_product(handler)
+
+@routes.post('/products/add', response='raw', auth='write')
+def _post_add_product(handler, fields):
+    product_handlers.handle_post_add_product(handler, fields)
+
+@routes.get('/products/edit/<int:product_id>')
+def _get_edit_product(handler, query_params, product_id):
+    return product_handlers.handle_get_edit_product(handler, product_id)
+
+@routes.post('/products/edit/<int:product_id>', response='raw', auth='write')
+def _post_edit_product(handler, fields, product_id):
+    product_handlers.handle_post_edit_product(handler, product_id, fields)
+
+@routes.get('/products/delete/<int:product_id>')
+def _get_delete_product(handler, query_params, product_id):
+    return product_handlers.handle_get_delete_product_confirmation(handler, product_id)
+
+@routes.post('/products/delete/<int:product_id>', response='raw', auth='write')
+def _post_delete_product(handler, fields, product_id):
+    product_handlers.handle_post_delete_product(handler, product_id)
+
+@routes.post('/products/restore/<int:product_id>', response='raw', auth='write')
+def _post_restore_product(handler, fields, product_id):
+    product_handlers.handle_post_restore_product(handler, product_id)
+
+@routes.get('/products/hidden')
+def _get_hidden_products(handler, query_params):
+    return product_handlers.handle_get_hidden_products_list(handler)
+
+# Nhập / xuất kho
+@routes.get('/stock/in')
+def _get_stock_in(handler, query_params):
+    return transaction_handlers.handle_get_stock_in_out(handler, '/stock/in')
+
+@routes.get('/stock/out')
+def _get_stock_out(handler, query_params):
+    return transaction_handlers.handle_get_stock_in_out(handler, '/stock/out')
+
+@routes.post('/stock/in', response='raw', auth='write')
+def _post_stock_in(handler, fields):
+    transaction_handlers.handle_post_stock_transaction(handler, '/stock/in', fields)
+
+@routes.post('/stock/out', response='raw', auth='write')
+def _post_stock_out(handler, fields):
+    transaction_handlers.handle_post_stock_transaction(handler, '/stock/out', fields)
+
+@routes.get('/transactions')
+def _get_transactions(handler, query_params):
+    return transaction_handlers.handle_get_transactions_history(handler, query_params)
+
+@routes.get('/audit')
+def _get_audit(handler, query_params):
+    return transaction_handlers.handle_get_audit(handler, query_params)
+
+# Báo cáo
+@routes.get('/report/low_stock')
+def _get_low_stock_report(handler, query_params):
+    return report_handlers.handle_get_low_stock_report(handler, query_params)
+
+@routes.get('/reports_charts')
+def _get_charts_report(handler, query_params):
+    return report_handlers.handle_get_charts_report(handler, query_params)
+
+@routes.get('/charts/<str:chart_kind>', response='raw')
+def _get_chart_image(handler, query_params, chart_kind):
+    # Ảnh biểu đồ (PNG/SVG): handler tự gửi phản hồi (kèm Cache-Control/ETag riêng).
+    report_handlers.handle_get_chart_image(handler, chart_kind, query_params)
+
+# API JSON (/api/v1): các hàm xử lý nằm trong api/handlers.py và tự gửi phản hồi JSON.
+def _api_route(func_name):
+    """Tạo hàm xử lý gọi tới `api_handlers.<func_name>` (module chỉ được nạp ở request API đầu tiên)."""
+    def call(handler, data, **params):
+        return getattr(api_handlers, func_name)(handler, data, **params)
+    call.__name__ = func_name
+    return call
+
+API_ROUTES = (
+    ('GET', '/api/v1/products', 'handle_list_products'),
+    ('GET', '/api/v1/products/<int:product_id>', 'handle_get_product'),
+    ('GET', '/api/v1/products/sku/<str:sku>', 'handle_get_product_by_sku'),
+    ('GET', '/api/v1/transactions', 'handle_list_transactions'),
+    ('POST', '/api/v1/stock/movements', 'handle_post_stock_movements'),
+    ('GET', '/api/v1/reports/dashboard', 'handle_report_dashboard'),
+    ('GET', '/api/v1/reports/low_stock', 'handle_report_low_stock'),
+    ('GET', '/api/v1/reports/revenue', 'handle_report_revenue'),
+    ('GET', '/api/v1/reports/product_flow', 'handle_report_product_flow'),
+    ('GET', '/api/v1/reports/revenue_by_product', 'handle_report_revenue_by_product'),
+    ('GET', '/api/v1/stats/cache', 'handle_cache_stats'),
+)
+for _method, _pattern, _func_name in API_ROUTES:
+    routes.add(_method, _pattern, _api_route(_func_name), response='raw',
+               auth='write' if _method == 'POST' else None)
 
 class MiniVentoryRequestHandler(BaseHTTPRequestHandler):
     """
     Bộ xử lý request chính của server.
     Tiếp nhận tất cả request HTTP, phân tích và điều hướng (route)
     đến các handler tương ứng với từng chức năng (sản phẩm, giao dịch, báo cáo).
+    Việc điều hướng dựa trên bảng định tuyến `routes` ở đầu file.
     """
+    current_route = None # Route đang xử lý (để các hàm gửi phản hồi biết metadata cache).
+    # HTTP/1.1 cần cho Transfer-Encoding: chunked; mọi phản hồi khác đều có Content-Length.
+    protocol_version = 'HTTP/1.1'
 
     def get_form_value(self, data_dict, key, default=''):
         """
         Trích xuất một giá trị từ dữ liệu form đã được parse.
         Hàm này giúp lấy dữ liệu an toàn, xử lý trường hợp key không tồn tại
-        và tự động giải mã (decode) dữ liệu bytes.
+        và tự động giải mã (decode) dữ liệu bytes. Với trường file, giá trị trả về
+        là một đối tượng `multipart.UploadedFile`.
 
         Args:
             data_dict (dict): Dictionary chứa dữ liệu form.
@@ -39,32 +230,97 @@ class MiniVentoryRequestHandler(BaseHTTPRequestHandler):
         value_list = data_dict.get(key)
         if value_list:
             val = value_list[0]
-            # Xử lý decode cho dữ liệu dạng bytes (trừ file upload).
-            if isinstance(val, bytes) and key != 'csvfile': 
+            # Xử lý decode cho dữ liệu dạng bytes (file upload là UploadedFile nên không bị ảnh hưởng).
+            if isinstance(val, bytes): 
                 try: return val.decode('utf-8')
                 except UnicodeDecodeError: return val.decode('latin-1', errors='ignore') 
             return val
         return default
 
+    def end_headers(self):
+        if not HTTP_KEEP_ALIVE and not self.close_connection:
+            self.send_header('Connection', 'close')
+        super().end_headers()
+
     def _send_response_html(self, html_content, status_code=200, headers=None):
         """Gửi phản hồi HTML về cho client."""
+        body = html_content.encode('utf-8')
         self.send_response(status_code)
         self.send_header('Content-type', 'text/html; charset=utf-8')
-        if headers:
-            for key, value in headers.items():
-                self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self._send_extra_headers(headers)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_response_html_stream(self, fragments, status_code=200, headers=None):
+        """
+        Gửi phản hồi HTML dạng luồng từ các mảnh HTML (chuỗi) của `fragments`: mảnh đầu tiên được gửi
+        ngay, các mảnh sau được gom thành chunk khoảng STREAM_CHUNK_SIZE byte (Transfer-Encoding: chunked).
+        Client HTTP/1.0 nhận nội dung không có độ dài, kết thúc bằng việc đóng kết nối.
+        Nếu có lỗi giữa chừng, kết nối bị đóng mà không gửi chunk kết thúc để client biết trang bị cắt.
+        """
+        chunked = self.request_version != 'HTTP/1.0'
+        self.send_response(status_code)
+        self.send_header('Content-type', 'text/html; charset=utf-8')
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.close_connection = True
+        self._send_extra_headers(headers)
         self.end_headers()
-        self.wfile.write(html_content.encode('utf-8'))
+
+        def send(data):
+            if data:
+                self.wfile.write(b'%x\r\n%b\r\n' % (len(data), data) if chunked else data)
+
+        try:
+            pending, pending_size, first = [], 0, True
+            for fragment in fragments:
+                data = fragment.encode('utf-8')
+                pending.append(data)
+                pending_size += len(data)
+                if first or pending_size >= STREAM_CHUNK_SIZE:
+                    send(b''.join(pending))
+                    pending, pending_size, first = [], 0, False
+            send(b''.join(pending))
+            if chunked:
+                self.wfile.write(b'0\r\n\r\n')
+        except Exception:
+            self.close_connection = True
+            raise
+
+    def _send_extra_headers(self, headers=None):
+        """Gửi các header bổ sung, kèm Cache-Control mặc định của route nếu handler không tự đặt."""
+        headers = headers or {}
+        if self.current_route is not None and self.current_route.cache and 'Cache-Control' not in headers:
+            self.send_header('Cache-Control', self.current_route.cache)
+        for key, value in headers.items():
+            self.send_header(key, value)
+
+    def _send_response_bytes(self, content, content_type, status_code=200, headers=None):
+        """Gửi phản hồi nhị phân (ví dụ ảnh biểu đồ). Phản hồi 304 không có nội dung."""
+        self.send_response(status_code)
+        if content_type:
+            self.send_header('Content-type', content_type)
+        if status_code != 304:
+            self.send_header('Content-Length', str(len(content)))
+        self._send_extra_headers(headers)
+        self.end_headers()
+        if content and status_code != 304:
+            self.wfile.write(content)
 
     def _serve_static_file(self, file_path, content_type):
         """Phục vụ các file tĩnh như CSS."""
         try:
             full_path = os.path.join(os.path.dirname(__file__), '..', file_path)
             with open(full_path, 'rb') as f:
-                self.send_response(200)
-                self.send_header('Content-type', content_type)
-                self.end_headers()
-                self.wfile.write(f.read())
+                content = f.read()
+            self.send_response(200)
+            self.send_header('Content-type', content_type)
+            self.send_header('Content-Length', str(len(content)))
+            self._send_extra_headers()
+            self.end_headers()
+            self.wfile.write(content)
         except FileNotFoundError:
             self.send_error(404, f"File Not Found: {file_path}")
 
@@ -73,83 +329,97 @@ class MiniVentoryRequestHandler(BaseHTTPRequestHandler):
         redirect_url = f"{location}?message={quote_plus(message)}&msg_type={msg_type}"
         self.send_response(303)
         self.send_header('Location', redirect_url)
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
+    @staticmethod
+    def _page_fragments(page_title, body_fragments, message, msg_type):
+        """Các mảnh HTML của một trang hoàn chỉnh: đầu trang, nội dung (generator), cuối trang."""
+        yield tmpl.html_page_head(page_title, message, msg_type)
+        yield from body_fragments
+        yield tmpl.html_page_tail()
+
+    def _is_authorized(self, route):
+        """
+        Kiểm tra quyền truy cập route (metadata `auth`, xem WRITE_ALLOWED_NETWORKS / WRITE_ACCESS_TOKEN).
+        Mức quyền không được hỗ trợ luôn bị từ chối.
+        """
+        if route.auth != 'write':
+            return False
+        if not _write_networks and not WRITE_ACCESS_TOKEN:
+            return True # Chưa bật giới hạn quyền ghi
+        try:
+            client_ip = ipaddress.ip_address(self.client_address[0])
+        except ValueError:
+            client_ip = None
+        if client_ip is not None:
+            if getattr(client_ip, 'ipv4_mapped', None) is not None:
+                client_ip = client_ip.ipv4_mapped # '::ffff:127.0.0.1' (socket IPv6 dual-stack)
+            if any(client_ip in network for network in _write_networks):
+                return True
+        if not WRITE_ACCESS_TOKEN:
+            return False
+        token = self.headers.get('X-Access-Token', '')
+        authorization = self.headers.get('Authorization', '')
+        if authorization.startswith('Bearer '):
+            token = authorization[len('Bearer '):].strip()
+        return hmac.compare_digest(token.encode('utf-8'), WRITE_ACCESS_TOKEN.encode('utf-8'))
+
+    def _dispatch(self, method, path, data, message="", msg_type="info"):
+        """
+        Tìm route trong bảng định tuyến và gọi hàm xử lý.
+
+        Args:
+            method (str): 'GET' hoặc 'POST'.
+            path (str): Đường dẫn (không gồm query string).
+            data (dict): Query string (GET) hoặc dữ liệu form (POST) đã parse.
+            message, msg_type: Thông báo hiển thị trên trang (sau redirect).
+        """
+        route, path_params = routes.match(method, path)
+        if route is None:
+            status = routes.no_match_status(method, path)
+            if status == 400:
+                self.send_error(400, "Bad Request") # Tham số đường dẫn sai kiểu (vd. ID không phải số)
+            elif status == 405:
+                self.send_error(405, "Method Not Allowed")
+            else:
+                self.send_error(404, "Page Not Found")
+            return
+        if route.auth and not self._is_authorized(route):
+            self.send_error(403, "Forbidden")
+            return
+
+        self.current_route = route
+        started = time.perf_counter()
+        try:
+            result = route.handler(self, data, **path_params)
+            elapsed = time.perf_counter() - started
+            if route.response == 'page':
+                page_title, body_content = result
+                headers = {'Server-Timing': f'app;dur={elapsed * 1000:.1f}'} if route.timed else None
+                if isinstance(body_content, str):
+                    # Gói nội dung vào template HTML chung và gửi về client.
+                    html_page = tmpl.html_page_wrapper(page_title, body_content, message, msg_type)
+                    self._send_response_html(html_page, headers=headers)
+                else:
+                    # Nội dung dạng generator: gửi phần đầu trang ngay, rồi từng mảnh khi được sinh ra.
+                    # Server-Timing chỉ tính thời gian đến khi bắt đầu gửi; thống kê tính cả lúc gửi.
+                    self._send_response_html_stream(self._page_fragments(page_title, body_content, message, msg_type),
+                                                    headers=headers)
+                    elapsed = time.perf_counter() - started
+        finally:
+            self.current_route = None
+        if route.timed:
+            routes.record_timing(route, elapsed)
+
     def do_GET(self):
         """Xử lý các request GET."""
         parsed_path = urlparse(self.path)
-        path = parsed_path.path
         query_params = parse_qs(parsed_path.query)
         # Lấy thông báo từ query string (dùng cho việc hiển thị sau khi redirect).
         message = query_params.get('message', [''])[0]
         msg_type = query_params.get('msg_type', ['info'])[0]
-
-        page_title = "MiniVentory"
-        body_content = ""
-
-        # Phục vụ file CSS.
-        if path == f'/{STYLE_CSS_PATH}':
-            self._serve_static_file(STYLE_CSS_PATH, 'text/css')
-            return
-
-        # --- ROUTING ĐẾN CÁC HANDLERS ---
-        if path == '/':
-            page_title = "Trang chủ"
-            stats = report_db.db_get_dashboard_stats()
-            body_content = f"""
-            <h3>Chào mừng bạn!</h3>
-            <p>Dưới đây là tổng quan nhanh về hệ thống kho hàng của bạn:</p>
-            <div class="dashboard-wrapper">
-                <div class="dashboard-stats-row">
-                    <div class="stat-card"><h4>Tổng số sản phẩm</h4><p>{stats['total_products']}</p></div>
-                    <div class="stat-card"><h4>Giao dịch Nhập kho</h4><p>{stats['total_in_transactions']}</p></div>
-                    <div class="stat-card"><h4>Giao dịch Xuất kho</h4><p>{stats['total_out_transactions']}</p></div>
-                </div>
-                <div class="dashboard-stats-row">
-                    <div class="stat-card"><h4>Giá trị tồn kho</h4><p>{tmpl.format_currency(stats['current_warehouse_value'])}</p></div>
-                    <div class="stat-card"><h4>Tổng doanh thu</h4><p>{tmpl.format_currency(stats['total_revenue'])}</p></div>
-                </div>
-            </div>
-            """
-        elif path == '/products_stock':
-            page_title, body_content = product_handlers.handle_get_products_stock(self, query_params)
-        elif path == '/products/add':
-            page_title, body_content = product_handlers.handle_get_add_product(self)
-        
-        elif path.startswith('/products/edit/'):
-            try:
-                product_id = int(path.split('/')[-1])
-                page_title, body_content = product_handlers.handle_get_edit_product(self, product_id)
-            except (IndexError, ValueError):
-                self.send_error(404, "Page Not Found")
-                return
-
-        elif path.startswith('/products/delete/'):
-            try:
-                product_id = int(path.split('/')[-1])
-                page_title, body_content = product_handlers.handle_get_delete_product_confirmation(self, product_id)
-            except (IndexError, ValueError):
-                self.send_error(404, "Page Not Found")
-                return
-                
-        elif path == '/products/hidden':
-            page_title, body_content = product_handlers.handle_get_hidden_products_list(self)
-        
-        elif path in ['/stock/in', '/stock/out']:
-            page_title, body_content = transaction_handlers.handle_get_stock_in_out(self, path)
-        elif path == '/transactions':
-            page_title, body_content = transaction_handlers.handle_get_transactions_history(self, query_params)
-        elif path == '/report/low_stock':
-            page_title, body_content = report_handlers.handle_get_low_stock_report(self, query_params)
-        elif path == '/reports_charts':
-            page_title, body_content = report_handlers.handle_get_charts_report(self, query_params)
-        else:
-            self.send_error(404, "Page Not Found")
-            return
-            
-        # Gói nội dung vào template HTML chung và gửi về client.
-        html_page = tmpl.html_page_wrapper(page_title, body_content, message, msg_type)
-        self._send_response_html(html_page)
+        self._dispatch('GET', parsed_path.path, query_params, message, msg_type)
 
     def do_POST(self):
         """Xử lý các request POST."""
@@ -157,43 +427,43 @@ class MiniVentoryRequestHandler(BaseHTTPRequestHandler):
         path = parsed_path.path
 
         # Phân tích (parse) dữ liệu form từ request body.
-        ctype, pdict = cgi.parse_header(self.headers.get('content-type'))
+        # File tải lên được ghi thẳng ra file tạm theo luồng, không đọc toàn bộ vào bộ nhớ.
+        ctype, pdict = multipart.parse_header(self.headers.get('content-type'))
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            self.send_error(400, "Bad Request")
+            return
         fields = {}
-        if ctype == 'multipart/form-data':
-            pdict['boundary'] = bytes(pdict['boundary'], "utf-8")
-            fields = cgi.parse_multipart(self.rfile, pdict)
-        elif ctype == 'application/x-www-form-urlencoded':
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            fields = parse_qs(post_data.decode('utf-8'))
-
-        # --- ROUTING POST REQUESTS ---
-        if path.startswith('/products/edit/'):
-            try:
-                product_id = int(path.split('/')[-1])
-                product_handlers.handle_post_edit_product(self, product_id, fields)
-            except (IndexError, ValueError):
-                self.send_error(400, "Bad Request")
-                
-        elif path.startswith('/products/delete/'):
-            try:
-                product_id = int(path.split('/')[-1])
-                product_handlers.handle_post_delete_product(self, product_id)
-            except (IndexError, ValueError):
-                self.send_error(400, "Bad Request")
-                
-        elif path.startswith('/products/restore/'):
-            try:
-                product_id = int(path.split('/')[-1])
-                product_handlers.handle_post_restore_product(self, product_id)
-            except (IndexError, ValueError):
-                self.send_error(400, "Bad Request")
-
-        elif path == '/products/add':
-            product_handlers.handle_post_add_product(self, fields)
-            
-        elif path in ['/stock/in', '/stock/out']:
-            transaction_handlers.handle_post_stock_transaction(self, path, fields)
-            
-        else:
-            self.send_error(405, "Method Not Allowed")
+        try:
+            if ctype == 'multipart/form-data':
+                fields = multipart.parse_multipart_stream(self.rfile, pdict.get('boundary'), content_length)
+            elif ctype == 'application/x-www-form-urlencoded':
+                if content_length > multipart.MAX_UPLOAD_SIZE:
+                    raise multipart.UploadTooLargeError("Dữ liệu gửi lên quá lớn.")
+                post_data = self.rfile.read(content_length)
+                fields = parse_qs(post_data.decode('utf-8'))
+            elif ctype == 'application/json':
+                # Body JSON (API) được giữ nguyên dạng bytes; handler API tự giải mã và báo lỗi dạng JSON.
+                if content_length > multipart.MAX_UPLOAD_SIZE:
+                    raise multipart.UploadTooLargeError("Dữ liệu gửi lên quá lớn.")
+                fields = {multipart.RAW_BODY_FIELD: [self.rfile.read(content_length)]}
+            elif content_length:
+                self.close_connection = True # Body không được đọc, không thể tái sử dụng kết nối
+        except multipart.UploadTooLargeError as e:
+            self.close_connection = True # Body không được đọc, không thể tái sử dụng kết nối
+            self.send_error(413, "Payload Too Large", str(e))
+            return
+        except multipart.MultipartError as e:
+            self.send_error(400, "Bad Request", str(e))
+            return
+
+        try:
+            self._route_post(path, fields)
+        finally:
+            # Luôn dọn dẹp các file tạm được tạo trong quá trình parse.
+            multipart.cleanup_uploaded_files(fields)
+
+    def _route_post(self, path, fields):
+        """Điều hướng request POST đã được parse tới handler tương ứng."""
+        self._dispatch('POST', path, fields)
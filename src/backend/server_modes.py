@@ -0,0 +1,171 @@
+# /src/backend/server_modes.py
+# File này chứa các chế độ chạy server đồng thời (concurrency) cho MiniVentory:
+#   - 'single'  : HTTPServer đơn luồng như ban đầu (xử lý tuần tự từng request).
+#   - 'threaded': Server đa luồng với một pool worker có giới hạn số lượng.
+#   - 'prefork' : Tạo sẵn nhiều tiến trình con (fork) dùng chung socket đang lắng nghe.
+# Mỗi tiến trình worker tự quản lý tài nguyên SQLite của riêng nó.
+
+import os
+import signal
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer
+
+SERVER_MODES = ('single', 'threaded', 'prefork')
+
+class PooledThreadingHTTPServer(HTTPServer):
+    """
+    HTTPServer xử lý mỗi kết nối trên một pool luồng có kích thước cố định.
+    Khác với `ThreadingHTTPServer` (tạo một luồng mới cho mỗi request, không giới hạn),
+    server này chỉ nhận thêm kết nối khi còn worker rảnh hoặc còn chỗ trong hàng đợi,
+    nhờ đó tải cao không làm bùng nổ số luồng.
+    """
+    daemon_threads = True
+
+    def __init__(self, server_address, handler_class, max_workers=8, queue_size=None, bind_and_activate=True):
+        # Gán các thuộc tính của pool TRƯỚC khi bind: nếu bind lỗi (vd cổng đang bận), socketserver
+        # gọi `server_close` và lỗi gốc (OSError) không bị che bởi AttributeError.
+        self.max_workers = max_workers
+        # Số kết nối tối đa được phép chờ + đang xử lý. Khi đầy, vòng lặp accept sẽ
+        # tạm dừng và các kết nối mới nằm chờ trong backlog của hệ điều hành.
+        self._slots = threading.BoundedSemaphore(max_workers + (queue_size if queue_size is not None else max_workers))
+        self._executor = None
+        super().__init__(server_address, handler_class, bind_and_activate)
+
+    def _get_executor(self):
+        """Tạo pool luồng khi cần (sau khi fork, mỗi tiến trình sẽ có pool riêng)."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='miniventory-worker')
+        return self._executor
+
+    def process_request(self, request, client_address):
+        """Đưa kết nối vào pool luồng thay vì xử lý ngay trên luồng accept."""
+        self._slots.acquire()
+        try:
+            self._get_executor().submit(self._process_request_in_worker, request, client_address)
+        except Exception:
+            self._slots.release()
+            self.handle_error(request, client_address)
+            self.shutdown_request(request)
+
+    def _process_request_in_worker(self, request, client_address):
+        """Hàm chạy trong luồng worker: xử lý request rồi giải phóng slot."""
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def server_close(self):
+        super().server_close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+def create_server(server_address, handler_class, mode='single', threads=8):
+    """
+    Tạo đối tượng server phù hợp với chế độ được chọn.
+    Ở chế độ 'prefork', mỗi tiến trình con vẫn dùng pool luồng nếu `threads` > 1.
+
+    Args:
+        server_address (tuple): (host, port) để lắng nghe.
+        handler_class: Lớp xử lý request (MiniVentoryRequestHandler).
+        mode (str): Một trong SERVER_MODES.
+        threads (int): Số luồng worker cho mỗi tiến trình.
+
+    Returns:
+        HTTPServer: Server đã bind socket, sẵn sàng gọi serve_forever().
+    """
+    if mode not in SERVER_MODES:
+        raise ValueError(f"Chế độ server không hợp lệ: '{mode}'. Chọn một trong {', '.join(SERVER_MODES)}.")
+    if mode == 'single' or threads <= 1:
+        return HTTPServer(server_address, handler_class)
+    return PooledThreadingHTTPServer(server_address, handler_class, max_workers=threads)
+
+def serve_prefork(httpd, workers, worker_init=None, log=print, worker_exit=None):
+    """
+    Chạy server ở chế độ pre-fork: tiến trình cha đã bind socket, sau đó fork ra
+    `workers` tiến trình con, mỗi con gọi `serve_forever()` trên cùng socket đó.
+    Hệ điều hành sẽ phân phối các kết nối mới giữa các tiến trình con.
+    Tiến trình cha chỉ giám sát và khởi động lại con nếu con bị chết bất thường.
+
+    Args:
+        httpd: Server đã được tạo bởi `create_server`.
+        workers (int): Số tiến trình con.
+        worker_init (callable, optional): Hàm gọi trong mỗi tiến trình con ngay sau khi fork
+                                          (dùng để khởi tạo lại tài nguyên riêng như kết nối DB).
+        log (callable): Hàm dùng để in/ghi thông báo.
+        worker_exit (callable, optional): Hàm gọi trong tiến trình con trước khi thoát (kể cả khi
+                                          bị dừng bằng SIGTERM), vd. để ghi nốt log đang đệm.
+    """
+    if not hasattr(os, 'fork'):
+        log("Hệ điều hành không hỗ trợ fork, chuyển sang chạy trong một tiến trình.")
+        httpd.serve_forever()
+        return
+
+    children = set()
+    stopping = False
+
+    def spawn_worker():
+        pid = os.fork()
+        if pid == 0:
+            # --- Trong tiến trình con ---
+            signal.signal(signal.SIGINT, signal.SIG_IGN) # Ctrl+C do tiến trình cha xử lý
+            # SIGTERM -> SystemExit để khối finally bên dưới (worker_exit) vẫn được chạy.
+            signal.signal(signal.SIGTERM, lambda *_args: sys.exit(0))
+            exit_code = 0
+            try:
+                if worker_init:
+                    worker_init()
+                httpd.serve_forever()
+            except Exception as e:
+                log(f"Worker {os.getpid()} gặp lỗi: {e}")
+                exit_code = 1
+            finally:
+                if worker_exit:
+                    try:
+                        worker_exit()
+                    except Exception as e:
+                        log(f"Worker {os.getpid()} gặp lỗi khi dừng: {e}")
+                os._exit(exit_code)
+        children.add(pid)
+        return pid
+
+    def stop_children(*_args):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                children.discard(pid)
+
+    previous_sigterm = signal.signal(signal.SIGTERM, stop_children)
+    try:
+        for _ in range(max(1, workers)):
+            spawn_worker()
+        log(f"Đã khởi động {len(children)} tiến trình worker: {sorted(children)}")
+
+        # Vòng lặp giám sát: chờ tiến trình con kết thúc, khởi động lại nếu cần.
+        while children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            children.discard(pid)
+            if not stopping:
+                log(f"Worker {pid} đã dừng (status={status}), đang khởi động lại...")
+                spawn_worker()
+    finally:
+        stop_children()
+        for pid in list(children):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        signal.signal(signal.SIGTERM, previous_sigterm)
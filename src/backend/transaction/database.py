@@ -1,22 +1,59 @@
 # /src/backend/transaction/database.py
 import sqlite3
 import datetime
-from ..common.database_base import get_db_connection
-
-def init_db(db_name):
-    """Tạo bảng 'stock_transactions' nếu nó chưa tồn tại."""
-    conn = get_db_connection(db_name)
-    cursor = conn.cursor()
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS stock_transactions (
-        id INTEGER PRIMARY KEY AUTOINCREMENT, product_id INTEGER NOT NULL,
-        transaction_type TEXT NOT NULL, quantity INTEGER NOT NULL,
-        unit_price INTEGER DEFAULT 0, total_amount INTEGER DEFAULT 0, 
-        timestamp TIMESTAMP, notes TEXT, user TEXT, 
-        FOREIGN KEY (product_id) REFERENCES products (id)
-    )''')
-    conn.commit()
-    conn.close()
+from ..common.database_base import borrow_db_connection, begin_immediate, build_timestamp_range, use_pragma_profile, SQLITE_MAX_INTEGER, SQLITE_MAX_PARAMS
+from ..common.pagination import fetch_keyset_page, PAGE_SIZE_DEFAULT, SORT_KEY_COLUMN
+from ..product.cache import product_cache
+
+# Số dòng giao dịch tối đa được ghi trong một DB transaction khi xử lý hàng loạt.
+BULK_CHUNK_SIZE = 5000
+# Profile PRAGMA dùng tạm thời khi ghi hàng loạt (xem database_base.PRAGMA_PROFILES).
+BULK_PRAGMA_PROFILE = 'bulk_load'
+# Câu lệnh cập nhật tồn kho theo loại giao dịch (cộng/trừ trực tiếp trên cột, kiểm tra trong WHERE:
+# nhập kho không làm tồn kho vượt quá SQLITE_MAX_INTEGER, xuất kho chỉ khi còn đủ hàng).
+_STOCK_UPDATE_SQL = {
+    'IN': "UPDATE products SET current_stock = current_stock + :qty, updated_at = :now WHERE id = :id AND current_stock <= :max - :qty",
+    'OUT': "UPDATE products SET current_stock = current_stock - :qty, updated_at = :now WHERE id = :id AND current_stock >= :qty",
+}
+
+def _doc_so_luong_don_gia(quantity_str, unit_price_str):
+    """
+    Xác thực số lượng và đơn giá của một giao dịch, kể cả giới hạn số nguyên 64 bit của SQLite
+    (số lượng, đơn giá và thành tiền đều phải lưu được vào cột INTEGER).
+
+    Returns:
+        tuple: (số_lượng, đơn_giá, None) hoặc (None, None, str_thông_báo_lỗi)
+    """
+    try:
+        quantity = int(quantity_str)
+        if quantity <= 0: return None, None, "Số lượng phải là số nguyên dương."
+        unit_price = int(unit_price_str)
+    except ValueError:
+        return None, None, "Số lượng hoặc đơn giá không hợp lệ."
+    if quantity > SQLITE_MAX_INTEGER or abs(unit_price) > SQLITE_MAX_INTEGER:
+        return None, None, "Số lượng hoặc đơn giá vượt quá giới hạn cho phép."
+    if abs(quantity * unit_price) > SQLITE_MAX_INTEGER:
+        return None, None, "Thành tiền (số lượng x đơn giá) vượt quá giới hạn cho phép."
+    return quantity, unit_price, None
+
+def _cap_nhat_ton_kho(cursor, product_id, transaction_type, quantity, now):
+    """
+    Cộng/trừ tồn kho của một sản phẩm bằng `_STOCK_UPDATE_SQL` (phải đang trong transaction ghi).
+
+    Returns:
+        tuple: (dòng_sản_phẩm_sau_cập_nhật hoặc None, str_thông_báo_lỗi hoặc None)
+    """
+    updated = cursor.execute(_STOCK_UPDATE_SQL[transaction_type],
+                             {'qty': quantity, 'now': now, 'id': product_id, 'max': SQLITE_MAX_INTEGER}).rowcount
+    # Đọc tồn kho sau cập nhật (vẫn đang giữ khóa ghi nên không ai chen vào được)
+    product_row = cursor.execute("SELECT name, current_stock FROM products WHERE id = ?", (product_id,)).fetchone()
+    if not product_row:
+        return None, f"Sản phẩm ID {product_id} không tồn tại."
+    if not updated and transaction_type == 'OUT':
+        return None, f"Không đủ '{product_row['name']}' tồn kho (cần {quantity}, có {product_row['current_stock']})."
+    if not updated:
+        return None, f"Tồn kho của '{product_row['name']}' sẽ vượt quá giới hạn cho phép (có {product_row['current_stock']}, nhập thêm {quantity})."
+    return product_row, None
 
 def db_add_stock_transaction(product_id, transaction_type, quantity_str, unit_price_str, notes="", user="system"):
     """
@@ -24,75 +61,241 @@ def db_add_stock_transaction(product_id, transaction_type, quantity_str, unit_pr
     Toàn bộ hoạt động được bọc trong một transaction của SQLite để đảm bảo tính toàn vẹn dữ liệu:
     hoặc tất cả cùng thành công, hoặc không có gì thay đổi.
 
+    Tồn kho được cập nhật bằng MỘT câu UPDATE cộng/trừ trực tiếp trên cột (current_stock + ?),
+    với điều kiện đủ hàng nằm ngay trong WHERE khi xuất kho, thay vì đọc tồn kho ra Python rồi
+    ghi lại: nhiều worker ghi cùng lúc không thể làm mất cập nhật của nhau.
+
     Returns:
         tuple: (bool_thành_công, str_thông_báo)
     """
-    conn = get_db_connection()
-    try:
-        # Xác thực và chuyển đổi kiểu dữ liệu đầu vào
-        quantity = int(quantity_str)
-        if quantity <= 0: return False, "Số lượng phải là số nguyên dương."
-        unit_price = int(unit_price_str)
-    except ValueError:
-        return False, "Số lượng hoặc đơn giá không hợp lệ."
+    if transaction_type not in _STOCK_UPDATE_SQL:
+        return False, f"Loại giao dịch không hợp lệ: '{transaction_type}'."
+    # Xác thực và chuyển đổi kiểu dữ liệu đầu vào
+    quantity, unit_price, error = _doc_so_luong_don_gia(quantity_str, unit_price_str)
+    if error:
+        return False, error
     
     total_amount = quantity * unit_price
     
+    with borrow_db_connection() as conn:
+        try:
+            # Bắt đầu một DB transaction ghi (thử lại nếu DB đang bận)
+            begin_immediate(conn)
+            cursor = conn.cursor()
+            now = datetime.datetime.now()
+
+            # Cập nhật tồn kho: xuất kho chỉ thành công khi tồn kho còn đủ
+            product_row, error = _cap_nhat_ton_kho(cursor, product_id, transaction_type, quantity, now)
+            if error:
+                conn.rollback() # Hoàn tác transaction
+                return False, error
+            
+            # Chèn bản ghi giao dịch mới
+            cursor.execute('''
+            INSERT INTO stock_transactions (product_id, transaction_type, quantity, unit_price, total_amount, notes, user, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (product_id, transaction_type, quantity, unit_price, total_amount, notes, user, now))
+            
+            conn.commit() # Chấp nhận tất cả thay đổi
+            product_cache.invalidate(product_id)
+            return True, f"Giao dịch {transaction_type} thành công. Tồn kho mới: {product_row['current_stock']}"
+        except Exception as e:
+            conn.rollback() # Hoàn tác nếu có bất kỳ lỗi nào
+            return False, f"Lỗi DB khi xử lý giao dịch: {e}"
+
+def db_add_stock_transactions_bulk(transaction_type, entries, user="system", chunk_size=BULK_CHUNK_SIZE):
+    """
+    Thêm hàng loạt giao dịch kho (cùng loại IN/OUT) và cập nhật tồn kho tương ứng.
+    Các dòng được ghi theo từng lô `chunk_size`, mỗi lô nằm trong MỘT transaction của SQLite:
+    tồn kho của các sản phẩm trong lô được đọc một lần, tính toán lũy kế trong Python
+    (vẫn kiểm tra xuất quá tồn cho từng dòng), sau đó ghi bằng `executemany`.
+
+    Args:
+        transaction_type (str): 'IN' hoặc 'OUT'.
+        entries (list): Danh sách dictionary, mỗi phần tử gồm các key
+                        'product_id', 'quantity_str', 'unit_price_str', 'notes'.
+        user (str): Người/nguồn thực hiện giao dịch.
+        chunk_size (int): Số dòng tối đa trong một transaction.
+
+    Returns:
+        list: Danh sách (bool_thành_công, str_thông_báo) theo đúng thứ tự của `entries`.
+    """
+    results = []
+    with borrow_db_connection() as conn:
+        # Tạm chuyển sang profile 'bulk_load' trong lúc ghi các lô, khôi phục khi xong.
+        with use_pragma_profile(conn, BULK_PRAGMA_PROFILE):
+            for start in range(0, len(entries), chunk_size):
+                results.extend(_apply_bulk_chunk(conn, transaction_type, entries[start:start + chunk_size], user))
+    return results
+
+def _apply_bulk_chunk(conn, transaction_type, chunk, user):
+    """
+    Ghi một lô giao dịch CÙNG LOẠI của file CSV theo tập hợp (xem `db_add_stock_transactions_bulk`).
+    Vì đang giữ khóa ghi (BEGIN IMMEDIATE), tồn kho đọc ra không thể bị đổi giữa chừng nên kết quả
+    tính trong Python là chính xác; tồn kho vẫn được ghi bằng câu UPDATE cộng/trừ có điều kiện
+    (`_STOCK_UPDATE_SQL`, một dòng cho mỗi sản phẩm). Nếu số sản phẩm được cập nhật không khớp
+    (không xảy ra khi mọi thứ bình thường), lô được hoàn tác và ghi lại từng dòng bằng `_apply_stock_chunk`.
+    """
+    if transaction_type not in _STOCK_UPDATE_SQL:
+        return [(False, f"Loại giao dịch không hợp lệ: '{transaction_type}'.")] * len(chunk)
+    results = []
     try:
-        # Bắt đầu một DB transaction
-        conn.execute("BEGIN TRANSACTION")
-        cursor = conn.cursor()
-        
-        # Lấy thông tin sản phẩm hiện tại để kiểm tra và cập nhật
-        cursor.execute("SELECT id, name, sku, current_stock FROM products WHERE id = ?", (product_id,))
-        product_row = cursor.fetchone()
-        
-        if not product_row:
-            conn.rollback() # Hoàn tác transaction
-            return False, f"Sản phẩm ID {product_id} không tồn tại."
-        
-        product_name, current_stock = product_row['name'], product_row['current_stock']
-        new_stock = current_stock
-
-        # Tính toán tồn kho mới dựa trên loại giao dịch
-        if transaction_type == 'IN':
-            new_stock += quantity
-        elif transaction_type == 'OUT':
-            # Kiểm tra điều kiện xuất kho
-            if current_stock < quantity:
-                conn.rollback()
-                return False, f"Không đủ '{product_name}' tồn kho (cần {quantity}, có {current_stock})."
-            new_stock -= quantity
-        
-        # Cập nhật tồn kho mới cho sản phẩm
-        cursor.execute("UPDATE products SET current_stock = ?, updated_at = ? WHERE id = ?", (new_stock, datetime.datetime.now(), product_id))
-        
-        # Chèn bản ghi giao dịch mới
-        cursor.execute('''
+        begin_immediate(conn)
+
+        # Đọc tồn kho hiện tại của tất cả sản phẩm xuất hiện trong lô.
+        product_ids = list({entry['product_id'] for entry in chunk})
+        products = {}
+        for start in range(0, len(product_ids), SQLITE_MAX_PARAMS):
+            batch = product_ids[start:start + SQLITE_MAX_PARAMS]
+            placeholders = ", ".join("?" * len(batch))
+            for row in conn.execute(f"SELECT id, name, current_stock FROM products WHERE id IN ({placeholders})", batch):
+                products[row['id']] = {'name': row['name'], 'stock': row['current_stock'], 'delta': 0}
+
+        now = datetime.datetime.now()
+        insert_rows = []
+        for entry in chunk:
+            # Xác thực từng dòng giống hệt `db_add_stock_transaction`.
+            quantity, unit_price, error = _doc_so_luong_don_gia(entry['quantity_str'], entry['unit_price_str'])
+            if error:
+                results.append((False, error))
+                continue
+            product_id = entry['product_id']
+            product = products.get(product_id)
+            if not product:
+                results.append((False, f"Sản phẩm ID {product_id} không tồn tại."))
+                continue
+            if transaction_type == 'OUT' and product['stock'] < quantity:
+                results.append((False, f"Không đủ '{product['name']}' tồn kho (cần {quantity}, có {product['stock']})."))
+                continue
+            if transaction_type == 'IN' and product['stock'] > SQLITE_MAX_INTEGER - quantity:
+                results.append((False, f"Tồn kho của '{product['name']}' sẽ vượt quá giới hạn cho phép (có {product['stock']}, nhập thêm {quantity})."))
+                continue
+            product['stock'] += quantity if transaction_type == 'IN' else -quantity
+            product['delta'] += quantity
+            insert_rows.append((product_id, transaction_type, quantity, unit_price, quantity * unit_price,
+                                entry.get('notes', ''), entry.get('user', user), now))
+            results.append((True, f"Giao dịch {transaction_type} thành công. Tồn kho mới: {product['stock']}"))
+
+        touched = [(product_id, product['delta']) for product_id, product in products.items() if product['delta']]
+        cursor = conn.executemany(_STOCK_UPDATE_SQL[transaction_type],
+                                  [{'qty': delta, 'now': now, 'id': product_id, 'max': SQLITE_MAX_INTEGER}
+                                   for product_id, delta in touched])
+        if touched and cursor.rowcount != len(touched):
+            conn.rollback()
+            return _apply_stock_chunk(conn, transaction_type, chunk, user)
+        conn.executemany('''
         INSERT INTO stock_transactions (product_id, transaction_type, quantity, unit_price, total_amount, notes, user, timestamp)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (product_id, transaction_type, quantity, unit_price, total_amount, notes, user, datetime.datetime.now()))
-        
-        conn.commit() # Chấp nhận tất cả thay đổi
-        return True, f"Giao dịch {transaction_type} thành công. Tồn kho mới: {new_stock}"
+        ''', insert_rows)
+        conn.commit()
+        product_cache.invalidate(*(product_id for product_id, _ in touched))
+        return results
+    except Exception as e:
+        conn.rollback() # Cả lô bị hoàn tác, đánh dấu tất cả các dòng là thất bại
+        return [(False, f"Lỗi DB khi xử lý giao dịch: {e}")] * len(chunk)
+
+def db_add_stock_movements_atomic(entries, user="api"):
+    """
+    Ghi một danh sách biến động kho (có thể trộn IN và OUT) theo kiểu "tất cả hoặc không":
+    mọi dòng được áp dụng theo đúng thứ tự trong MỘT transaction; chỉ cần một dòng lỗi
+    (số lượng sai, sản phẩm không tồn tại, xuất quá tồn, ...) thì toàn bộ bị hoàn tác.
+
+    Args:
+        entries (list): Danh sách dictionary giống `db_add_stock_transactions_bulk`,
+                        thêm key 'transaction_type' ('IN'/'OUT') cho từng dòng.
+        user (str): Người/nguồn thực hiện giao dịch.
+
+    Returns:
+        tuple: (bool_thành_công, list_kết_quả) - list_kết_quả là (bool, str_thông_báo) theo thứ tự `entries`.
+    """
+    if not entries:
+        return True, []
+    with borrow_db_connection() as conn:
+        results = _apply_stock_chunk(conn, None, entries, user, atomic=True)
+    return all(success for success, _ in results), results
+
+def db_add_stock_movements_grouped(entries, user="system"):
+    """
+    Ghi các biến động kho ĐỘC LẬP của nhiều request (group commit, xem transaction/write_queue.py)
+    trong MỘT transaction, tức là chỉ một lần commit/fsync cho cả nhóm. Mỗi dòng vẫn được kiểm
+    tra riêng theo thứ tự (kể cả xuất quá tồn); dòng lỗi không làm ảnh hưởng các dòng khác.
+
+    Args:
+        entries (list): Danh sách dictionary giống `db_add_stock_movements_atomic`,
+                        có thể thêm key 'user' cho từng dòng.
+        user (str): Người/nguồn thực hiện mặc định cho các dòng không có key 'user'.
+
+    Returns:
+        list: Danh sách (bool_thành_công, str_thông_báo) theo đúng thứ tự của `entries`.
+    """
+    if not entries:
+        return []
+    with borrow_db_connection() as conn:
+        return _apply_stock_chunk(conn, None, entries, user)
+
+def _apply_stock_chunk(conn, transaction_type, chunk, user, atomic=False):
+    """
+    Ghi một lô giao dịch trong một transaction duy nhất, từng dòng một (dùng cho group commit và API).
+    Mỗi dòng có thể tự chỉ định loại giao dịch bằng key 'transaction_type' và người thực hiện bằng key 'user'.
+    Mỗi dòng được xác thực và ghi riêng trong một SAVEPOINT: dòng lỗi (kể cả lỗi DB) chỉ hoàn tác
+    chính nó, không làm hỏng các dòng khác trong lô (có thể là của các request khác, xem group commit).
+    Với `atomic=True`, nếu có dòng lỗi thì cả lô bị hoàn tác (các dòng hợp lệ cũng không được ghi).
+    """
+    results = []
+    try:
+        # BEGIN IMMEDIATE: giữ khóa ghi ngay từ đầu, cả lô chỉ commit một lần.
+        begin_immediate(conn)
+        cursor = conn.cursor()
+        now = datetime.datetime.now()
+        touched_ids = set()
+        for entry in chunk:
+            # Xác thực từng dòng giống hệt `db_add_stock_transaction`.
+            entry_type = entry.get('transaction_type', transaction_type)
+            if entry_type not in _STOCK_UPDATE_SQL:
+                results.append((False, f"Loại giao dịch không hợp lệ: '{entry_type}'."))
+                continue
+            quantity, unit_price, error = _doc_so_luong_don_gia(entry['quantity_str'], entry['unit_price_str'])
+            if error:
+                results.append((False, error))
+                continue
+
+            product_id = entry['product_id']
+            cursor.execute("SAVEPOINT ghi_mot_dong")
+            try:
+                product_row, error = _cap_nhat_ton_kho(cursor, product_id, entry_type, quantity, now)
+                if not error:
+                    cursor.execute('''
+                    INSERT INTO stock_transactions (product_id, transaction_type, quantity, unit_price, total_amount, notes, user, timestamp)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (product_id, entry_type, quantity, unit_price, quantity * unit_price,
+                          entry.get('notes', ''), entry.get('user', user), now))
+            except sqlite3.Error as e:
+                error = f"Lỗi DB khi xử lý giao dịch: {e}"
+            if error:
+                cursor.execute("ROLLBACK TO ghi_mot_dong")
+                cursor.execute("RELEASE ghi_mot_dong")
+                results.append((False, error))
+                continue
+            cursor.execute("RELEASE ghi_mot_dong")
+            touched_ids.add(product_id)
+            results.append((True, f"Giao dịch {entry_type} thành công. Tồn kho mới: {product_row['current_stock']}"))
+
+        if atomic and not all(success for success, _ in results):
+            conn.rollback()
+            return [result if not result[0] else (False, "Không thực hiện: yêu cầu có dòng bị lỗi nên toàn bộ đã được hoàn tác.")
+                    for result in results]
+
+        conn.commit()
+        product_cache.invalidate(*touched_ids)
+        return results
     except Exception as e:
-        conn.rollback() # Hoàn tác nếu có bất kỳ lỗi nào
-        return False, f"Lỗi DB khi xử lý giao dịch: {e}"
-    finally:
-        conn.close()
+        conn.rollback() # Cả lô bị hoàn tác, đánh dấu tất cả các dòng là thất bại
+        return [(False, f"Lỗi DB khi xử lý giao dịch: {e}")] * len(chunk)
 
 def db_get_transactions_by_date_range(start_date_str, end_date_str):
     """Lấy danh sách các giao dịch trong một khoảng thời gian cho trước."""
-    conn = get_db_connection()
-    params = []
-    query_conditions = []
-    # Xây dựng câu lệnh WHERE một cách linh hoạt
-    if start_date_str:
-        query_conditions.append("strftime('%Y-%m-%d', st.timestamp) >= ?")
-        params.append(start_date_str)
-    if end_date_str:
-        query_conditions.append("strftime('%Y-%m-%d', st.timestamp) <= ?")
-        params.append(end_date_str)
+    # Xây dựng câu lệnh WHERE một cách linh hoạt (khoảng thời gian nửa mở, dùng được index)
+    query_conditions, params = build_timestamp_range("st.timestamp", start_date_str, end_date_str)
     where_clause = " AND ".join(query_conditions) if query_conditions else "1=1"
     
     # Truy vấn dữ liệu, join với bảng products để lấy tên và SKU
@@ -103,15 +306,37 @@ def db_get_transactions_by_date_range(start_date_str, end_date_str):
     FROM stock_transactions st JOIN products p ON st.product_id = p.id
     WHERE {where_clause} ORDER BY st.timestamp DESC'''
     
-    transactions = [dict(row) for row in conn.execute(query, tuple(params)).fetchall()]
-    conn.close()
+    with borrow_db_connection() as conn:
+        transactions = [dict(row) for row in conn.execute(query, tuple(params)).fetchall()]
     return transactions
 
+def db_get_transactions_keyset(start_date_str, end_date_str, limit=PAGE_SIZE_DEFAULT, after=None, before=None, sku=None):
+    """
+    Lấy một trang giao dịch (mới nhất trước) trong khoảng thời gian theo con trỏ (keyset)
+    trên (timestamp, id), có thể lọc theo SKU. Nhờ index trên timestamp (và product_id, timestamp),
+    thời gian lấy một trang không phụ thuộc vào số lượng giao dịch.
+
+    Returns:
+        dict: {'items': list_giao_dịch, 'next': con_trỏ hoặc None, 'prev': con_trỏ hoặc None}
+    """
+    conditions, params = build_timestamp_range("st.timestamp", start_date_str, end_date_str)
+    if sku:
+        # So sánh product_id (thay vì p.sku) để SQLite dùng index (product_id, timestamp).
+        conditions.append("st.product_id = (SELECT id FROM products WHERE sku = ?)")
+        params.append(sku)
+    select_sql = f'''
+    SELECT st.id, p.id as product_id, p.name as product_name, p.sku as product_sku, st.transaction_type,
+           st.quantity, st.unit_price, st.total_amount, st.notes, st.user,
+           strftime('%Y-%m-%d %H:%M:%S', st.timestamp) as timestamp, CAST(st.timestamp AS TEXT) as {SORT_KEY_COLUMN}
+    FROM stock_transactions st JOIN products p ON st.product_id = p.id'''
+    with borrow_db_connection() as conn:
+        # Mọi câu INSERT đều ghi timestamp nên cột này không bao giờ NULL.
+        return fetch_keyset_page(conn, select_sql, conditions, params, "st.timestamp", "st.id",
+                                 False, limit, after, before, nullable=False)
+
 def db_check_product_has_transactions(product_id):
     """Kiểm tra xem một sản phẩm có bất kỳ giao dịch nào không. Trả về True nếu có."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT 1 FROM stock_transactions WHERE product_id = ? LIMIT 1", (product_id,))
-    exists = cursor.fetchone() is not None
-    conn.close()
+    with borrow_db_connection() as conn:
+        cursor = conn.execute("SELECT 1 FROM stock_transactions WHERE product_id = ? LIMIT 1", (product_id,))
+        exists = cursor.fetchone() is not None
     return exists
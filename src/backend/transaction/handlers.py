@@ -4,12 +4,20 @@
 # gọi đến các hàm logic nghiệp vụ để xử lý, và sau đó tạo ra nội dung HTML để trả về cho người dùng.
 
 import datetime
-import os
+import html
 from . import database as db_transaction
 from . import logic as logic_transaction
-from ..product.database import db_get_all_products, db_get_product_by_sku
+from .write_queue import stock_write_queue
+from ..product.database import db_get_product_by_sku
 from ..common import html_templates as tmpl
 from ..common import quan_ly_du_lieu as qldl
+from ..common.journal import transaction_journal
+
+# Số giao dịch trên một trang của lịch sử giao dịch.
+TRANSACTIONS_PAGE_SIZE = 100
+# Số bản ghi trên một trang nhật ký giao dịch (/audit) và các loại sự kiện có thể lọc.
+AUDIT_PAGE_SIZE = 100
+AUDIT_EVENTS = ('THEM_SP_WEB', 'SUA_SP_WEB', 'XOA_MEM_SP_WEB', 'KHOI_PHUC_SP_WEB', 'IN_FILE', 'OUT_FILE', 'API_BULK')
 
 def handle_get_stock_in_out(handler, path):
     """
@@ -28,19 +36,11 @@ def handle_get_stock_in_out(handler, path):
     is_stock_in = path == '/stock/in'
     page_title = "Tạo Phiếu Nhập kho" if is_stock_in else "Tạo Phiếu Xuất kho"
 
-    # Lấy danh sách tất cả sản phẩm từ DB để hiển thị trong dropdown
-    products_db = db_get_all_products(sort_by='name')
-    options = "<option value=''>-- Chọn sản phẩm --</option>"
-    if products_db:
-        for p in products_db:
-            # Thêm thông tin tồn kho và giá vào option để người dùng dễ tham khảo
-            options += f"<option value=\"{p['sku']}\">{p['name']} (SKU: {p['sku']}) - Tồn: {p.get('current_stock',0)} - Giá: {tmpl.format_currency(p.get('price',0))}</option>"
-
     # Tạo nội dung HTML cho body của trang, bao gồm cả hai form
     body_content = f"""<h3>Giao dịch một sản phẩm (Thủ công):</h3>
     <form method="POST" action="{path}">
         <input type="hidden" name="form_action_type" value="manual_stock_transaction">
-        <div><label for="sku_sp">Sản phẩm:</label><select id="sku_sp" name="sku_sp" required>{options}</select></div>
+        <div><label for="sku_sp">Sản phẩm:</label>{tmpl.product_suggest_input('sku_sp', required=True)}</div>
         <div><label for="soLuong">Số lượng (nguyên):</label><input type="number" id="soLuong" name="soLuong" min="1" step="1" required></div>
         <div><label for="ghiChu">Ghi chú:</label><textarea id="ghiChu" name="ghiChu" rows="3"></textarea></div>
         <input type="submit" value="{'Xác nhận Nhập' if is_stock_in else 'Xác nhận Xuất'}">
@@ -58,41 +58,28 @@ def handle_get_transactions_history(handler, query_params):
     """
     Xử lý GET request cho trang lịch sử giao dịch.
     Hiển thị danh sách các giao dịch đã thực hiện và cho phép lọc theo khoảng thời gian.
+    Nội dung trang là một generator nên được gửi dạng luồng: form lọc đến trình duyệt
+    trước khi truy vấn DB, các dòng của bảng được gửi dần khi được tạo ra.
 
     Args:
         handler: Đối tượng request handler của server.
         query_params (dict): Dictionary chứa các tham số từ query string (start_date, end_date).
 
     Returns:
-        tuple: (str_tiêu_đề_trang, str_nội_dung_html_của_body)
+        tuple: (str_tiêu_đề_trang, generator_các_mảnh_html_của_body)
     """
-    page_title = "Lịch sử Giao dịch"
-    # Khởi tạo body_content để tránh lỗi UnboundLocalError
-    body_content = ""
+    return "Lịch sử Giao dịch", _sinh_trang_lich_su_giao_dich(query_params)
+
+def _sinh_trang_lich_su_giao_dich(query_params):
+    """Sinh từng mảnh HTML của trang lịch sử giao dịch (xem `handle_get_transactions_history`)."""
     # Thiết lập ngày mặc định cho bộ lọc: 7 ngày gần nhất
     default_end_date = datetime.date.today()
     default_start_date = default_end_date - datetime.timedelta(days=7)
     start_date_filter = query_params.get('start_date', [default_start_date.isoformat()])[0]
     end_date_filter = query_params.get('end_date', [default_end_date.isoformat()])[0]
 
-    # Gọi lớp database để lấy dữ liệu giao dịch theo bộ lọc
-    transactions_data = db_transaction.db_get_transactions_by_date_range(start_date_filter, end_date_filter)
-
-    # Tạo các hàng HTML cho bảng hiển thị lịch sử
-    table_rows = ""
-    if transactions_data:
-        for t in transactions_data:
-            table_rows += f"""<tr><td>{t['timestamp']}</td><td>{t['product_sku']}</td>
-                <td>{t['product_name']}</td><td>{t['transaction_type']}</td>
-                <td>{t.get('quantity',0)}</td><td>{tmpl.format_currency(t.get('unit_price', 0))}</td>
-                <td>{tmpl.format_currency(t.get('total_amount', 0))}</td>
-                <td>{t.get('notes','')}</td><td>{t.get('user','')}</td></tr>"""
-    else:
-        # Hiển thị thông báo nếu không có giao dịch nào
-        table_rows = "<tr><td colspan='9'>Không có giao dịch nào trong khoảng thời gian đã chọn.</td></tr>"
-
-    # Tạo nội dung HTML hoàn chỉnh, bao gồm form lọc và bảng kết quả
-    body_content = f"""
+    # Form lọc và phần đầu bảng được gửi ngay, trước khi truy vấn DB
+    yield f"""
     <form method="GET" action="/transactions" style="display: flex; align-items: flex-end; gap: 10px; flex-wrap:wrap; margin-bottom:20px;">
         <div><label for="start_date">Từ ngày:</label><input type="date" id="start_date" name="start_date" value="{start_date_filter}"></div>
         <div><label for="end_date">Đến ngày:</label><input type="date" id="end_date" name="end_date" value="{end_date_filter}"></div>
@@ -100,7 +87,29 @@ def handle_get_transactions_history(handler, query_params):
         <a href="/transactions?start_date=&end_date=" class="btn btn-secondary" style='margin-top:0; height: 46px; line-height: 22px;'>Xem lại 7 ngày gần nhất</a>
     </form>
     <table><thead><tr><th>Thời gian</th><th>Mã SKU</th><th>Tên SP</th><th>Loại GD</th><th>Số lượng</th><th>Đơn giá</th><th>Tổng tiền</th><th>Ghi chú</th><th>User</th></tr></thead>
-    <tbody>{table_rows}</tbody></table>
+    <tbody>"""
+
+    # Gọi lớp database để lấy một trang giao dịch theo bộ lọc (phân trang theo con trỏ)
+    page = db_transaction.db_get_transactions_keyset(
+        start_date_filter, end_date_filter, limit=TRANSACTIONS_PAGE_SIZE,
+        after=query_params.get('after', [''])[0], before=query_params.get('before', [''])[0])
+    transactions_data = page['items']
+
+    # Mỗi hàng của bảng là một mảnh HTML riêng
+    for t in transactions_data:
+        yield f"""<tr><td>{t['timestamp']}</td><td>{t['product_sku']}</td>
+            <td>{t['product_name']}</td><td>{t['transaction_type']}</td>
+            <td>{t.get('quantity',0)}</td><td>{tmpl.format_currency(t.get('unit_price', 0))}</td>
+            <td>{tmpl.format_currency(t.get('total_amount', 0))}</td>
+            <td>{t.get('notes','')}</td><td>{t.get('user','')}</td></tr>"""
+    if not transactions_data:
+        # Hiển thị thông báo nếu không có giao dịch nào
+        yield "<tr><td colspan='9'>Không có giao dịch nào trong khoảng thời gian đã chọn.</td></tr>"
+
+    pagination_html = tmpl.pagination_links('/transactions', {'start_date': start_date_filter, 'end_date': end_date_filter},
+                                            page['next'], page['prev'])
+    yield f"""</tbody></table>
+    {pagination_html}
 
     <script>
         const startDateInput = document.getElementById('start_date');
@@ -126,6 +135,68 @@ def handle_get_transactions_history(handler, query_params):
         document.addEventListener('DOMContentLoaded', validateDateRange);
     </script>
     """
+
+def handle_get_audit(handler, query_params):
+    """
+    Xử lý GET request cho trang nhật ký giao dịch (/audit).
+    Tra cứu nhật ký theo khoảng ngày, SKU và loại sự kiện; nhật ký được tìm qua chỉ mục
+    (xem common/journal.py) nên không phải đọc toàn bộ file.
+
+    Args:
+        handler: Đối tượng request handler của server.
+        query_params (dict): Các tham số lọc (start_date, end_date, sku, event) và con trỏ trang 'after'.
+
+    Returns:
+        tuple: (str_tiêu_đề_trang, str_nội_dung_html_của_body)
+    """
+    page_title = "Nhật ký Giao dịch"
+    default_end_date = datetime.date.today()
+    default_start_date = default_end_date - datetime.timedelta(days=7)
+    start_date_filter = query_params.get('start_date', [default_start_date.isoformat()])[0]
+    end_date_filter = query_params.get('end_date', [default_end_date.isoformat()])[0]
+    sku_filter = query_params.get('sku', [''])[0].strip()
+    event_filter = query_params.get('event', [''])[0]
+    if event_filter not in AUDIT_EVENTS:
+        event_filter = ''
+    try:
+        cursor = int(query_params.get('after', [''])[0])
+    except ValueError:
+        cursor = None
+    try:
+        start = f"{datetime.date.fromisoformat(start_date_filter)} 00:00:00" if start_date_filter else None
+        end = f"{datetime.date.fromisoformat(end_date_filter)} 23:59:59" if end_date_filter else None
+    except ValueError:
+        return page_title, "<div class='message error'>Ngày không hợp lệ (định dạng YYYY-MM-DD).</div>"
+
+    page = transaction_journal.search(start=start, end=end, sku=sku_filter or None, event=event_filter or None,
+                                      limit=AUDIT_PAGE_SIZE, before=cursor)
+    pagination_html = tmpl.pagination_links('/audit', {'start_date': start_date_filter, 'end_date': end_date_filter,
+                                                       'sku': sku_filter, 'event': event_filter},
+                                            None if page['next'] is None else str(page['next']))
+
+    table_rows = ""
+    for record in page['items']:
+        counts = f"{record['ok']}/{record['total']}" if 'ok' in record and 'total' in record else ''
+        cells = (record.get('ts', ''), record.get('event', ''), record.get('sku', ''), record.get('file', ''),
+                 counts, record.get('user', ''), record.get('message', ''))
+        table_rows += "<tr>" + "".join(f"<td>{html.escape(str(cell))}</td>" for cell in cells) + "</tr>"
+    if not table_rows:
+        table_rows = "<tr><td colspan='7'>Không có bản ghi nào khớp với bộ lọc.</td></tr>"
+
+    event_options = '<option value="">Tất cả</option>' + "".join(
+        f'<option value="{event}"{" selected" if event == event_filter else ""}>{event}</option>' for event in AUDIT_EVENTS)
+    body_content = f"""
+    <form method="GET" action="/audit" style="display: flex; align-items: flex-end; gap: 10px; flex-wrap:wrap; margin-bottom:20px;">
+        <div><label for="start_date">Từ ngày:</label><input type="date" id="start_date" name="start_date" value="{html.escape(start_date_filter)}"></div>
+        <div><label for="end_date">Đến ngày:</label><input type="date" id="end_date" name="end_date" value="{html.escape(end_date_filter)}"></div>
+        <div><label for="sku">Mã SKU:</label><input type="text" id="sku" name="sku" value="{html.escape(sku_filter)}"></div>
+        <div><label for="event">Sự kiện:</label><select id="event" name="event">{event_options}</select></div>
+        <input type="submit" value="Lọc" style="margin-top:0; height: 46px;">
+    </form>
+    <table><thead><tr><th>Thời gian</th><th>Sự kiện</th><th>Mã SKU</th><th>File</th><th>Thành công/Tổng</th><th>User</th><th>Nội dung</th></tr></thead>
+    <tbody>{table_rows}</tbody></table>
+    {pagination_html}
+    """
     return page_title, body_content
 
 def handle_post_stock_transaction(handler, path, fields):
@@ -154,8 +225,8 @@ def handle_post_stock_transaction(handler, path, fields):
         if sku_sp and so_luong_str:
             product = db_get_product_by_sku(sku_sp)
             if product:
-                # Gọi thẳng lớp DB để thực hiện giao dịch
-                success, msg_result = db_transaction.db_add_stock_transaction(
+                # Ghi qua hàng đợi group commit (gộp các giao dịch đến cùng lúc vào một lần commit)
+                success, msg_result = stock_write_queue.submit(
                     product['id'], transaction_type, so_luong_str, str(product.get('price', 0)), ghi_chu, user="web_manual"
                 )
                 message, msg_type = msg_result, "success" if success else "error"
@@ -166,29 +237,22 @@ def handle_post_stock_transaction(handler, path, fields):
 
     # --- Nhánh 2: Xử lý cho giao dịch bằng file CSV ---
     elif form_action_type == 'csv_stock_transaction':
-        file_content_bytes = handler.get_form_value(fields, 'csvfile')
-        if file_content_bytes:
-            # Lưu file tải lên vào một file tạm thời để xử lý
-            temp_file_path = f"temp_uploaded_{datetime.datetime.now().timestamp()}.csv"
+        # File đã được router ghi ra file tạm trong quá trình nhận request
+        # (và sẽ được router xóa sau khi handler này kết thúc).
+        uploaded_file = handler.get_form_value(fields, 'csvfile', None)
+        if uploaded_file and uploaded_file.size > 0:
             try:
-                with open(temp_file_path, 'wb') as f:
-                    f.write(file_content_bytes)
-
                 # Gọi lớp logic nghiệp vụ để xử lý toàn bộ file
                 if transaction_type == 'IN':
-                    processed_ok, result_msg = logic_transaction.nhap_kho_tu_file_csv(temp_file_path)
+                    processed_ok, result_msg = logic_transaction.nhap_kho_tu_file_csv(uploaded_file.path)
                 else: # OUT
-                    processed_ok, result_msg = logic_transaction.xuat_kho_tu_file_csv(temp_file_path)
+                    processed_ok, result_msg = logic_transaction.xuat_kho_tu_file_csv(uploaded_file.path)
 
                 message = result_msg.replace('\\n', '<br>') # Thay ký tự xuống dòng để hiển thị đúng trên HTML
                 msg_type = "success" if processed_ok else "error"
             except Exception as e:
                 message = f"Lỗi nghiêm trọng khi xử lý file: {e}"
                 qldl.ghi_log_loi(f"Xử lý file CSV thất bại ({path}): {e}")
-            finally:
-                # Luôn dọn dẹp file tạm sau khi xử lý xong
-                if os.path.exists(temp_file_path):
-                    os.remove(temp_file_path)
         else:
             message = "Không có file CSV nào được tải lên."
     else:
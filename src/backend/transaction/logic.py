@@ -1,14 +1,27 @@
 # /src/backend/transaction/logic.py
+import csv
+import itertools
 import os
 from ..common import quan_ly_du_lieu as qldl
 from . import database as db_transaction
-from ..product.database import db_get_product_by_sku
+from ..product.database import db_get_products_by_skus
+
+# Số dòng CSV được đọc, xác thực và ghi vào DB trong mỗi lượt (mỗi lượt là một transaction).
+CSV_CHUNK_SIZE = 5000
+# Số chi tiết lỗi tối đa được giữ lại cho thông báo tổng kết.
+MAX_ERROR_DETAILS = 5
+# Số biến động kho tối đa trong một yêu cầu hàng loạt qua API (ghi trong một transaction).
+MAX_BULK_MOVEMENTS = 5000
+# Các loại giao dịch hợp lệ.
+TRANSACTION_TYPES = ('IN', 'OUT')
 
 def _process_stock_file(ten_file, transaction_type):
     """
     Logic nghiệp vụ cốt lõi để xử lý nhập/xuất kho hàng loạt từ file CSV.
-    Hàm này điều phối việc đọc file, xác thực dữ liệu từng dòng, và gọi đến lớp
-    database để thực hiện giao dịch cho các dòng hợp lệ.
+    Hàm này đọc file theo luồng và xử lý từng khối CSV_CHUNK_SIZE dòng: xác thực dữ liệu,
+    tra cứu SKU của cả khối bằng một truy vấn, rồi gọi lớp database để ghi khối đó
+    trong một transaction. Bộ nhớ sử dụng không phụ thuộc vào kích thước file và
+    các dòng đầu tiên được ghi vào DB trước khi file được đọc hết.
 
     Args:
         ten_file (str): Đường dẫn đến file CSV.
@@ -17,71 +30,108 @@ def _process_stock_file(ten_file, transaction_type):
     Returns:
         tuple: (bool_thành_công, str_thông_báo_tổng_kết)
     """
-    # Bước 1: Đọc và phân tích file CSV
-    data_rows, msg_read = qldl.doc_file_csv_cho_nhap_xuat(ten_file)
+    ten_file_hien_thi = os.path.basename(ten_file)
 
-    if data_rows is None:
+    # Bước 1: Mở file CSV và phân tích header (chưa đọc dữ liệu)
+    try:
+        rows_iter, msg_read = qldl.doc_file_csv_theo_luong(ten_file)
+    except Exception as e:
+        rows_iter, msg_read = None, f"Lỗi không xác định khi đọc file '{ten_file_hien_thi}': {e}"
+    if rows_iter is None:
         qldl.ghi_log_loi(f"{transaction_type} kho từ file CSV thất bại (đọc file): {msg_read}")
         return False, msg_read
-    if not data_rows and isinstance(data_rows, list):
-        return True, f"Thông báo: File CSV '{os.path.basename(ten_file)}' không có dữ liệu."
 
     # Bước 2: Khởi tạo các biến đếm và theo dõi kết quả
     success_count, failure_count, processed_rows = 0, 0, 0
-    error_messages_summary = []
-    log_header = f"--- Bắt đầu Log xử lý file {transaction_type}: {os.path.basename(ten_file)} ---"
+    error_messages_summary = [] # (số_dòng, thông_báo); chỉ giữ MAX_ERROR_DETAILS lỗi ở các dòng đầu tiên
+    log_header = f"--- Bắt đầu Log xử lý file {transaction_type}: {ten_file_hien_thi} ---"
     qldl.ghi_log_loi(log_header)
 
-    # Bước 3: Lặp qua từng dòng dữ liệu đã đọc từ file
-    for i, row in enumerate(data_rows, start=1):
-        processed_rows += 1
-        ma_sp = row.get('maSP', '').strip()
-        so_luong_str = row.get('soLuongProcessed', '').strip()
-        
-        # Xác thực dữ liệu cơ bản
-        if not ma_sp or not so_luong_str:
-            err_msg = f"Dòng {i}: Bỏ qua do thiếu SKU hoặc số lượng."
-            error_messages_summary.append(err_msg)
-            failure_count += 1
-            continue
-        
-        product = db_get_product_by_sku(ma_sp)
-        if not product:
-            err_msg = f"Dòng {i}, SKU '{ma_sp}': Sản phẩm không tồn tại."
-            error_messages_summary.append(err_msg)
-            failure_count += 1
-            continue
-        
-        unit_price_str = str(product.get('price', 0))
-
-        # Tạo ghi chú cho giao dịch
-        ghi_chu_file = row.get('ghiChu', '').strip()
-        notes_combined = f"Từ file {os.path.basename(ten_file)}, dòng {i}. Ghi chú: {ghi_chu_file}"
-        
-        # Bước 4: Gọi lớp database để thực hiện giao dịch
-        success, trans_msg = db_transaction.db_add_stock_transaction(
-            product['id'], transaction_type, so_luong_str, unit_price_str, notes_combined, user="file_csv"
-        )
-        
-        # Bước 5: Cập nhật kết quả
-        if success:
-            success_count += 1
-        else:
-            err_msg = f"Dòng {i}, SKU '{ma_sp}': Lỗi khi xử lý - {trans_msg}"
-            error_messages_summary.append(err_msg)
-            failure_count += 1
+    def ghi_nhan_loi(line_no, err_msg):
+        nonlocal failure_count
+        failure_count += 1
+        # Lỗi ghi DB của một khối được biết sau lỗi xác thực của khối đó, nên cần
+        # giữ lại các lỗi có số dòng nhỏ nhất thay vì các lỗi được ghi nhận trước.
+        error_messages_summary.append((line_no, err_msg))
+        if len(error_messages_summary) > MAX_ERROR_DETAILS:
+            error_messages_summary.sort()
+            error_messages_summary.pop()
+
+    read_error = None
+    line_numbers = itertools.count(1)
+    try:
+        # Bước 3: Xử lý file theo từng khối dòng
+        while True:
+            chunk = list(itertools.islice(zip(line_numbers, rows_iter), CSV_CHUNK_SIZE))
+            if not chunk:
+                break
+            processed_rows += len(chunk)
+
+            # Tra cứu tất cả SKU trong khối bằng một lượt truy vấn
+            products_by_sku = db_get_products_by_skus(row['maSP'] for _, row in chunk)
+
+            # Xác thực từng dòng và gom các dòng hợp lệ thành một lô giao dịch
+            pending_entries = [] # (số_dòng, sku, dữ_liệu_giao_dịch)
+            for i, row in chunk:
+                ma_sp = row['maSP']
+                so_luong_str = row['soLuongProcessed']
+                
+                # Xác thực dữ liệu cơ bản
+                if not ma_sp or not so_luong_str:
+                    ghi_nhan_loi(i, f"Dòng {i}: Bỏ qua do thiếu SKU hoặc số lượng.")
+                    continue
+                
+                product = products_by_sku.get(ma_sp)
+                if not product:
+                    ghi_nhan_loi(i, f"Dòng {i}, SKU '{ma_sp}': Sản phẩm không tồn tại.")
+                    continue
+                
+                # Tạo ghi chú cho giao dịch
+                notes_combined = f"Từ file {ten_file_hien_thi}, dòng {i}. Ghi chú: {row['ghiChu']}"
+                pending_entries.append((i, ma_sp, {
+                    'product_id': product['id'],
+                    'quantity_str': so_luong_str,
+                    'unit_price_str': str(product.get('price', 0)),
+                    'notes': notes_combined,
+                }))
+
+            # Bước 4: Gọi lớp database để ghi cả khối trong một transaction
+            results = db_transaction.db_add_stock_transactions_bulk(
+                transaction_type, [entry for _, _, entry in pending_entries], user="file_csv"
+            )
+
+            # Bước 5: Cập nhật kết quả
+            for (i, ma_sp, _), (success, trans_msg) in zip(pending_entries, results):
+                if success:
+                    success_count += 1
+                else:
+                    ghi_nhan_loi(i, f"Dòng {i}, SKU '{ma_sp}': Lỗi khi xử lý - {trans_msg}")
+    except (csv.Error, UnicodeDecodeError) as e:
+        # Các khối trước đó đã được ghi; dừng xử lý tại vị trí lỗi.
+        read_error = f"Lỗi định dạng CSV trong file '{ten_file_hien_thi}' (sau dòng {processed_rows}): {e}"
+        qldl.ghi_log_loi(read_error)
+    finally:
+        rows_iter.close()
             
     qldl.ghi_log_loi(f"--- Kết thúc Log xử lý file ---")
 
-    # Bước 6: Tạo thông báo tổng kết cuối cùng
-    final_msg = f"Hoàn tất xử lý file '{os.path.basename(ten_file)}'.\nThành công: {success_count}/{processed_rows}."
+    if processed_rows == 0 and not read_error:
+        return True, f"Thông báo: File CSV '{ten_file_hien_thi}' không có dữ liệu."
+
+    # Bước 6: Tạo thông báo tổng kết cuối cùng (lỗi được sắp xếp theo thứ tự dòng trong file)
+    error_messages_summary = [msg for _, msg in sorted(error_messages_summary)]
+    final_msg = f"Hoàn tất xử lý file '{ten_file_hien_thi}'.\nThành công: {success_count}/{processed_rows}."
     if failure_count > 0:
         final_msg += f"\nThất bại: {failure_count} dòng."
         if error_messages_summary:
              final_msg += "\nChi tiết lỗi (tối đa 5):\n" + "\n".join(error_messages_summary[:5])
+    if read_error:
+        final_msg += f"\n{read_error}"
     
     if processed_rows > 0:
-        qldl.ghi_log_giao_dich(f"{transaction_type}_FILE: '{os.path.basename(ten_file)}', TC: {success_count}/{processed_rows}.")
+        qldl.ghi_log_giao_dich(f"{transaction_type}_FILE: '{ten_file_hien_thi}', TC: {success_count}/{processed_rows}.",
+                               event=f"{transaction_type}_FILE", file=ten_file_hien_thi, ok=success_count,
+                               total=processed_rows, user="file_csv")
 
     return success_count > 0 or (processed_rows == 0), final_msg
 
@@ -97,4 +147,84 @@ def xuat_kho_tu_file_csv(ten_file_xuat):
     Logic nghiệp vụ để điều phối việc xuất kho từ một file CSV.
     Đây là một hàm public, gọi đến hàm xử lý private `_process_stock_file`.
     """
-    return _process_stock_file(ten_file_xuat, 'OUT')
\ No newline at end of file
+    return _process_stock_file(ten_file_xuat, 'OUT')
+
+def _la_so_nguyen_duong(value):
+    """Kiểm tra giá trị (số nguyên hoặc chuỗi số từ JSON) có phải là số nguyên dương không."""
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        return False
+    try:
+        return int(value) > 0
+    except ValueError:
+        return False
+
+def xu_ly_bien_dong_kho_hang_loat(movements, user="api"):
+    """
+    Logic nghiệp vụ cho nhập/xuất kho hàng loạt qua API: xác thực từng dòng, tra cứu
+    tất cả SKU bằng một lượt truy vấn rồi ghi toàn bộ trong MỘT transaction
+    ("tất cả hoặc không": một dòng lỗi thì không dòng nào được ghi).
+
+    Args:
+        movements (list): Danh sách dictionary {'sku', 'qty', 'type' ('IN'/'OUT'),
+                          'unit_price' (tùy chọn, mặc định đơn giá sản phẩm), 'note' (tùy chọn)}.
+        user (str): Người/nguồn thực hiện giao dịch.
+
+    Returns:
+        tuple: (bool_thành_công, list_kết_quả) - mỗi kết quả là dict
+               {'index', 'sku', 'type', 'qty', 'ok', 'message'}.
+    """
+    if not isinstance(movements, list) or not movements:
+        return False, [{'index': None, 'ok': False, 'message': "Danh sách biến động kho rỗng hoặc không hợp lệ."}]
+    if len(movements) > MAX_BULK_MOVEMENTS:
+        return False, [{'index': None, 'ok': False,
+                        'message': f"Tối đa {MAX_BULK_MOVEMENTS} dòng trong một yêu cầu (nhận {len(movements)})."}]
+
+    # Bước 1: Xác thực cấu trúc từng dòng (chưa truy vấn DB)
+    results = []
+    for index, item in enumerate(movements):
+        if not isinstance(item, dict):
+            results.append({'index': index, 'ok': False, 'message': "Mỗi dòng phải là một object JSON."})
+            continue
+        sku = str(item.get('sku') or '').strip()
+        transaction_type = str(item.get('type') or '').strip().upper()
+        result = {'index': index, 'sku': sku, 'type': transaction_type, 'qty': item.get('qty'), 'ok': True, 'message': ''}
+        if not sku:
+            result.update(ok=False, message="Thiếu SKU.")
+        elif transaction_type not in TRANSACTION_TYPES:
+            result.update(ok=False, message="Loại giao dịch phải là 'IN' hoặc 'OUT'.")
+        elif not _la_so_nguyen_duong(item.get('qty')):
+            result.update(ok=False, message="Số lượng phải là số nguyên dương.")
+        results.append(result)
+
+    # Bước 2: Tra cứu sản phẩm của tất cả SKU bằng một lượt truy vấn
+    products_by_sku = db_get_products_by_skus(result['sku'] for result in results if result['ok'])
+    entries = []
+    for result, item in zip(results, movements):
+        if not result['ok']:
+            continue
+        product = products_by_sku.get(result['sku'])
+        if not product:
+            result.update(ok=False, message=f"Không tìm thấy sản phẩm với SKU '{result['sku']}'.")
+            continue
+        entries.append((result, {
+            'product_id': product['id'],
+            'transaction_type': result['type'],
+            'quantity_str': str(item['qty']),
+            'unit_price_str': str(item.get('unit_price', product.get('price', 0))),
+            'notes': str(item.get('note') or ''),
+        }))
+
+    if len(entries) < len(results):
+        for result, _ in entries:
+            result.update(ok=False, message="Không thực hiện: yêu cầu có dòng bị lỗi.")
+        return False, results
+
+    # Bước 3: Ghi tất cả trong một transaction
+    success, db_results = db_transaction.db_add_stock_movements_atomic([entry for _, entry in entries], user=user)
+    for (result, _), (ok, msg) in zip(entries, db_results):
+        result.update(ok=ok, message=msg)
+    if success:
+        so_nhap = sum(1 for result in results if result['type'] == 'IN')
+        qldl.ghi_log_giao_dich(f"API_BULK ({user}): {len(results)} dòng ({so_nhap} IN, {len(results) - so_nhap} OUT).",
+                               event='API_BULK', ok=len(results), total=len(results), user=user)
+    return success, results
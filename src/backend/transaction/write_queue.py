@@ -0,0 +1,163 @@
+# /src/backend/transaction/write_queue.py
+# File này chứa hàng đợi ghi gộp (group commit) cho các giao dịch nhập/xuất kho thủ công:
+#   - Mỗi giao dịch riêng lẻ cần một lần commit (và fsync) của SQLite, nên số giao dịch mỗi giây
+#     bị giới hạn bởi tốc độ fsync của ổ đĩa chứ không phải bởi số request.
+#   - Các luồng xử lý request đưa giao dịch vào hàng đợi rồi chờ kết quả; một luồng ghi duy nhất
+#     gom các giao dịch đến trong một khoảng thời gian ngắn (vài ms) và ghi chúng trong MỘT
+#     transaction. Mỗi request vẫn nhận kết quả (thành công/lỗi) của riêng nó.
+#   - Mỗi tiến trình (worker prefork) có hàng đợi và luồng ghi riêng, tạo khi cần sau khi fork.
+
+import os
+import queue
+import threading
+import time
+from . import database as db_transaction
+
+# --- Cấu hình group commit ---
+# Thời gian (giây) chờ gom thêm giao dịch sau giao dịch đầu tiên của một nhóm (0 = tắt, ghi trực tiếp).
+GROUP_COMMIT_WINDOW = 0.003
+# Số giao dịch tối đa trong một nhóm (đủ số này thì ghi ngay, không chờ hết thời gian gom).
+GROUP_COMMIT_MAX_BATCH = 256
+# Thời gian (giây) tối đa một request chờ kết quả của giao dịch đã đưa vào hàng đợi.
+GROUP_COMMIT_TIMEOUT = 30.0
+
+_STOPPED_MESSAGE = "Server đang dừng, giao dịch chưa được ghi. Vui lòng thử lại sau."
+
+class _PendingMovement:
+    """Một giao dịch đang chờ trong hàng đợi và kết quả của nó."""
+    __slots__ = ('entry', 'result', 'done')
+
+    def __init__(self, entry):
+        self.entry = entry
+        self.result = None
+        self.done = threading.Event()
+
+class StockWriteQueue:
+    """
+    Hàng đợi ghi gộp các giao dịch kho.
+
+    Ví dụ:
+        success, message = stock_write_queue.submit(product_id, 'OUT', '3', '15000', user="web_manual")
+    """
+
+    def __init__(self, window=GROUP_COMMIT_WINDOW, max_batch=GROUP_COMMIT_MAX_BATCH, timeout=GROUP_COMMIT_TIMEOUT):
+        self.window = window
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self._reset_state()
+
+    def _reset_state(self):
+        """Khởi tạo (lại) trạng thái cho tiến trình hiện tại (luồng ghi không tồn tại qua fork)."""
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._closed = False   # Đã gọi shutdown: không nhận thêm giao dịch
+        self._batches = 0
+        self._movements = 0
+        self._largest_batch = 0
+
+    def _ensure_writer(self):
+        if self._pid != os.getpid():
+            self._reset_state()
+        with self._lock:
+            if not self._closed and (self._thread is None or not self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._run, name="stock-write-queue", daemon=True)
+                self._thread.start()
+
+    def submit(self, product_id, transaction_type, quantity_str, unit_price_str, notes="", user="system"):
+        """
+        Ghi một giao dịch kho qua hàng đợi và chờ đến khi nhóm chứa nó được commit.
+        Tham số và kết quả giống hệt `database.db_add_stock_transaction`. Sau khi `shutdown`,
+        hoặc nếu chờ quá `timeout` giây, trả về (False, thông_báo) thay vì chờ mãi.
+
+        Returns:
+            tuple: (bool_thành_công, str_thông_báo)
+        """
+        if self.window <= 0:
+            return db_transaction.db_add_stock_transaction(product_id, transaction_type, quantity_str,
+                                                          unit_price_str, notes, user)
+        pending = _PendingMovement({'product_id': product_id, 'transaction_type': transaction_type,
+                                    'quantity_str': quantity_str, 'unit_price_str': unit_price_str,
+                                    'notes': notes, 'user': user})
+        self._ensure_writer()
+        # Kiểm tra và đưa vào hàng đợi trong cùng khóa với `shutdown`: không giao dịch nào
+        # nằm sau tín hiệu dừng (khi đó sẽ không còn luồng nào ghi nó).
+        with self._lock:
+            if self._closed:
+                return False, _STOPPED_MESSAGE
+            self._queue.put(pending)
+        if not pending.done.wait(self.timeout):
+            return False, "Hết thời gian chờ ghi giao dịch. Vui lòng kiểm tra lịch sử giao dịch trước khi thử lại."
+        return pending.result
+
+    def _collect_batch(self, first):
+        """Gom thêm các giao dịch đến trong thời gian `window` (tính từ giao dịch đầu tiên)."""
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None: # Tín hiệu dừng: ghi nốt nhóm hiện tại rồi dừng
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        """Vòng lặp của luồng ghi."""
+        while True:
+            first = self._queue.get()
+            if first is None:
+                self._fail_pending()
+                return
+            batch = self._collect_batch(first)
+            try:
+                results = db_transaction.db_add_stock_movements_grouped([pending.entry for pending in batch])
+            except Exception as e:
+                results = [(False, f"Lỗi DB khi xử lý giao dịch: {e}")] * len(batch)
+            with self._lock:
+                self._batches += 1
+                self._movements += len(batch)
+                self._largest_batch = max(self._largest_batch, len(batch))
+            for pending, result in zip(batch, results):
+                pending.result = result
+                pending.done.set()
+
+    def _fail_pending(self):
+        """Báo lỗi cho các giao dịch còn trong hàng đợi khi luồng ghi dừng (không ai ghi chúng nữa)."""
+        while True:
+            try:
+                pending = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if pending is not None:
+                pending.result = (False, _STOPPED_MESSAGE)
+                pending.done.set()
+
+    def stats(self):
+        """Trả về thông tin thống kê của hàng đợi (trong tiến trình hiện tại)."""
+        with self._lock:
+            return {'window_ms': self.window * 1000, 'batches': self._batches, 'movements': self._movements,
+                    'largest_batch': self._largest_batch, 'pending': self._queue.qsize()}
+
+    def shutdown(self):
+        """
+        Ghi nốt các giao dịch đang chờ rồi dừng luồng ghi (gọi khi tắt server).
+        Các lần `submit` sau đó bị từ chối.
+        """
+        if self._pid != os.getpid():
+            self._reset_state()
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+            if thread is not None and thread.is_alive():
+                self._queue.put(None)
+        if thread is not None:
+            thread.join()
+
+# Hàng đợi dùng chung trong tiến trình.
+stock_write_queue = StockWriteQueue()
@@ -1,33 +1,211 @@
 # src/main.py
-from http.server import HTTPServer
+import time
+_THOI_DIEM_BAT_DAU = time.perf_counter() # Mốc đo thời gian khởi động (trước khi import các module).
+
+import argparse
+import os
+from contextlib import contextmanager
+from .backend import request_router
 from .backend.request_router import MiniVentoryRequestHandler
 from .backend.common import quan_ly_du_lieu as qldl
 from .backend import database_utils as db
+from .backend import server_modes
+from .backend.common import database_base
+from .backend.common import multipart
+from .backend.common import html_templates as tmpl
+from .backend.common.chart_service import chart_service
+from .backend.common import chart_utils
+from .backend.common.log_writer import log_writer
+from .backend.common.journal import transaction_journal
+from .backend.product.cache import product_cache
+from .backend.transaction.write_queue import stock_write_queue
+
+_THOI_GIAN_IMPORT = time.perf_counter() - _THOI_DIEM_BAT_DAU
 
 # --- Cấu hình Server ---
 HOST_NAME = 'localhost'
 SERVER_PORT = 8001
+# Chế độ xử lý đồng thời: 'single' (đơn luồng), 'threaded' (pool luồng), 'prefork' (nhiều tiến trình).
+SERVER_MODE = 'threaded'
+# Số luồng worker trong mỗi tiến trình (chế độ 'threaded' và 'prefork').
+SERVER_THREADS = 8
+# Số tiến trình worker cho chế độ 'prefork' (mặc định bằng số lõi CPU).
+SERVER_WORKERS = os.cpu_count() or 2
+
+def parse_args(argv=None):
+    """Đọc các tham số dòng lệnh để ghi đè cấu hình mặc định của server."""
+    parser = argparse.ArgumentParser(description="Chạy web server MiniVentory.")
+    parser.add_argument('--host', default=HOST_NAME, help="Địa chỉ lắng nghe.")
+    parser.add_argument('--port', type=int, default=SERVER_PORT, help="Cổng lắng nghe.")
+    parser.add_argument('--mode', choices=server_modes.SERVER_MODES, default=SERVER_MODE,
+                        help="Chế độ xử lý đồng thời của server.")
+    parser.add_argument('--threads', type=int, default=SERVER_THREADS,
+                        help="Số luồng worker trong mỗi tiến trình.")
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS,
+                        help="Số tiến trình worker (chỉ dùng với --mode prefork).")
+    parser.add_argument('--max-upload-mb', type=int, default=multipart.MAX_UPLOAD_SIZE // (1024 * 1024),
+                        help="Kích thước tối đa (MB) của dữ liệu tải lên trong một request.")
+    parser.add_argument('--db-profile', choices=sorted(database_base.PRAGMA_PROFILES), default=database_base.PRAGMA_PROFILE,
+                        help="Profile PRAGMA của SQLite (durable / balanced / bulk_load).")
+    parser.add_argument('--chart-backend', choices=chart_utils.CHART_BACKENDS, default=chart_utils.CHART_BACKEND,
+                        help="Bộ vẽ biểu đồ: 'svg' (Python thuần, mặc định) hoặc 'matplotlib'.")
+    parser.add_argument('--product-cache-size', type=int, default=product_cache.max_size,
+                        help="Số sản phẩm tối đa giữ trong cache đọc theo ID/SKU của mỗi tiến trình (0 = tắt).")
+    parser.add_argument('--product-cache-check-ms', type=float, default=product_cache.coherence_interval * 1000,
+                        help="Chế độ prefork: thời gian (ms) tối đa một worker còn thấy dữ liệu sản phẩm cũ sau khi "
+                             "worker khác ghi (0 = kiểm tra nhật ký thay đổi trước mỗi lần tra cache).")
+    parser.add_argument('--group-commit-ms', type=float, default=stock_write_queue.window * 1000,
+                        help="Thời gian (ms) gom các giao dịch nhập/xuất kho thủ công vào một lần commit (0 = tắt).")
+    parser.add_argument('--write-allow', type=request_router.parse_networks, default=None,
+                        help="Các địa chỉ/mạng IP được phép ghi (thêm/sửa sản phẩm, nhập/xuất kho), phân cách bằng dấu phẩy "
+                             "(mặc định: không giới hạn; khi đặt, client ngoài các mạng này cần --write-token).")
+    parser.add_argument('--write-token', default=None,
+                        help="Mã truy cập cho phép ghi từ địa chỉ khác (header 'Authorization: Bearer <mã>').")
+    parser.add_argument('--warmup', action='store_true',
+                        help="Nạp trước các module và làm nóng cache (DB, biểu đồ) trước khi nhận request.")
+    parser.add_argument('--rebuild-rollups', action='store_true',
+                        help="Tính lại bảng tổng hợp báo cáo theo ngày từ lịch sử giao dịch rồi thoát (không chạy server).")
+    parser.add_argument('--verify-counters', action='store_true',
+                        help="Kiểm tra bộ đếm của trang chủ với dữ liệu thực rồi thoát.")
+    parser.add_argument('--rebuild-counters', action='store_true',
+                        help="Tính lại bộ đếm của trang chủ từ dữ liệu thực rồi thoát.")
+    parser.add_argument('--rebuild-search-index', action='store_true',
+                        help="Tạo lại chỉ mục tìm kiếm toàn văn của sản phẩm rồi thoát.")
+    parser.add_argument('--rebuild-journal-index', action='store_true',
+                        help="Tạo lại chỉ mục của nhật ký giao dịch (lichsugiaodich.jsonl) rồi thoát.")
+    return parser.parse_args(argv)
+
+def _khoi_tao_worker():
+    """Được gọi trong mỗi tiến trình con (chế độ prefork) ngay sau khi fork."""
+    # Mỗi worker dùng pool kết nối SQLite riêng, không dùng lại kết nối của tiến trình cha.
+    database_base.reset_connection_pool()
+    # Cache sản phẩm riêng của từng worker: đọc nhật ký thay đổi để thấy các lần ghi từ worker khác.
+    product_cache.enable_coherence_check()
+    qldl.ghi_log_loi(f"Worker MiniVentory (pid {os.getpid()}) bắt đầu nhận request.")
+
+def _ket_thuc_worker():
+    """Được gọi trong mỗi tiến trình con (chế độ prefork) trước khi thoát."""
+    # os._exit không chạy atexit: tự ghi nốt các giao dịch và dòng log còn trong hàng đợi.
+    stock_write_queue.shutdown()
+    log_writer.close()
+
+@contextmanager
+def _do_thoi_gian(bang_thoi_gian, ten_buoc):
+    """Đo thời gian của một bước khởi động và thêm vào `bang_thoi_gian` dạng (tên, giây)."""
+    bat_dau = time.perf_counter()
+    try:
+        yield
+    finally:
+        bang_thoi_gian.append((ten_buoc, time.perf_counter() - bat_dau))
+
+def _bao_cao_khoi_dong(bang_thoi_gian):
+    """In và ghi log bảng thời gian khởi động (tính từ lúc bắt đầu import main)."""
+    tong = time.perf_counter() - _THOI_DIEM_BAT_DAU
+    chi_tiet = ", ".join(f"{ten} {giay * 1000:.0f} ms" for ten, giay in bang_thoi_gian)
+    thong_bao = f"Khởi động xong trong {tong * 1000:.0f} ms ({chi_tiet})."
+    print(thong_bao)
+    qldl.ghi_log_loi(thong_bao)
+
+def _lam_nong(args):
+    """
+    Bước warm-up (tùy chọn, bật bằng --warmup): nạp trước các module handlers và bộ vẽ biểu đồ,
+    đọc trước các bảng hay dùng để SQLite và hệ điều hành đưa dữ liệu vào cache, dựng sẵn chỉ mục
+    gợi ý sản phẩm.
+    Ở chế độ prefork, bước này chạy trước khi fork nên các tiến trình con thừa hưởng module đã nạp.
+    """
+    from .backend.product import database as product_db
+    from .backend.product.suggest import product_index
+    from .backend.report import database as report_db
+    request_router.preload_handlers()
+    report_db.db_get_dashboard_stats()
+    product_db.db_get_all_products()
+    product_index.warm_up()
+    hom_nay = time.strftime('%Y-%m-%d')
+    report_db.db_get_revenue_by_product('0000-01-01', hom_nay)
+    if args.mode == 'prefork':
+        # Pool tiến trình vẽ biểu đồ không dùng chung qua fork: chỉ nạp trước bộ vẽ trong tiến trình cha.
+        chart_utils.preload_chart_backend()
+    else:
+        chart_service.warm_up()
+
+def _chay_lenh_bao_tri(args):
+    """Chạy các lệnh bảo trì dữ liệu (không khởi động server)."""
+    from .backend.report import database as report_db
+    from .backend.product import database as product_db
+    database_base.set_pragma_profile(args.db_profile)
+    db.init_db()
+    try:
+        if args.rebuild_rollups:
+            success, msg = report_db.db_rebuild_daily_product_rollup()
+            print(msg)
+            qldl.ghi_log_loi(msg)
+        if args.verify_counters:
+            success, msg = report_db.db_verify_dashboard_counters()
+            print(msg)
+        if args.rebuild_counters:
+            success, msg = report_db.db_rebuild_dashboard_counters()
+            print(msg)
+            qldl.ghi_log_loi(msg)
+        if args.rebuild_search_index:
+            success, msg = product_db.db_rebuild_product_search_index()
+            print(msg)
+            qldl.ghi_log_loi(msg)
+        if args.rebuild_journal_index:
+            success, msg = transaction_journal.rebuild_index()
+            print(msg)
+            qldl.ghi_log_loi(msg)
+    finally:
+        database_base.connection_pool.close_all()
 
-def main():
+def main(argv=None):
     """
     Điểm khởi đầu của ứng dụng (entry point).
-    Hàm này khởi tạo cơ sở dữ liệu và bắt đầu chạy HTTP server.
+    Hàm này khởi tạo cơ sở dữ liệu và bắt đầu chạy HTTP server
+    theo chế độ đồng thời được cấu hình.
     """
+    args = parse_args(argv)
+    multipart.MAX_UPLOAD_SIZE = args.max_upload_mb * 1024 * 1024
+    if (args.rebuild_rollups or args.verify_counters or args.rebuild_counters or args.rebuild_search_index
+            or args.rebuild_journal_index):
+        _chay_lenh_bao_tri(args)
+        return
+    bang_thoi_gian = [("import", _THOI_GIAN_IMPORT)]
     try:
+        database_base.set_pragma_profile(args.db_profile)
+        chart_utils.set_chart_backend(args.chart_backend)
+        product_cache.max_size = args.product_cache_size
+        product_cache.coherence_interval = args.product_cache_check_ms / 1000
+        stock_write_queue.window = args.group_commit_ms / 1000
+        request_router.set_write_access(args.write_allow, args.write_token)
+        # Thiết lập locale một lần, trước khi có luồng worker.
+        tmpl.setup_locale()
         # Khởi tạo các bảng trong cơ sở dữ liệu nếu chưa tồn tại.
-        db.init_db() 
+        with _do_thoi_gian(bang_thoi_gian, "khởi tạo DB"):
+            db.init_db() 
         if hasattr(qldl, 'ghi_log_loi'):
-            qldl.ghi_log_loi(f"Khởi động server web MiniVentory với SQLite DB '{db.DB_NAME}' tại cổng {HOST_NAME}:{SERVER_PORT}.")
+            qldl.ghi_log_loi(f"Khởi động server web MiniVentory với SQLite DB '{db.DB_NAME}' tại cổng {args.host}:{args.port} (chế độ {args.mode}, profile DB {args.db_profile}).")
+        if args.warmup:
+            with _do_thoi_gian(bang_thoi_gian, "warm-up"):
+                _lam_nong(args)
         
         # Thiết lập địa chỉ và khởi tạo server với Request Handler đã định nghĩa.
-        server_address = (HOST_NAME, SERVER_PORT)
-        httpd = HTTPServer(server_address, MiniVentoryRequestHandler) 
+        server_address = (args.host, args.port)
+        with _do_thoi_gian(bang_thoi_gian, "mở socket"):
+            httpd = server_modes.create_server(server_address, MiniVentoryRequestHandler, args.mode, args.threads)
+        _bao_cao_khoi_dong(bang_thoi_gian)
         
-        print(f"MiniVentory Web (tái cấu trúc) đang chạy tại http://{HOST_NAME}:{SERVER_PORT}/")
+        print(f"MiniVentory Web (tái cấu trúc) đang chạy tại http://{args.host}:{args.port}/")
+        if args.mode == 'prefork':
+            print(f"Chế độ prefork: {args.workers} tiến trình x {args.threads} luồng.")
+        elif args.mode == 'threaded':
+            print(f"Chế độ đa luồng: {args.threads} luồng worker.")
         print("Nhấn Ctrl+C để dừng server.")
         
         # Bắt đầu vòng lặp chính của server để lắng nghe các request.
-        httpd.serve_forever()
+        if args.mode == 'prefork':
+            server_modes.serve_prefork(httpd, args.workers, worker_init=_khoi_tao_worker, worker_exit=_ket_thuc_worker)
+        else:
+            httpd.serve_forever()
 
     except KeyboardInterrupt:
         # Xử lý khi người dùng nhấn Ctrl+C để dừng server một cách an toàn.
@@ -43,6 +221,9 @@ def main():
         # Đảm bảo server được đóng lại đúng cách khi kết thúc.
         if 'httpd' in locals() and httpd: 
             httpd.server_close()
+        stock_write_queue.shutdown()
+        chart_service.shutdown()
+        database_base.connection_pool.close_all()
         print("Đã dừng server.")
 
 if __name__ == '__main__':
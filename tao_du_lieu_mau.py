@@ -9,6 +9,7 @@ import os
 import random
 import uuid
 import time # Để theo dõi và in ra thời gian thực thi của các tác vụ
+from src.backend.common.migrations import run_migrations # Dùng chung schema với ứng dụng
 
 # --- Cấu hình Database ---
 DB_NAME = 'miniventory_sqlite.db' 
@@ -40,40 +41,9 @@ def ghi_log(thong_bao, filename="tao_db_mau_lon.log"):
 # --- Các hàm thao tác với Database SQLite ---
 
 def init_db():
-    """Khởi tạo cấu trúc (schema) cho database, tạo các bảng nếu chưa tồn tại."""
-    conn = sqlite3.connect(DB_NAME, detect_types=sqlite3.PARSE_DECLTYPES)
-    cursor = conn.cursor()
-    # Tạo bảng products với cột is_deleted
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS products (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        sku TEXT NOT NULL UNIQUE,
-        description TEXT,
-        unit_of_measure TEXT DEFAULT 'cái',
-        current_stock INTEGER DEFAULT 0,
-        price INTEGER DEFAULT 0,
-        is_deleted INTEGER DEFAULT 0, -- THÊM MỚI: Cột để hỗ trợ xóa mềm (0=active, 1=deleted)
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )''')
-    # Tạo bảng stock_transactions (không đổi)
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS stock_transactions (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        product_id INTEGER NOT NULL,
-        transaction_type TEXT NOT NULL,
-        quantity INTEGER NOT NULL,
-        unit_price INTEGER DEFAULT 0,
-        total_amount INTEGER DEFAULT 0,
-        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        notes TEXT,
-        user TEXT,
-        FOREIGN KEY (product_id) REFERENCES products (id)
-    )''')
-    conn.commit()
-    conn.close()
-    print(f"Khởi tạo/kiểm tra database SQLite '{DB_NAME}' thành công.")
+    """Khởi tạo cấu trúc (schema) cho database bằng hệ thống migration của ứng dụng."""
+    applied = run_migrations(DB_NAME)
+    print(f"Khởi tạo/kiểm tra database SQLite '{DB_NAME}' thành công ({len(applied)} migration được áp dụng).")
     ghi_log(f"Database '{DB_NAME}' đã được khởi tạo/kiểm tra schema.")
 
 def db_add_product_and_initial_transaction(conn, name, sku, description, unit_of_measure, current_stock=0, price=0):
@@ -0,0 +1,158 @@
+# /test.py
+# Kiểm thử ghi tồn kho đồng thời: nhiều luồng / nhiều tiến trình cùng nhập, xuất kho một sản phẩm
+# trên một DB tạm, vừa gọi thẳng `db_add_stock_transaction`, vừa qua hàng đợi group commit
+# (`StockWriteQueue.submit` -> `db_add_stock_movements_grouped`, đường ghi của /stock/in, /stock/out).
+# Tồn kho cuối cùng phải bằng tồn kho ban đầu cộng tổng các giao dịch thành công, số dòng giao dịch
+# phải khớp và tồn kho không bao giờ bị âm.
+# Chạy: python -m unittest test  (hoặc python -m pytest -q test.py)
+
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import threading
+import unittest
+
+from src.backend.common import database_base
+from src.backend.common.migrations import run_migrations
+from src.backend.transaction import database as db_transaction
+from src.backend.transaction.write_queue import StockWriteQueue
+
+TON_KHO_BAN_DAU = 20
+SO_LUONG_TOI_DA = 5
+SO_LUONG_LUONG = 8
+SO_LUONG_TIEN_TRINH = 4
+SO_GIAO_DICH_MOI_WORKER = 150
+# Thời gian gom (giây) của hàng đợi group commit trong kiểm thử (> 0 để đi qua đường ghi gộp).
+CUA_SO_GOM = 0.005
+
+def _ghi_ngau_nhien(product_id, seed, ghi=db_transaction.db_add_stock_transaction):
+    """
+    Ghi ngẫu nhiên các giao dịch IN/OUT bằng hàm `ghi` (cùng chữ ký với `db_add_stock_transaction`);
+    trả về list thay đổi tồn kho của các giao dịch thành công.
+    """
+    rng = random.Random(seed)
+    deltas = []
+    for _ in range(SO_GIAO_DICH_MOI_WORKER):
+        # Xuất nhiều hơn nhập một chút để tồn kho thường xuyên chạm đáy.
+        transaction_type = 'OUT' if rng.random() < 0.55 else 'IN'
+        quantity = rng.randint(1, SO_LUONG_TOI_DA)
+        success, message = ghi(product_id, transaction_type, str(quantity), '1000', user=f"stress-{seed}")
+        if success:
+            deltas.append(quantity if transaction_type == 'IN' else -quantity)
+        elif 'Không đủ' not in message:
+            raise AssertionError(message)
+    return deltas
+
+def _ghi_qua_hang_doi(product_id, seed):
+    """
+    Nhiều luồng cùng ghi ngẫu nhiên qua một hàng đợi group commit.
+
+    Returns:
+        tuple: (list_thay_đổi_tồn_kho, số_giao_dịch_lớn_nhất_trong_một_nhóm)
+    """
+    write_queue = StockWriteQueue(window=CUA_SO_GOM)
+    results = [None] * SO_LUONG_LUONG
+    errors = []
+
+    def worker(index):
+        try:
+            results[index] = _ghi_ngau_nhien(product_id, seed * 100 + index, write_queue.submit)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(SO_LUONG_LUONG)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    write_queue.shutdown()
+    if errors:
+        raise errors[0]
+    return [delta for deltas in results for delta in deltas], write_queue.stats()['largest_batch']
+
+def _tien_trinh_ghi(args):
+    """Hàm chạy trong tiến trình con: dùng pool kết nối riêng rồi ghi ngẫu nhiên."""
+    database_base.reset_connection_pool()
+    return _ghi_ngau_nhien(*args)
+
+def _tien_trinh_ghi_qua_hang_doi(args):
+    """Như `_tien_trinh_ghi` nhưng ghi qua hàng đợi group commit của tiến trình con."""
+    database_base.reset_connection_pool()
+    return _ghi_qua_hang_doi(*args)
+
+class StockConcurrencyTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='miniventory-test-')
+        self.old_db_name = database_base.connection_pool.db_name
+        db_name = os.path.join(self.temp_dir, 'stress.db')
+        run_migrations(db_name)
+        database_base.connection_pool.close_all()
+        database_base.connection_pool.db_name = db_name
+        with database_base.borrow_db_connection() as conn:
+            cursor = conn.execute("INSERT INTO products (name, sku, current_stock, price) VALUES (?, ?, ?, ?)",
+                                  ('Sản phẩm kiểm thử', 'STRESS-1', TON_KHO_BAN_DAU, 1000))
+            self.product_id = cursor.lastrowid
+            conn.commit()
+
+    def tearDown(self):
+        database_base.connection_pool.close_all()
+        database_base.connection_pool.db_name = self.old_db_name
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _kiem_tra_ket_qua(self, deltas):
+        with database_base.borrow_db_connection() as conn:
+            current_stock = conn.execute("SELECT current_stock FROM products WHERE id = ?", (self.product_id,)).fetchone()[0]
+            rows = conn.execute("SELECT transaction_type, quantity FROM stock_transactions WHERE product_id = ? ORDER BY id",
+                                (self.product_id,)).fetchall()
+        self.assertEqual(current_stock, TON_KHO_BAN_DAU + sum(deltas))
+        self.assertEqual(len(rows), len(deltas))
+        # id tăng theo thứ tự commit (khóa ghi của SQLite), nên cộng dồn theo id là lịch sử tồn kho thực tế.
+        stock = TON_KHO_BAN_DAU
+        for row in rows:
+            stock += row['quantity'] if row['transaction_type'] == 'IN' else -row['quantity']
+            self.assertGreaterEqual(stock, 0)
+        # Bài kiểm thử chỉ có ý nghĩa khi có cả nhập lẫn xuất thành công.
+        self.assertTrue(any(d > 0 for d in deltas) and any(d < 0 for d in deltas))
+
+    def test_nhieu_luong_ghi_dong_thoi(self):
+        results = [None] * SO_LUONG_LUONG
+        errors = []
+
+        def worker(index):
+            try:
+                results[index] = _ghi_ngau_nhien(self.product_id, index)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(SO_LUONG_LUONG)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self._kiem_tra_ket_qua([delta for deltas in results for delta in deltas])
+
+    @unittest.skipUnless('fork' in multiprocessing.get_all_start_methods(), "Cần start method 'fork'.")
+    def test_nhieu_tien_trinh_ghi_dong_thoi(self):
+        database_base.connection_pool.close_all()
+        with multiprocessing.get_context('fork').Pool(SO_LUONG_TIEN_TRINH) as pool:
+            results = pool.map(_tien_trinh_ghi, [(self.product_id, 100 + i) for i in range(SO_LUONG_TIEN_TRINH)])
+        self._kiem_tra_ket_qua([delta for deltas in results for delta in deltas])
+
+    def test_nhieu_luong_ghi_qua_hang_doi(self):
+        deltas, largest_batch = _ghi_qua_hang_doi(self.product_id, 1)
+        # Các giao dịch phải thực sự được gom thành nhóm (nhiều dòng trong một transaction).
+        self.assertGreater(largest_batch, 1)
+        self._kiem_tra_ket_qua(deltas)
+
+    @unittest.skipUnless('fork' in multiprocessing.get_all_start_methods(), "Cần start method 'fork'.")
+    def test_nhieu_tien_trinh_ghi_qua_hang_doi(self):
+        database_base.connection_pool.close_all()
+        with multiprocessing.get_context('fork').Pool(SO_LUONG_TIEN_TRINH) as pool:
+            results = pool.map(_tien_trinh_ghi_qua_hang_doi, [(self.product_id, 10 + i) for i in range(SO_LUONG_TIEN_TRINH)])
+        self._kiem_tra_ket_qua([delta for deltas, _ in results for delta in deltas])
+
+if __name__ == '__main__':
+    unittest.main()